@@ -0,0 +1,14 @@
+# python -m neuri               Settings window, then the GUI
+# python -m neuri --headless    Acquisition without any GUI toolkit (see
+#                               headless.py)
+# --profile-startup             Print how long the imports and the setup of
+#                               every phase took (see startup_profile.py)
+from .startup_profile                           import profile # Starts the clock
+import sys
+
+if "--headless" in sys.argv[1:]:
+    from .headless                              import main
+    sys.exit(main())
+else:
+    from .gui                                   import Run
+    Run()
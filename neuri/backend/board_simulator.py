@@ -0,0 +1,258 @@
+from numpy import (arange, pi, sin, round as np_round, where, int64,
+                   frombuffer, uint8)
+from numpy.random                       import default_rng
+from threading                          import Thread, Event
+from time                               import perf_counter, sleep
+from json                               import dumps
+import argparse
+import select
+import tty
+import os
+
+from .wire_protocol                     import encode_frames
+
+
+# Boards as named in Parameters.board_characteristics. The EXG Pill streams
+# a single value per line as soon as the port is opened, the Neuri boards
+# wait for a start code:
+#   2   Stream one message per sample (USB)
+#   3   Stream bursts of BURST_SIZE messages (Bluetooth)
+#   0   Standby
+NEURI_BOARD         = "Neuri V1 by Helment"
+EXG_PILL            = "BioAmp EXG Pill by Upside Down Labs"
+BURST_SIZE          = 10
+LISTENING_INTERVAL  = 1 # Seconds between two "Listening ..." messages
+
+
+def voltage_to_counts(voltage, pga):
+    # =====================================================================
+    # Inverse of Sampling.bin_to_voltage() for the Neuri boards
+    # Input:
+    #   voltage             Numpy array (microvolts)
+    #   pga                 Scalar (gain of the amplifier)
+    # Output:
+    #   counts              Numpy array (int64), unsigned 24-bit counts
+    # =====================================================================
+    counts              = np_round(voltage / 1000000 * pga * 8388607.0 / 4.5).astype(int64)
+    counts              = counts.clip(-8388606, 8388607)
+    return where(counts < 0, counts + 2*8388607 + 1, counts)
+
+
+def neuri_messages(counts, lost=None):
+    # =====================================================================
+    # Input:
+    #   counts              2D numpy array [channels x samples] of raw
+    #                       unsigned 24-bit counts
+    #   lost                1D boolean numpy array [samples] or None.
+    #                       Messages of lost samples are cut off halfway
+    # Output:
+    #   messages            List of bytes, one JSON message per sample
+    #                       without line ending, as sent by the boards
+    # =====================================================================
+    keys                = ["c{}".format(iC + 1) for iC in range(counts.shape[0])]
+    messages            = []
+    for iS, sample in enumerate(counts.T.tolist()):
+        message         = dumps(dict(zip(keys, sample)))
+        if lost is not None and lost[iS]:
+            message     = message[:len(message) // 2]
+        messages.append(message.encode())
+    return messages
+
+
+def exg_pill_messages(voltage):
+    # =====================================================================
+    # Input:
+    #   voltage             1D numpy array (microvolts)
+    # Output:
+    #   messages            List of bytes, one value per sample
+    # =====================================================================
+    return ['{:.4f}'.format(v).encode() for v in voltage.tolist()]
+
+
+def join_lines(messages):
+    return b''.join(m + b'\r\n' for m in messages)
+
+
+class BoardSimulator(Thread):
+
+    def __init__(self, board=NEURI_BOARD, num_chans=8, sample_rate=200,
+                 pga=24, amplitude=50, noise=5, drop_rate=0,
+                 wire_format='json', seed=None):
+        # =================================================================
+        # Virtual board on a pseudo-terminal, for runs without hardware.
+        # The program under test opens the slave side of the pty (port)
+        # like a serial port, the simulator answers the start codes on
+        # the master side and streams synthetic data in real time. Every
+        # channel carries a sine wave (5 Hz + 2 Hz per channel) plus
+        # Gaussian noise. The speed of the pty is not limited by a baud
+        # rate, and bytes that the reader does not pick up in time are
+        # lost once the buffer of the pty is full (counted in overflows).
+        # Input
+        #   board           Key of Parameters.board_characteristics
+        #   num_chans       Scalar (1 for the EXG Pill)
+        #   sample_rate     Scalar (Hz)
+        #   pga             Scalar (gain the counts are scaled with)
+        #   amplitude       Scalar (microvolts of the sine waves)
+        #   noise           Scalar (standard deviation in microvolts)
+        #   drop_rate       Scalar (probability that a sample gets lost:
+        #                   corrupt JSON message, missing binary frame or
+        #                   missing line of the EXG Pill)
+        #   wire_format     'json' or 'binary' (frames of wire_protocol.py,
+        #                   Neuri boards only)
+        #   seed            Scalar or None (random generator)
+        # =================================================================
+        super(BoardSimulator, self).__init__(daemon=True)
+
+        self.board          = board
+        self.num_chans      = 1 if "EXG Pill" in board else int(num_chans)
+        self.sample_rate    = sample_rate
+        self.pga            = pga
+        self.amplitude      = amplitude
+        self.noise          = noise
+        self.drop_rate      = drop_rate
+        self.wire_format    = wire_format
+        self.rng            = default_rng(seed)
+        self.frequencies    = 5 + 2 * arange(self.num_chans)
+
+        # Streaming state, changed by the start codes
+        self.start_code     = 2 if "EXG Pill" in board else 0
+        self.stream_start   = perf_counter()
+        self.sample_index   = 0 # Samples generated in total
+        self.sent_since     = 0 # Samples generated since the last start code
+        self.last_listening = 0.0
+
+        # Counters
+        self.dropped        = 0
+        self.overflows      = 0 # Messages (partly) lost at a full pty
+
+        self.stop_event     = Event()
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port           = os.ttyname(self.slave)
+
+
+    def run(self):
+
+        while not self.stop_event.is_set():
+            readable, _, _  = select.select([self.master], [], [], 0.001)
+            if readable:
+                self.receive_codes()
+
+            if self.start_code == 0:
+                now         = perf_counter()
+                if now - self.last_listening >= LISTENING_INTERVAL:
+                    self.send(b'Listening ...\r\n')
+                    self.last_listening = now
+                continue
+
+            due             = int((perf_counter() - self.stream_start)
+                                  * self.sample_rate) - self.sent_since
+            if self.start_code == 3:
+                due         = due - due % BURST_SIZE
+            if due > 0:
+                self.stream(due)
+
+
+    def receive_codes(self):
+
+        try:
+            received        = os.read(self.master, 1024)
+        except (BlockingIOError, OSError):
+            return
+        for code in received.decode('utf-8', errors='ignore'):
+            if code not in '023' or int(code) == self.start_code:
+                continue
+            self.start_code = int(code)
+            self.stream_start = perf_counter()
+            self.sent_since = 0
+            print('Board simulator: start code {}'.format(code))
+
+
+    def generate(self, num_samples):
+        # =================================================================
+        # Output:
+        #   voltage             2D numpy array [channels x samples]
+        #                       (microvolts)
+        # =================================================================
+        t                   = (self.sample_index + arange(num_samples)) / self.sample_rate
+        voltage             = self.amplitude * sin(2 * pi * self.frequencies[:, None] * t)
+        voltage            += self.rng.normal(0, self.noise, voltage.shape)
+        self.sample_index  += num_samples
+        self.sent_since    += num_samples
+        return voltage
+
+
+    def stream(self, num_samples):
+
+        first_counter       = self.sample_index % 65536
+        voltage             = self.generate(num_samples)
+        lost                = self.rng.random(num_samples) < self.drop_rate
+        self.dropped       += int(lost.sum())
+
+        if "EXG Pill" in self.board:
+            self.send(join_lines(exg_pill_messages(voltage[0][~lost])))
+            return
+
+        counts              = voltage_to_counts(voltage, self.pga)
+        if self.wire_format == 'binary':
+            # Lost frames leave a gap in the sample counters
+            frames          = frombuffer(encode_frames(counts, first_counter),
+                dtype=uint8).reshape(num_samples, -1)
+            self.send(frames[~lost].tobytes())
+            return
+
+        self.send(join_lines(neuri_messages(counts, lost)))
+
+
+    def send(self, data):
+
+        try:
+            written         = os.write(self.master, data)
+        except (BlockingIOError, OSError):
+            written         = 0
+        if written < len(data):
+            self.overflows += 1
+
+
+    def stop(self):
+
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+if __name__ == "__main__":
+    # python -m neuri.backend.board_simulator --chans 8 --rate 200
+    # Then enter the printed port as "Port" in settings.cfg
+    parser              = argparse.ArgumentParser(
+        description="Virtual board on a pseudo-terminal")
+    parser.add_argument("--board", default=NEURI_BOARD)
+    parser.add_argument("--chans", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=200)
+    parser.add_argument("--pga", type=int, default=24)
+    parser.add_argument("--amplitude", type=float, default=50)
+    parser.add_argument("--noise", type=float, default=5)
+    parser.add_argument("--drop-rate", type=float, default=0)
+    parser.add_argument("--wire-format", choices=['json', 'binary'],
+                        default='json')
+    args                = parser.parse_args()
+
+    simulator           = BoardSimulator(args.board, args.chans, args.rate,
+        args.pga, args.amplitude, args.noise, args.drop_rate,
+        args.wire_format)
+    simulator.start()
+    print('Board simulator ({}, {} channels, {} Hz) at {}'.format(
+        simulator.board, simulator.num_chans, simulator.sample_rate,
+        simulator.port))
+    try:
+        while True:
+            sleep(LISTENING_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        print('{} samples sent, {} dropped, {} lost at a full port'.format(
+            simulator.sample_index, simulator.dropped, simulator.overflows))
@@ -0,0 +1,333 @@
+from numpy import (frombuffer, concatenate, cumsum, diff, rint, asarray,
+                   empty, zeros, full, where, int32, int64, uint8, array,
+                   searchsorted)
+from struct                             import Struct
+import zlib
+import lzma
+import os
+
+
+# Compressed session format (".nchk"), all values little endian:
+#   header              HEADER_SIZE bytes, see HEADER below (magic,
+#                       version, header size, amount of channels, codec,
+#                       sampling rate, PGA, divisor, board name), since
+#                       version 3 followed by the divisor of every channel
+#                       (float64 [channels], channels of merged devices
+#                       keep the scaling of their board)
+#   chunks              Fixed-duration chunks, each one a CHUNK header
+#                       (first and last timestamp in microseconds, amount
+#                       of samples, compressed size, crc32) followed by
+#                       the compressed payload: delta-encoded int64
+#                       timestamps [samples], delta-encoded int32 raw
+#                       counts [channels x samples], and since version 2
+#                       uint8 quality flags [samples] (1 for samples
+#                       filled in by GapFiller)
+#   index               One INDEX_ENTRY per chunk (first and last
+#                       timestamp, byte offset of the chunk, amount of
+#                       samples), written when the session is closed
+#   trailer             TRAILER: byte offset of the index, amount of
+#                       chunks, magic
+# Values are stored as the raw counts of the board, so that microvolts
+# are restored exactly like Sampling.bin_to_voltage_block() computes them
+# (divisor = 0 for boards that send values directly).
+MAGIC               = b'NEURICHK'
+INDEX_MAGIC         = b'NEURIIDX'
+VERSION             = 3
+HEADER              = Struct('<8sHHHB3xddd128s')
+HEADER_SIZE         = 256
+CHUNK               = Struct('<qqIII')
+INDEX_ENTRY         = Struct('<qqqq')
+TRAILER             = Struct('<qI8s')
+CODECS              = {'zlib': 0, 'lzma': 1}
+
+
+def compress(payload, codec):
+    if codec == CODECS['lzma']:
+        return lzma.compress(payload, preset=1)
+    return zlib.compress(payload, 6)
+
+
+def decompress(payload, codec):
+    if codec == CODECS['lzma']:
+        return lzma.decompress(payload)
+    return zlib.decompress(payload)
+
+
+class ChunkedRecording():
+
+    extension           = '.nchk'
+
+    def __init__(self, file_name, num_chans, sample_rate, pga, board,
+                 divisors, chunk_duration=10, compression='zlib'):
+        # =================================================================
+        # Recording that compresses fixed-duration chunks and keeps an
+        # index of them, so that time windows can be read without
+        # decoding the whole session (see ChunkedRecordingReader). It is
+        # meant to be driven by the DataWriter thread, so compression does
+        # not run in the sampling loop.
+        # Input
+        #   file_name       Character string
+        #   num_chans       Scalar
+        #   sample_rate     Scalar (Hz)
+        #   pga             Scalar
+        #   board           Character string
+        #   divisors        List [num_chans] of Sampling.voltage_divisor()
+        #                   of the board each channel comes from
+        #   chunk_duration  Scalar (seconds per chunk)
+        #   compression     'zlib' (fast) or 'lzma' (smaller)
+        # =================================================================
+        self.file_name      = file_name
+        self.num_chans      = int(num_chans)
+        self.sample_rate    = sample_rate
+        self.pga            = pga
+        self.board          = board
+        if len(divisors) != self.num_chans:
+            raise ValueError('{} divisors for {} channels'.format(
+                len(divisors), self.num_chans))
+        self.divisors       = array([0.0 if divisor is None else float(divisor)
+                                     for divisor in divisors])
+        self.chunk_samples  = max(int(chunk_duration * sample_rate), 1)
+        self.codec          = CODECS[compression]
+        self.file           = None
+        self.index          = []
+        self.pending_data   = []
+        self.pending_times  = []
+        self.pending_quality= []
+        self.pending_count  = 0
+
+
+    def create(self):
+        header              = HEADER.pack(MAGIC, VERSION,
+            HEADER_SIZE + self.divisors.nbytes, self.num_chans, self.codec,
+            float(self.sample_rate), float(self.pga), self.divisors[0],
+            self.board.encode('utf-8')[:128])
+        with open(self.file_name, 'wb') as file:
+            file.write(header.ljust(HEADER_SIZE, b'\x00'))
+            file.write(self.divisors.astype('<f8').tobytes())
+
+
+    def open(self):
+        # A closed session ends with its index, which is removed again
+        # while chunks are appended
+        self.file           = open(self.file_name, 'r+b')
+        self.index, index_offset = read_index(self.file)
+        self.file.seek(index_offset)
+        self.file.truncate()
+
+
+    def to_counts(self, eeg_data):
+        divisors            = self.divisors[:, None]
+        eeg_data            = asarray(eeg_data)
+        return rint(where(divisors == 0, eeg_data,
+                          eeg_data / 1000000 * divisors / 4.5)).astype(int32)
+
+
+    def write_block(self, eeg_data, time_stamps, quality=None):
+        # =================================================================
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples] (float)
+        #   time_stamps         1D numpy array (ms)
+        #   quality             1D numpy array (uint8), optional
+        # Output:
+        #   num_bytes           Scalar (amount of bytes written, 0 until a
+        #                       chunk is complete)
+        # =================================================================
+        self.pending_data.append(self.to_counts(eeg_data))
+        self.pending_times.append(rint(asarray(time_stamps) * 1000).astype(int64))
+        if quality is None:
+            quality         = zeros(len(time_stamps), dtype=uint8)
+        self.pending_quality.append(asarray(quality, dtype=uint8))
+        self.pending_count += len(time_stamps)
+
+        num_bytes           = 0
+        while self.pending_count >= self.chunk_samples:
+            num_bytes      += self.write_chunk(self.chunk_samples)
+        return num_bytes
+
+
+    def write_chunk(self, num_samples):
+
+        counts              = concatenate(self.pending_data, axis=1)
+        time_stamps         = concatenate(self.pending_times)
+        quality             = concatenate(self.pending_quality)
+        self.pending_data   = [counts[:, num_samples:]]
+        self.pending_times  = [time_stamps[num_samples:]]
+        self.pending_quality= [quality[num_samples:]]
+        self.pending_count -= num_samples
+        counts              = counts[:, :num_samples]
+        time_stamps         = time_stamps[:num_samples]
+        quality             = quality[:num_samples]
+
+        # Neighbouring samples are close to each other, so their
+        # differences compress much better than the values themselves
+        payload             = compress(
+            diff(time_stamps, prepend=int64(0)).tobytes() +
+            diff(counts, axis=1, prepend=int32(0)).astype(int32).tobytes() +
+            quality.tobytes(),
+            self.codec)
+
+        offset              = self.file.tell()
+        self.file.write(CHUNK.pack(int(time_stamps[0]), int(time_stamps[-1]),
+            num_samples, len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.index.append((int(time_stamps[0]), int(time_stamps[-1]),
+            offset, num_samples))
+        return CHUNK.size + len(payload)
+
+
+    def flush(self, sync=False):
+        # Only complete chunks are on disk, the last chunk_duration seconds
+        # are compressed once the chunk is full (or the session closed)
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+
+    def close(self):
+        if self.pending_count > 0:
+            self.write_chunk(self.pending_count)
+
+        index_offset        = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(TRAILER.pack(index_offset, len(self.index), INDEX_MAGIC))
+        self.file.close()
+        self.file           = None
+
+
+def read_header(file):
+    file.seek(0)
+    (magic, version, header_size, num_chans, codec, sample_rate, pga,
+     divisor, board)    = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a Neuri chunked recording')
+
+    if version >= 3:
+        file.seek(HEADER_SIZE)
+        divisors        = frombuffer(file.read(8 * num_chans), dtype='<f8')
+    else:
+        divisors        = full(num_chans, divisor)
+
+    return {"version":          version,
+            "header_size":      header_size,
+            "num_chans":        num_chans,
+            "codec":            codec,
+            "sample_rate":      sample_rate,
+            "pga":              pga,
+            "divisors":         divisors,
+            "board":            board.rstrip(b'\x00').decode('utf-8')}
+
+
+def read_index(file):
+    # =====================================================================
+    # Output:
+    #   index               List of (first timestamp, last timestamp,
+    #                       offset, amount of samples) per chunk
+    #   end                 Scalar (offset where the chunks end)
+    # =====================================================================
+    header              = read_header(file)
+    file_size           = file.seek(0, os.SEEK_END)
+
+    if file_size >= header["header_size"] + TRAILER.size:
+        file.seek(file_size - TRAILER.size)
+        index_offset, num_chunks, magic = TRAILER.unpack(file.read(TRAILER.size))
+        if magic == INDEX_MAGIC:
+            file.seek(index_offset)
+            index       = [INDEX_ENTRY.unpack(file.read(INDEX_ENTRY.size))
+                           for _ in range(num_chunks)]
+            return index, index_offset
+
+    # No index: the recording stopped unexpectedly. Rebuild the index
+    # from the chunk headers and drop an incomplete last chunk
+    index               = []
+    offset              = header["header_size"]
+    while offset + CHUNK.size <= file_size:
+        file.seek(offset)
+        first, last, num_samples, length, crc = CHUNK.unpack(file.read(CHUNK.size))
+        payload         = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        index.append((first, last, offset, num_samples))
+        offset         += CHUNK.size + length
+    return index, offset
+
+
+class ChunkedRecordingReader():
+
+    def __init__(self, file_name):
+        # =================================================================
+        # Random access to a chunked recording through its index
+        # =================================================================
+        self.file_name      = file_name
+        with open(file_name, 'rb') as file:
+            self.header     = read_header(file)
+            self.index, _   = read_index(file)
+        self.first_times    = array([entry[0] for entry in self.index], dtype=int64)
+        self.last_times     = array([entry[1] for entry in self.index], dtype=int64)
+
+
+    def read(self, t_start=None, t_end=None, quality=False):
+        # =================================================================
+        # Decodes only the chunks that overlap the requested window
+        # Input:
+        #   t_start, t_end      Scalars (ms), None for the session bounds
+        #   quality             Boolean, also return the quality flags
+        # Output:
+        #   eeg_data            2D numpy array [channels x samples] (uV)
+        #   time_stamps         1D numpy array (ms)
+        #   flags               1D numpy array (uint8), if quality
+        # =================================================================
+        t_start_us          = -2**62 if t_start is None else int(rint(t_start * 1000))
+        t_end_us            = 2**62 if t_end is None else int(rint(t_end * 1000))
+
+        first_chunk         = searchsorted(self.last_times, t_start_us, side='left')
+        last_chunk          = searchsorted(self.first_times, t_end_us, side='right')
+
+        counts, time_stamps, flags = [], [], []
+        with open(self.file_name, 'rb') as file:
+            for entry in self.index[first_chunk:last_chunk]:
+                chunk_counts, chunk_times, chunk_flags = self.read_chunk(file, entry)
+                counts.append(chunk_counts)
+                time_stamps.append(chunk_times)
+                flags.append(chunk_flags)
+
+        num_chans           = self.header["num_chans"]
+        if len(time_stamps) == 0:
+            if quality:
+                return empty((num_chans, 0)), empty(0), empty(0, dtype=uint8)
+            return empty((num_chans, 0)), empty(0)
+
+        counts              = concatenate(counts, axis=1)
+        time_stamps         = concatenate(time_stamps)
+        keep                = (time_stamps >= t_start_us) & (time_stamps <= t_end_us)
+
+        if quality:
+            return (self.to_voltage(counts[:, keep]), time_stamps[keep] / 1000,
+                    concatenate(flags)[keep])
+        return self.to_voltage(counts[:, keep]), time_stamps[keep] / 1000
+
+
+    def read_chunk(self, file, entry):
+        _, _, offset, num_samples = entry
+        file.seek(offset)
+        _, _, _, length, _  = CHUNK.unpack(file.read(CHUNK.size))
+        payload             = decompress(file.read(length), self.header["codec"])
+
+        num_chans           = self.header["num_chans"]
+        time_stamps         = cumsum(frombuffer(payload, dtype=int64, count=num_samples))
+        counts              = frombuffer(payload, dtype=int32, offset=8 * num_samples,
+            count=num_chans * num_samples).reshape(num_chans, num_samples)
+        if self.header["version"] >= 2:
+            flags           = frombuffer(payload, dtype=uint8,
+                offset=(8 + 4 * num_chans) * num_samples, count=num_samples)
+        else:
+            flags           = zeros(num_samples, dtype=uint8)
+        return cumsum(counts, axis=1, dtype=int32), time_stamps, flags
+
+
+    def to_voltage(self, counts):
+        # Same operations as Sampling.bin_to_voltage_block(), channel by
+        # channel
+        divisors            = self.header["divisors"][:, None]
+        voltage             = (4.5*counts.astype(int64))/where(divisors == 0, 1, divisors) * 1000000
+        return where(divisors == 0, counts.astype(float), voltage)
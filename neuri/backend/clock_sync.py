@@ -0,0 +1,265 @@
+from numpy import arange, maximum, empty, concatenate
+from math                               import exp, sqrt
+from collections                        import deque
+
+
+LOSS_WINDOW         = 0.5 # Seconds the text protocol is held back for
+                          # LossDetector
+
+
+class SampleClock():
+
+    def __init__(self, sample_rate, time_constant=60, min_span=1):
+        # =================================================================
+        # Timestamps derived from the running sample index instead of the
+        # arrival time of each message. The host time of the samples is
+        # estimated by an exponentially weighted linear fit of
+        #   arrival time = offset + index * period
+        # over the last time_constant seconds, which is updated with every
+        # batch in O(1). Samples of one message thereby get evenly spaced
+        # timestamps, and the fit follows the drift between the clock of
+        # the board and the one of the host.
+        # Input
+        #   sample_rate     Scalar (nominal sampling rate, Hz)
+        #   time_constant   Scalar (seconds of history of the fit)
+        #   min_span        Scalar (seconds of data before the fitted rate
+        #                   replaces the nominal one)
+        # =================================================================
+        self.nominal_period = 1000 / sample_rate # ms
+        self.time_constant  = time_constant * sample_rate # Samples
+        self.min_span       = min_span * sample_rate # Samples
+
+        self.sample_index   = 0    # Index of the next sample
+        self.last_index     = -1
+        self.num_updates    = 0
+
+        # Exponentially weighted means and (co)variances of the index and
+        # the arrival time (ms) of the last sample of each batch
+        self.mean_index     = 0.0
+        self.mean_time      = 0.0
+        self.var_index      = 0.0
+        self.cov            = 0.0
+        self.residual_sq    = 0.0
+
+        self.period         = self.nominal_period
+        self.offset         = 0.0
+        self.last_time      = None
+
+
+    def update(self, index, arrival_time):
+        # =================================================================
+        # Input:
+        #   index               Scalar (index of the last sample received)
+        #   arrival_time        Scalar (host time, ms)
+        # Output:
+        #   No output
+        # =================================================================
+        if self.num_updates == 0:
+            self.mean_index = float(index)
+            self.mean_time  = float(arrival_time)
+            self.offset     = arrival_time - index * self.period
+            self.num_updates= 1
+            return
+
+        # Weight of the new batch: running average at first, then the
+        # exponential window
+        num_new             = index - self.last_index
+        weight              = max(1 - exp(-num_new / self.time_constant),
+                                  num_new / max(index, 1))
+        residual            = arrival_time - (self.offset + index * self.period)
+        self.residual_sq   += weight * (residual * residual - self.residual_sq)
+
+        d_index             = index - self.mean_index
+        d_time              = arrival_time - self.mean_time
+        self.mean_index    += weight * d_index
+        self.mean_time     += weight * d_time
+        self.var_index      = (1 - weight) * (self.var_index + weight * d_index * d_index)
+        self.cov            = (1 - weight) * (self.cov + weight * d_index * d_time)
+        self.num_updates   += 1
+
+        # Fall back to the nominal rate until the fit has seen enough data,
+        # or when it deviates implausibly (e.g. after a long stall)
+        period              = self.nominal_period
+        if index >= self.min_span and self.var_index > 0:
+            fitted          = self.cov / self.var_index
+            if abs(fitted / self.nominal_period - 1) < 0.05:
+                period      = fitted
+        self.period         = period
+        self.offset         = self.mean_time - self.mean_index * self.period
+
+
+    def stamp(self, num_samples, arrival_time):
+        # =================================================================
+        # Input:
+        #   num_samples         Scalar (samples that just arrived)
+        #   arrival_time        Scalar (host time, ms)
+        # Output:
+        #   time_stamps         1D numpy array [num_samples] (ms, float),
+        #                       monotonic
+        # =================================================================
+        first               = self.sample_index
+        last                = first + num_samples - 1
+        self.update(last, arrival_time)
+        self.last_index     = last
+        self.sample_index   = last + 1
+
+        time_stamps         = self.offset + arange(first, last + 1) * self.period
+        if self.last_time is not None:
+            # Corrections of the fit must not move time backwards
+            time_stamps     = maximum(time_stamps,
+                self.last_time + (arange(num_samples) + 1) * self.period / 2)
+        self.last_time      = time_stamps[-1]
+        return time_stamps
+
+
+    def jitter(self):
+        # Root mean square deviation of the arrival times from the fit (ms)
+        return sqrt(self.residual_sq)
+
+
+    def drift(self):
+        # Deviation of the measured from the nominal sampling rate (ppm)
+        return (self.nominal_period / self.period - 1) * 1000000
+
+
+    def rate(self):
+        # Measured sampling rate (Hz)
+        return 1000 / self.period
+
+
+class LossDetector():
+
+    def __init__(self, clock, num_chans, window=LOSS_WINDOW):
+        # =================================================================
+        # Samples lost without a trace, i.e. messages of the text protocol
+        # that never arrived, detected from their timing: from the lost
+        # message on, every sample arrives one period later than its index
+        # predicts. The earliest arrivals of the batches before and after
+        # each batch are compared, single late batches only being delayed
+        # (the next ones catch up). Batches are held back for window
+        # seconds, so that the lost samples are put in right where the
+        # step shows and the samples after them keep their timestamps.
+        # Input
+        #   clock           SampleClock of the stream (fitted period)
+        #   num_chans       Scalar
+        #   window          Scalar (seconds of batches compared on each
+        #                   side, and delay of the stream)
+        # =================================================================
+        self.clock          = clock
+        self.num_chans      = int(num_chans)
+        self.window         = window * 1000 / clock.nominal_period # Samples
+        self.pending        = deque() # [samples, missing_before, last
+                                      # index, arrival time] held back
+        self.released       = deque() # (last index, arrival time) of the
+                                      # batches of the last window
+        self.next_index     = 0
+        self.carry          = 0    # Lost samples after the last batch
+        self.spread         = clock.nominal_period / 2 # Usual deviation
+                                   # between the earliest arrivals (ms)
+
+
+    def push(self, samples, missing_before, missing_after, arrival_time):
+        # =================================================================
+        # Input:
+        #   samples             2D numpy array [channels x samples] that
+        #                       arrived in one batch
+        #   missing_before      List [samples] (messages that could not be
+        #                       read directly before each sample)
+        #   missing_after       Scalar (unreadable messages after the last
+        #                       sample)
+        #   arrival_time        Scalar (host time, ms)
+        # Output:
+        #   samples             2D numpy array of the batches released
+        #                       (no samples while they are held back)
+        #   missing_before      List, those detected here included
+        #   arrival_time        Scalar (arrival of the last batch released,
+        #                       None if none)
+        # =================================================================
+        if samples.shape[1] == 0:
+            self.carry     += sum(missing_before) + missing_after
+            return self.release(0)
+
+        missing_before      = list(missing_before)
+        missing_before[0]  += self.carry
+        self.carry          = missing_after
+        self.next_index    += samples.shape[1] + sum(missing_before)
+        self.pending.append([samples, missing_before, self.next_index - 1,
+                             arrival_time])
+
+        num_released        = 0
+        while self.pending[-1][2] - self.pending[num_released][2] >= self.window:
+            self.locate(num_released)
+            num_released   += 1
+        return self.release(num_released)
+
+
+    def lateness(self, last_index, arrival_time):
+        # Arrival time against the fitted period, offset left out
+        return arrival_time - last_index * self.clock.period
+
+
+    def locate(self, first):
+        # =================================================================
+        # Compares the earliest arrival of the pending batches from
+        # pending[first] on with the one of the batches before it. When
+        # the later ones arrive at least a period later, the lost samples
+        # are put in before the first batch from which on all of them are
+        # late by that much
+        # =================================================================
+        clock               = self.clock
+        if clock.last_index < clock.min_span:
+            return # Period not fitted yet
+        pending             = list(self.pending)
+        before              = [self.lateness(index, time)
+                               for index, time in self.released]
+        before             += [self.lateness(batch[2], batch[3])
+                               for batch in pending[:first]]
+        after               = [self.lateness(batch[2], batch[3])
+                               for batch in pending[first:]]
+        if len(before) == 0:
+            return
+
+        step                = min(after) - min(before)
+        if step <= clock.period / 2 + 3 * self.spread:
+            self.spread    += 0.05 * (abs(step) - self.spread)
+            return
+
+        # Size of the step: largest difference between the batches before
+        # and after any of the pending ones that still have half a window
+        # after them. Batches just before the loss may have been late as
+        # well, which only shifts the first batch late by the full step
+        num_after           = len(after)
+        while (num_after > 1 and
+               pending[-1][2] - pending[first + num_after - 1][2] < self.window / 2):
+            num_after      -= 1
+        earliest_after      = [min(after[iB:]) for iB in range(num_after)]
+        step                = max(earliest_after[iB] - min(before + after[:iB])
+                                  for iB in range(num_after))
+        num_missing         = int(round(step / clock.period))
+        if num_missing < 1:
+            return
+
+        location            = 0
+        while (location < num_after - 1 and earliest_after[location] - min(before) <=
+               (num_missing - 0.5) * clock.period):
+            location       += 1
+
+        pending[first + location][1][0] += num_missing
+        for batch in pending[first + location:]:
+            batch[2]       += num_missing
+        self.next_index    += num_missing
+
+
+    def release(self, num_batches):
+
+        batches             = [self.pending.popleft() for _ in range(num_batches)]
+        for _, _, last_index, arrival_time in batches:
+            self.released.append((last_index, arrival_time))
+        while self.released and self.released[-1][0] - self.released[0][0] > self.window:
+            self.released.popleft()
+
+        if num_batches == 0:
+            return empty((self.num_chans, 0)), [], None
+        return (concatenate([batch[0] for batch in batches], axis=1),
+                sum([batch[1] for batch in batches], []),
+                batches[-1][3])
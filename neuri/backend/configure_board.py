@@ -4,9 +4,12 @@ import time
 
 class ConfigureBoard:
 
-    def __init__(self, parameter):
-        
+    def __init__(self, parameter, port=None, baud_rate=None):
+        # Port and baud rate default to the ones of the settings, other
+        # values are used for additional devices (see stream_merger.py)
         self.pm             = parameter
+        self.port           = parameter.port if port is None else port
+        self.baud_rate      = parameter.baud_rate if baud_rate is None else baud_rate
         self.define_connection()
 
     
@@ -25,7 +28,7 @@ class ConfigureBoard:
 
         # Open communication protocol
         self.ser            = serial.Serial()
-        self.ser.baudrate   = self.pm.baud_rate
+        self.ser.baudrate   = self.baud_rate
         self.ser.timeout    = self.pm.time_out
-        self.ser.port       = self.pm.port
+        self.ser.port       = self.port
         print('Ready to connect to board')
\ No newline at end of file
@@ -0,0 +1,75 @@
+from json                               import loads, dumps
+import socket
+
+
+# Control channel of the display filter: clients send one JSON object per
+# UDP datagram to ControlAddress ("host:port"), e.g.
+#   {"notch": 50, "band": [8, 12], "order": 4}
+# All keys are optional and keep their current value when left out:
+#   notch               Hz of the stopband centre, 0 switches it off
+#   band                [low, high] in Hz, [low, null] for a highpass,
+#                       [null, high] for a lowpass, the name of one of the
+#                       frequency bands of the settings ("Alpha", "Sigma",
+#                       ...), or null for the raw signal
+#   order               Order of the Butterworth filters
+# Once the display uses the new filter, the sender gets the whole setting
+# back ({"notch": 50.0, "band": [8.0, 12.0], "order": 4}), or {"error":
+# "..."} if it could not be used.
+MAX_COMMAND         = 4096 # Bytes, larger datagrams are cut off
+
+
+class ControlChannel():
+
+    def __init__(self, address):
+        # =================================================================
+        # Input
+        #   address         "host:port" the channel listens at (UDP)
+        # =================================================================
+        host, _, port       = address.rpartition(':')
+        if not (host and port.isdigit()):
+            raise ValueError('Control address "{}" is not of the form host:port'.format(
+                address))
+
+        self.sock           = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, int(port)))
+        self.sock.setblocking(False) # Polled by the frontend at every frame
+        print('Display filter control at {}'.format(address))
+
+
+    def poll(self):
+        # =================================================================
+        # Output:
+        #   commands            List of (command, sender) received since the
+        #                       last call, command being a dictionnary
+        # =================================================================
+        commands            = []
+        while True:
+            try:
+                datagram, sender = self.sock.recvfrom(MAX_COMMAND)
+            except (BlockingIOError, InterruptedError):
+                return commands
+            except OSError as e: # E.g. ICMP port unreachable of a reply
+                print('Control channel: {}'.format(e))
+                continue
+
+            try:
+                command     = loads(datagram.decode('utf-8'))
+                if not isinstance(command, dict):
+                    raise ValueError('Commands are JSON objects')
+            except ValueError as e:
+                self.reply(sender, {"error": "Invalid command: {}".format(e)})
+                continue
+            commands.append((command, sender))
+
+
+    def reply(self, sender, message):
+
+        try:
+            self.sock.sendto(bytes(dumps(message), "utf-8"), sender)
+        except OSError as e:
+            print('Could not reply to {}: {}'.format(sender, e))
+
+
+    def close(self):
+
+        self.sock.close()
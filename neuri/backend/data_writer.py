@@ -0,0 +1,135 @@
+from threading                          import Thread
+from queue                              import Queue, Full
+from time                               import perf_counter
+
+
+WAIT_TIMEOUT        = 0.5 # Seconds between two checks that the writer still runs
+STOP_TIMEOUT        = 30  # Seconds stop() waits for the queue to be written
+
+
+class DataWriter(Thread):
+
+    def __init__(self, recording, max_queue=32, flush_interval=1,
+                 fsync_interval=10):
+        # =================================================================
+        # One long-lived thread that appends blocks of samples to the
+        # recording. Blocks wait in a bounded queue: when the disk stalls
+        # and the queue is full, put() blocks the caller (backpressure)
+        # instead of piling up threads or memory.
+        # Input
+        #   recording       Recording of recording_formats.py (object)
+        #   max_queue       Scalar (blocks that can wait to be written)
+        #   flush_interval  Scalar (blocks written between two flushes)
+        #   fsync_interval  Scalar (seconds between two syncs to disk,
+        #                   0 to sync after every flush)
+        # =================================================================
+        super(DataWriter, self).__init__(daemon=True)
+
+        self.recording      = recording
+        self.queue          = Queue(maxsize=max_queue)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+
+        # Counters
+        self.blocks_written = 0
+        self.bytes_written  = 0
+        self.last_latency   = 0.0 # Seconds needed to write the last block
+        self.max_latency    = 0.0
+        self.stalls         = 0   # put() calls that had to wait
+        self.error          = None # Exception that ended the thread
+
+
+    def put(self, eeg_data, time_stamps, quality=None):
+        # =================================================================
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples] (float)
+        #   time_stamps         1D numpy array
+        #   quality             1D numpy array (see GapFiller.fill())
+        # Output:
+        #   No output
+        # =================================================================
+        self.check()
+        try:
+            self.queue.put_nowait((eeg_data, time_stamps, quality))
+            return
+        except Full:
+            self.stalls    += 1
+
+        # Wait for room, but do not wait for a writer that has died
+        while True:
+            try:
+                self.queue.put((eeg_data, time_stamps, quality),
+                               timeout=WAIT_TIMEOUT)
+                return
+            except Full:
+                self.check()
+
+
+    def check(self):
+        # Raises the error that ended the writer, so that the sampling loop
+        # does not keep filling a queue nobody empties
+        if self.error is not None:
+            raise self.error
+        if self.ident is not None and not self.is_alive():
+            raise RuntimeError('The recording writer stopped')
+
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+
+    def run(self):
+
+        self.recording.open()
+        unflushed           = 0
+        last_sync           = perf_counter()
+
+        try:
+            while True:
+                block       = self.queue.get()
+                if block is None: # Stop requested
+                    break
+
+                t0          = perf_counter()
+                self.bytes_written += self.recording.write_block(*block)
+                self.blocks_written+= 1
+                unflushed  += 1
+
+                if unflushed >= self.flush_interval:
+                    sync    = perf_counter() - last_sync >= self.fsync_interval
+                    self.recording.flush(sync)
+                    unflushed = 0
+                    if sync:
+                        last_sync = perf_counter()
+
+                self.last_latency = perf_counter() - t0
+                self.max_latency  = max(self.max_latency, self.last_latency)
+        except Exception as e: # E.g. disk full, encoding error
+            self.error      = e
+            print('Writing the recording failed: {}'.format(e))
+        finally:
+            try:
+                self.recording.flush(True)
+                self.recording.close()
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+                print('Closing the recording failed: {}'.format(e))
+
+
+    def stop(self):
+        # Everything queued before is written and synced to disk once this
+        # returns. Raises the error that ended the writer, if any
+        t_end               = perf_counter() + STOP_TIMEOUT
+        while self.is_alive() and perf_counter() < t_end:
+            try:
+                self.queue.put(None, timeout=WAIT_TIMEOUT)
+                break
+            except Full:
+                continue
+        self.join(max(t_end - perf_counter(), 0))
+        if self.is_alive():
+            print('The recording writer did not finish within {} s'.format(
+                STOP_TIMEOUT))
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,239 @@
+from numpy import asarray, concatenate, rint, clip, uint8, repeat, zeros, diff, flatnonzero
+from datetime                           import datetime
+import os
+
+
+# EDF+ (16 bit) and BDF+ (24 bit) are written as continuous recordings
+# ("EDF+C"): the header, then one data record per record_duration seconds
+# holding the samples of every channel one after the other, followed by
+# the "EDF Annotations" signal with the time-keeping annotation of the
+# record, followed by one "Interpolated" annotation per run of samples
+# filled in by GapFiller. The amount of data records is -1 while recording
+# and patched when the session is closed.
+ANNOTATION_BYTES    = 240 # Per data record
+NUM_RECORDS_OFFSET  = 236 # Position of "number of data records" field
+# The EXG Pill sends the readings of the ADC of the microcontroller it is
+# wired to (10 to 14 bits depending on the board, centred around 0 by the
+# filtering sketches), not 24-bit counts
+EXG_PILL_RANGE      = 2**14
+
+
+def header_field(value, length):
+    return str(value)[:length].ljust(length).encode('ascii')
+
+
+def header_number(value, length=8):
+    # Physical ranges have to fit into 8 characters
+    for digits in range(length, 0, -1):
+        text            = '{:.{}g}'.format(value, digits)
+        if len(text) <= length:
+            break
+    return header_field(text, length)
+
+
+def tal_seconds(value):
+    # Onsets and durations of annotations are written without exponent
+    return '{:.6f}'.format(value).rstrip('0').rstrip('.')
+
+
+class EdfRecording():
+
+    extension           = '.edf'
+
+    def __init__(self, file_name, num_chans, sample_rate, board, divisors,
+                 record_duration=1, bits=16):
+        # =================================================================
+        # Streaming EDF+/BDF+ writer. Neuri boards deliver 24-bit counts,
+        # which BDF+ (bits=24) stores without loss. EDF+ (bits=16) maps the
+        # same physical range onto 16 bits.
+        # Input
+        #   file_name       Character string
+        #   num_chans       Scalar
+        #   sample_rate     Scalar (Hz)
+        #   board           Character string
+        #   divisors        List [num_chans] of Sampling.voltage_divisor()
+        #                   of the board each channel comes from
+        #   record_duration Scalar (seconds per data record)
+        #   bits            16 (EDF+) or 24 (BDF+)
+        # =================================================================
+        self.file_name      = file_name
+        self.num_chans      = int(num_chans)
+        self.sample_rate    = sample_rate
+        self.board          = board
+        self.record_duration= record_duration
+        self.record_samples = int(round(sample_rate * record_duration))
+        self.bits           = bits
+        self.bytes_per_value= bits // 8
+        self.digital_max    = 2**(bits - 1) - 1
+        self.digital_min    = -self.digital_max
+        self.ann_samples    = ANNOTATION_BYTES // self.bytes_per_value
+
+        if len(divisors) != self.num_chans:
+            raise ValueError('{} divisors for {} channels'.format(
+                len(divisors), self.num_chans))
+
+        # Physical range of each channel: full scale of the 24-bit ADC
+        # (+/- 4.5 V / PGA) for Neuri boards, the values of the EXG Pill
+        # as they are. Readers compute the gain from the header, so the
+        # ranges are taken as written there (the minimum has the sign
+        # to fit in, so it sets the precision of both)
+        self.physical_max   = []
+        self.dimensions     = []
+        for divisor in divisors:
+            if divisor is None:
+                physical_max= EXG_PILL_RANGE
+                self.dimensions.append('')
+            else:
+                physical_max= 4.5 * 8388607.0 * 1000000 / divisor
+                self.dimensions.append('uV')
+            self.physical_max.append(-float(header_number(-physical_max)))
+        self.physical_max   = asarray(self.physical_max)
+        self.gain           = (self.physical_max / self.digital_max)[:, None]
+
+        self.file           = None
+        self.num_records    = 0
+        self.pending_data   = []
+        self.pending_quality= []
+        self.pending_count  = 0
+
+
+    def create(self):
+        start               = datetime.now()
+        ns                  = self.num_chans + 1
+        labels              = ['Ch. {}'.format(i+1) for i in range(self.num_chans)]
+        labels.append('EDF Annotations' if self.bits == 16 else 'BDF Annotations')
+
+        header              = [
+            b'0       ' if self.bits == 16 else b'\xffBIOSEMI',
+            header_field('X X X X', 80),
+            header_field(' '.join(['Startdate',
+                start.strftime('%d-%b-%Y').upper(), 'X X',
+                self.board.replace(' ', '_')]), 80),
+            header_field(start.strftime('%d.%m.%y'), 8),
+            header_field(start.strftime('%H.%M.%S'), 8),
+            header_field(256 * (ns + 1), 8),
+            header_field('EDF+C' if self.bits == 16 else 'BDF+C', 44),
+            header_field(-1, 8),
+            header_number(self.record_duration),
+            header_field(ns, 4)]
+
+        header             += [header_field(label, 16) for label in labels]
+        header             += [header_field('', 80) for _ in range(ns)]
+        header             += [header_field(dimension, 8) for dimension in self.dimensions]
+        header             += [header_field('', 8)]
+        header             += [header_number(-value) for value in self.physical_max]
+        header             += [header_field(-1, 8)]
+        header             += [header_number(value) for value in self.physical_max]
+        header             += [header_field(1, 8)]
+        header             += [header_field(self.digital_min, 8)] * self.num_chans
+        header             += [header_field(-self.digital_max - 1, 8)]
+        header             += [header_field(self.digital_max, 8)] * ns
+        header             += [header_field('', 80) for _ in range(ns)]
+        header             += [header_field(self.record_samples, 8)] * self.num_chans
+        header             += [header_field(self.ann_samples, 8)]
+        header             += [header_field('', 32) for _ in range(ns)]
+
+        with open(self.file_name, 'wb') as file:
+            file.write(b''.join(header))
+
+
+    def open(self):
+        self.file           = open(self.file_name, 'r+b')
+        self.file.seek(0, os.SEEK_END)
+
+
+    def write_block(self, eeg_data, time_stamps, quality=None):
+        # =================================================================
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples] (float)
+        #   time_stamps         1D numpy array (ms), unused since EDF+C
+        #                       assumes a constant sampling rate
+        #   quality             1D numpy array (uint8), optional
+        # Output:
+        #   num_bytes           Scalar (amount of bytes written)
+        # =================================================================
+        if quality is None:
+            quality         = zeros(eeg_data.shape[1], dtype=uint8)
+        self.pending_data.append(asarray(eeg_data))
+        self.pending_quality.append(asarray(quality, dtype=uint8))
+        self.pending_count += eeg_data.shape[1]
+
+        num_bytes           = 0
+        while self.pending_count >= self.record_samples:
+            data            = concatenate(self.pending_data, axis=1)
+            quality         = concatenate(self.pending_quality)
+            self.pending_data = [data[:, self.record_samples:]]
+            self.pending_quality = [quality[self.record_samples:]]
+            self.pending_count -= self.record_samples
+            num_bytes      += self.write_record(data[:, :self.record_samples],
+                quality[:self.record_samples])
+        return num_bytes
+
+
+    def annotate(self, record_onset, quality):
+        # =================================================================
+        # Output:
+        #   annotation          bytes, time-keeping annotation followed by
+        #                       the runs of filled samples that fit into
+        #                       the record (one annotation spanning all
+        #                       runs otherwise)
+        # =================================================================
+        annotation          = '+' + tal_seconds(record_onset) + '\x14\x14\x00'
+        if not quality.any():
+            return annotation.encode('ascii')
+
+        edges               = diff(concatenate(([0], quality.astype(int), [0])))
+        starts, ends        = flatnonzero(edges == 1), flatnonzero(edges == -1)
+        runs                = [self.filled_run(record_onset, s, e)
+                               for s, e in zip(starts, ends)]
+        if len(annotation + ''.join(runs)) > self.ann_samples * self.bytes_per_value:
+            runs            = [self.filled_run(record_onset, starts[0], ends[-1])]
+        return (annotation + ''.join(runs)).encode('ascii')
+
+
+    def filled_run(self, record_onset, start, end):
+        return '+{}\x15{}\x14Interpolated\x14\x00'.format(
+            tal_seconds(record_onset + start / self.sample_rate),
+            tal_seconds((end - start) / self.sample_rate))
+
+
+    def write_record(self, eeg_data, quality):
+
+        digital             = clip(rint(eeg_data / self.gain),
+            self.digital_min, self.digital_max)
+        if self.bits == 16:
+            samples         = digital.astype('<i2').tobytes()
+        else: # Lowest three bytes of little endian int32
+            samples         = digital.astype('<i4').view(uint8).reshape(-1, 4)[:, :3].tobytes()
+
+        # Time-keeping annotation: onset of the record, empty description
+        annotation          = self.annotate(self.num_records * self.record_duration, quality)
+        annotation          = annotation.ljust(self.ann_samples * self.bytes_per_value, b'\x00')
+
+        self.file.write(samples + annotation)
+        self.num_records   += 1
+        return len(samples) + len(annotation)
+
+
+    def flush(self, sync=False):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+
+    def close(self):
+        # Complete the last data record by holding the last values
+        if self.pending_count > 0:
+            data            = concatenate(self.pending_data, axis=1)
+            quality         = concatenate(self.pending_quality)
+            padding         = repeat(data[:, -1:], self.record_samples - data.shape[1], axis=1)
+            self.write_record(concatenate((data, padding), axis=1),
+                concatenate((quality, zeros(padding.shape[1], dtype=uint8))))
+            self.pending_data = []
+            self.pending_quality = []
+            self.pending_count = 0
+
+        self.file.seek(NUM_RECORDS_OFFSET)
+        self.file.write(header_field(self.num_records, 8))
+        self.file.close()
+        self.file           = None
@@ -0,0 +1,123 @@
+from numpy import (asarray, arange, cumsum, empty, ones, zeros, where,
+                   flatnonzero, searchsorted, concatenate, maximum, int64,
+                   uint8)
+from time                               import perf_counter
+
+
+COUNTER_MODULO      = 65536 # Frame counters of wire_protocol.py are uint16
+
+
+class GapFiller():
+
+    def __init__(self, num_chans, method='linear'):
+        # =================================================================
+        # Puts samples that were lost on the way (corrupt messages, frames
+        # missing from the counter sequence) back into the stream, so that
+        # every later sample keeps its place in time. Lost samples are
+        # filled block-wise and flagged in a quality mask.
+        # Input
+        #   num_chans       Scalar
+        #   method          'linear' (between the neighbouring samples) or
+        #                   'hold' (repeat the last sample)
+        # =================================================================
+        self.num_chans      = int(num_chans)
+        self.method         = method
+        self.last_sample    = None # Last sample of the previous block
+        self.prev_counter   = None
+        self.pending        = 0    # Lost samples at the end of a block,
+                                   # filled once the next sample arrives
+
+        # Counters
+        self.filled_total   = 0
+        self.filled_since   = 0
+        self.rate_reset     = perf_counter()
+
+
+    def missing_from_counters(self, counters):
+        # =================================================================
+        # Input:
+        #   counters            1D numpy array of frame counters
+        # Output:
+        #   missing_before      1D numpy array (amount of samples lost
+        #                       directly before each frame)
+        # =================================================================
+        counters            = asarray(counters, dtype=int64)
+        if counters.shape[0] == 0:
+            return zeros(0, dtype=int64)
+
+        first               = counters[0] - 1 if self.prev_counter is None else self.prev_counter
+        previous            = concatenate(([first], counters[:-1]))
+        self.prev_counter   = counters[-1]
+        return (counters - previous - 1) % COUNTER_MODULO
+
+
+    def fill(self, eeg_data, missing_before, missing_after=0):
+        # =================================================================
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples] of the
+        #                       samples that arrived
+        #   missing_before      1D numpy array [samples] (amount of samples
+        #                       lost directly before each sample)
+        #   missing_after       Scalar (samples lost after the last one)
+        # Output:
+        #   eeg_data            2D numpy array [channels x samples], lost
+        #                       samples included
+        #   quality             1D numpy array [samples] (uint8), 1 where
+        #                       the sample was filled, 0 where it was
+        #                       measured
+        # =================================================================
+        num_valid           = eeg_data.shape[1]
+        missing_before      = asarray(missing_before, dtype=int64).copy()
+        if num_valid == 0:
+            self.pending   += int(missing_before.sum()) + missing_after
+            return eeg_data, zeros(0, dtype=uint8)
+        missing_before[0]  += self.pending
+        self.pending        = missing_after
+
+        num_filled          = int(missing_before.sum())
+        if num_filled == 0:
+            self.last_sample= eeg_data[:, -1].copy()
+            return eeg_data, zeros(num_valid, dtype=uint8)
+
+        total               = num_valid + num_filled
+        positions           = arange(num_valid) + cumsum(missing_before)
+        quality             = ones(total, dtype=uint8)
+        quality[positions]  = 0
+        block               = empty((self.num_chans, total))
+        block[:, positions] = eeg_data
+
+        # Closest measured sample on each side of the filled ones. -1 is
+        # the last sample of the previous block
+        filled              = flatnonzero(quality)
+        left                = maximum.accumulate(where(quality == 0, arange(total), -1))[filled]
+        right               = positions[searchsorted(positions, filled)]
+
+        right_values        = block[:, right]
+        if self.last_sample is None: # Lost at the very start of the session
+            left_values     = where(left >= 0, block[:, left], right_values)
+        else:
+            left_values     = where(left >= 0, block[:, left], self.last_sample[:, None])
+
+        if self.method == 'hold':
+            block[:, filled]= left_values
+        else:
+            weight          = (filled - left) / (right - left)
+            block[:, filled]= left_values + (right_values - left_values) * weight
+
+        self.last_sample    = block[:, -1].copy()
+        self.filled_total  += num_filled
+        self.filled_since  += num_filled
+        return block, quality
+
+
+    def drop_rate(self):
+        # =================================================================
+        # Output:
+        #   drops_per_minute    Float, since the previous call
+        # =================================================================
+        now                 = perf_counter()
+        elapsed             = max(now - self.rate_reset, 1e-9)
+        rate                = self.filled_since / elapsed * 60
+        self.filled_since   = 0
+        self.rate_reset     = now
+        return rate
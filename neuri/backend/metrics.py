@@ -0,0 +1,148 @@
+from multiprocessing                    import shared_memory
+from numpy                              import ndarray, zeros, int64, float64, searchsorted
+from json                               import dumps
+from time                               import time
+
+from .shared_transport                  import attach_shared_memory
+
+
+# Durations of the stages of the sampling loop (exponential moving average
+# and maximum since the last reset, in ms)
+STAGES              = ['parse', 'convert', 'relay', 'write']
+
+# Upper edges (ms) of the histogram of the time between two batches read
+# from the port. The last bin holds everything above the last edge
+ARRIVAL_EDGES       = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+FIELDS              = ([
+    'time',                 # Wall clock time of the last publication (s)
+    'sample_rate',          # Effective sampling rate (Hz)
+    'samples',              # Samples received in total
+    'batches',              # Batches read from the port in total
+    'serial_backlog',       # Bytes waiting at the port (in_waiting)
+    'serial_bytes_per_s',
+    'serial_messages_per_s',# Messages (JSON lines or binary frames) read
+    'lost_samples',         # Samples filled in by the GapFiller in total
+    'lost_per_minute',
+    'frames_rejected',      # Binary frames with a wrong checksum
+    'writer_queue',         # Blocks waiting for the DataWriter
+    'writer_latency_ms',
+    'writer_stalls',
+    'clock_rate',           # Sampling rate measured by the SampleClock (Hz)
+    'clock_drift_ppm',
+    'clock_jitter_ms',
+    'stream_clients',
+    'stream_dropped']
+    + [stage + '_ms' for stage in STAGES]
+    + [stage + '_max_ms' for stage in STAGES]
+    + ['arrival_le_{}ms'.format(edge) for edge in ARRIVAL_EDGES]
+    + ['arrival_gt_{}ms'.format(ARRIVAL_EDGES[-1])])
+INDEX               = {field: i for i, field in enumerate(FIELDS)}
+ARRIVAL_START       = INDEX['arrival_le_{}ms'.format(ARRIVAL_EDGES[0])]
+
+
+class MetricsRegistry():
+
+    def __init__(self, name=None, smoothing=0.05):
+        # =================================================================
+        # Acquisition metrics in a multiprocessing.shared_memory block.
+        # The sampling process updates a private copy in the loop and
+        # publishes it once per batch (seqlock, see SharedTransport), the
+        # GUI process reads consistent snapshots at any time.
+        # Input
+        #   name            Name of an existing block to attach to. A new
+        #                   block is allocated when None
+        #   smoothing       Scalar (weight of a new stage duration in the
+        #                   moving average)
+        # =================================================================
+        size                = 8 * (1 + len(FIELDS))
+        self.is_owner       = name is None
+        if self.is_owner:
+            self.shm        = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm        = attach_shared_memory(name)
+
+        self.seq            = ndarray((1,), dtype=int64, buffer=self.shm.buf, offset=0)
+        self.shared         = ndarray((len(FIELDS),), dtype=float64,
+            buffer=self.shm.buf, offset=8)
+        if self.is_owner:
+            self.seq[:]     = 0
+            self.shared[:]  = 0
+
+        self.values         = zeros(len(FIELDS)) # Private copy of the writer
+        self.smoothing      = smoothing
+
+
+    def __reduce__(self):
+        return (MetricsRegistry, (self.shm.name, self.smoothing))
+
+
+    def set(self, field, value):
+        self.values[INDEX[field]] = value
+
+
+    def add(self, field, value=1):
+        self.values[INDEX[field]] += value
+
+
+    def stage(self, name, seconds):
+        # =================================================================
+        # Input:
+        #   name                One of STAGES
+        #   seconds             Scalar (duration of the stage)
+        # =================================================================
+        ms                  = seconds * 1000
+        mean                = INDEX[name + '_ms']
+        self.values[mean]  += self.smoothing * (ms - self.values[mean])
+        peak                = INDEX[name + '_max_ms']
+        if ms > self.values[peak]:
+            self.values[peak] = ms
+
+
+    def arrival(self, interval):
+        # Time between two batches (ms) into the histogram
+        self.values[ARRIVAL_START + searchsorted(ARRIVAL_EDGES, interval)] += 1
+
+
+    def reset_peaks(self):
+        for name in STAGES:
+            self.values[INDEX[name + '_max_ms']] = 0
+
+
+    def publish(self):
+
+        self.values[INDEX['time']] = time()
+        self.seq[0]        += 1 # Odd: write in progress
+        self.shared[:]      = self.values
+        self.seq[0]        += 1 # Even: consistent again
+
+
+    def snapshot(self, max_retries=100):
+        # =================================================================
+        # Output:
+        #   metrics             Dictionnary {field: value}
+        # =================================================================
+        for _ in range(max_retries):
+            seq             = int(self.seq[0])
+            if seq % 2 == 1:
+                continue
+            values          = self.shared.copy()
+            if int(self.seq[0]) == seq:
+                break
+        else:
+            values          = self.shared.copy()
+        return dict(zip(FIELDS, values.tolist()))
+
+
+    def dump(self, file_name):
+        # Publishes the current values and appends them as one line of JSON
+        self.publish()
+        with open(file_name, 'a', encoding= "utf_8") as file:
+            file.write(dumps(self.snapshot()) + '\n')
+
+
+    def close(self):
+        del self.seq, self.shared
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
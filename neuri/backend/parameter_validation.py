@@ -1,15 +1,20 @@
-import tkinter                              as tk
-from PIL                                    import Image, ImageTk
 import os
 
 class ParamVal():
 
-    def __init__(self, p):
+    def __init__(self, p, alert=True):
+        # =================================================================
+        # Input
+        #   p               Parameters or Settings
+        #   alert           Boolean. True opens a window listing the errors
+        #                   and exits once it is closed, False only keeps
+        #                   them in error_messages (headless daemon)
+        # =================================================================
+        self.ico_helment    = getattr(p, 'ico_neuri', None)
 
-        self.ico_helment    = p.ico_neuri
-
-        error_messages      = self.verify_compatibility(p)
-        self.alert_user(error_messages)
+        self.error_messages = self.verify_compatibility(p)
+        if alert:
+            self.alert_user(self.error_messages)
 
 
     def verify_compatibility(self, p):
@@ -19,7 +24,7 @@ class ParamVal():
         if p.saving_interval > p.buffer_length: #Checkpoint of parameters
             error_messages.append('Buffer can not be shorter than saving interval./nThis is a developer error and not your responsability as a user. Please contact the developers.')
         
-        if len([i for i in range(p.max_chans) if p.selected_chans[i]]) == 0 and not p.run_headless:
+        if not p.run_headless and len([i for i in range(p.max_chans) if p.selected_chans[i]]) == 0:
             error_messages.append('No channel selected for display. Please select at least one.')
         
         if len(p.sessionName) == 0:
@@ -31,6 +36,33 @@ class ParamVal():
         if len(p.port) == 0:
             error_messages.append('No device set to connect to. Chose a valid COM port.')
         
+        if p.recording_format not in p.recording_formats:
+            error_messages.append('Unknown recording format "{}". Chose one of: {}.'.format(
+                p.recording_format, ', '.join(p.recording_formats)))
+
+        if p.relay_format not in p.relay_formats:
+            error_messages.append('Unknown relay format "{}". Chose one of: {}.'.format(
+                p.relay_format, ', '.join(p.relay_formats)))
+
+        if p.relay_batch < 1 or p.relay_latency < 0:
+            error_messages.append('The relay needs at least 1 sample per datagram and a latency of 0 ms or more.')
+
+        control_host, _, control_port = p.control_address.rpartition(':')
+        if p.control_address and not (control_host and control_port.isdigit()):
+            error_messages.append('The control address "{}" has to be of the form host:port.'.format(
+                p.control_address))
+
+        if p.envelope_band and p.envelope_band not in p.frequency_bands:
+            error_messages.append('Unknown envelope band "{}". Chose one of: {}.'.format(
+                p.envelope_band, ', '.join(p.frequency_bands.keys())))
+
+        for port, board, num_chans in p.additional_devices:
+            if board not in p.board_characteristics:
+                error_messages.append('Unknown board "{}" of the additional device at {}. Chose one of: {}.'.format(
+                    board, port, ', '.join(p.board_characteristics.keys())))
+            if num_chans < 1:
+                error_messages.append('The additional device at {} needs at least 1 channel.'.format(port))
+
         if (p.sample_rate * p.buffer_length / p.s_down) % 1 != 0 and not p.run_headless:
             error_messages.append('Time range, sampling rate and downsample factor have to be set so that (time range * sampling rate / downscale factor is an integer.).')
         
@@ -42,9 +74,15 @@ class ParamVal():
         if len(messages) == 0:
             return
 
+        # Only loaded when there is something to show, the headless daemon
+        # must not depend on any GUI toolkit
+        import tkinter                          as tk
+        from PIL                                import Image, ImageTk
+
         self.warn           = tk.Tk()
-        photo = ImageTk.PhotoImage(Image.open(self.ico_helment))
-        self.warn.wm_iconphoto(True, photo)
+        if self.ico_helment is not None:
+            photo = ImageTk.PhotoImage(Image.open(self.ico_helment))
+            self.warn.wm_iconphoto(True, photo)
         # self.warn.geometry("{}x{}".format(400, 400))
         self.warn.title('ERRORS ENCOUNTERED')
 
@@ -0,0 +1,283 @@
+from numpy import dtype, memmap, empty, array, asarray, rint
+from struct                             import Struct
+import os
+
+
+# Binary session format (".nrec"), all values little endian:
+#   header              HEADER_SIZE bytes, see HEADER below (magic,
+#                       version, header size, amount of channels, bytes
+#                       per value, sampling rate, PGA, board name)
+#   records             One record per sample, appended to the end of the
+#                       file: int64 timestamp (microseconds), one float32
+#                       or float64 value per channel (microvolts), and
+#                       since version 2 one uint8 quality flag (1 for
+#                       samples filled in by GapFiller)
+# The amount of samples follows from the file size, so that a session
+# stays readable even if the recording stopped unexpectedly.
+MAGIC               = b'NEURIREC'
+VERSION             = 2
+HEADER              = Struct('<8sHHHB3xdd128s')
+HEADER_SIZE         = 256
+
+
+def record_dtype(num_chans, bytes_per_value=4, version=VERSION):
+    fields              = [('t_us', '<i8'), ('x', '<f{}'.format(bytes_per_value), (num_chans,))]
+    if version >= 2:
+        fields.append(('q', 'u1'))
+    return dtype(fields)
+
+
+def format_text_block(eeg_data, time_stamps):
+    # =====================================================================
+    # Input:
+    #   eeg_data            2D numpy array [channels x samples] (float)
+    #   time_stamps         1D numpy array (ms)
+    # Output:
+    #   lines               Character string, one line per sample
+    # =====================================================================
+    lines               = []
+    for sample_index in range(time_stamps.shape[0]):
+        # Format time stamp
+        time_stamp      = time_stamps[sample_index]
+        # format eeg data
+        eeg_data_points = eeg_data[:,sample_index].tolist()
+        eeg_data_points = [str(value) for value in eeg_data_points]
+        eeg_data_points = ",".join(eeg_data_points)
+
+        lines.append(f"{time_stamp:.3f}, {eeg_data_points} \n")
+    return "".join(lines)
+
+
+class TextRecording():
+
+    extension           = '.txt'
+
+    def __init__(self, file_name):
+        # =================================================================
+        # Open text format: one line per sample with the timestamp (ms)
+        # followed by the comma-separated values (microvolts). Timestamps
+        # of samples filled in by GapFiller are listed in a second file
+        # ("..._quality.txt"), created with the first filled sample
+        # =================================================================
+        self.file_name      = file_name
+        self.quality_name   = os.path.splitext(file_name)[0] + '_quality.txt'
+        self.file           = None
+        self.quality_file   = None
+
+
+    def create(self):
+        with open(self.file_name, 'w', encoding= "utf_8") as file:
+            file.write("Session Started\n")
+            file.close() # Important for data to get written
+
+
+    def open(self):
+        # Append the data points to the end of the file
+        self.file           = open(self.file_name, 'a', encoding= "utf_8")
+
+
+    def write_block(self, eeg_data, time_stamps, quality=None):
+        # =================================================================
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples] (float)
+        #   time_stamps         1D numpy array (ms)
+        #   quality             1D numpy array (uint8), optional
+        # Output:
+        #   num_bytes           Scalar (amount of bytes written)
+        # =================================================================
+        lines               = format_text_block(eeg_data, time_stamps)
+        self.file.write(lines)
+
+        if quality is not None and quality.any():
+            if self.quality_file is None:
+                self.quality_file = open(self.quality_name, 'a', encoding= "utf_8")
+            filled          = "".join(f"{time_stamp:.3f}\n"
+                for time_stamp in time_stamps[quality > 0])
+            self.quality_file.write(filled)
+        return len(lines)
+
+
+    def flush(self, sync=False):
+        flush_file(self.file, sync)
+        if self.quality_file is not None:
+            flush_file(self.quality_file, sync)
+
+
+    def close(self):
+        self.file.close() # Important for data to get written
+        self.file           = None
+        if self.quality_file is not None:
+            self.quality_file.close()
+            self.quality_file = None
+
+
+class BinaryRecording():
+
+    extension           = '.nrec'
+
+    def __init__(self, file_name, num_chans, sample_rate, pga, board,
+                 bytes_per_value=4):
+        # =================================================================
+        # Binary session format that can be appended to and read back
+        # through numpy.memmap (see read_binary_recording())
+        # Input
+        #   file_name       Character string
+        #   num_chans       Scalar
+        #   sample_rate     Scalar (Hz)
+        #   pga             Scalar
+        #   board           Character string
+        #   bytes_per_value 4 (float32) or 8 (float64)
+        # =================================================================
+        self.file_name      = file_name
+        self.num_chans      = int(num_chans)
+        self.sample_rate    = sample_rate
+        self.pga            = pga
+        self.board          = board
+        self.dtype          = record_dtype(self.num_chans, bytes_per_value)
+        self.file           = None
+
+
+    def create(self):
+        header              = HEADER.pack(MAGIC, VERSION, HEADER_SIZE,
+            self.num_chans, self.dtype['x'].base.itemsize,
+            float(self.sample_rate), float(self.pga),
+            self.board.encode('utf-8')[:128])
+        with open(self.file_name, 'wb') as file:
+            file.write(header.ljust(HEADER_SIZE, b'\x00'))
+
+
+    def to_records(self, eeg_data, time_stamps, quality=None):
+        records             = empty(time_stamps.shape[0], dtype=self.dtype)
+        records['t_us']     = rint(asarray(time_stamps) * 1000)
+        records['x']        = eeg_data.T
+        records['q']        = 0 if quality is None else quality
+        return records
+
+
+    def open(self):
+        self.file           = open(self.file_name, 'ab')
+
+
+    def write_block(self, eeg_data, time_stamps, quality=None):
+        # =================================================================
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples] (float)
+        #   time_stamps         1D numpy array (ms)
+        #   quality             1D numpy array (uint8), optional
+        # Output:
+        #   num_bytes           Scalar (amount of bytes written)
+        # =================================================================
+        records             = self.to_records(eeg_data, time_stamps, quality)
+        self.file.write(records.tobytes())
+        return records.nbytes
+
+
+    def flush(self, sync=False):
+        flush_file(self.file, sync)
+
+
+    def close(self):
+        self.file.close()
+        self.file           = None
+
+
+def flush_file(file, sync):
+    # =====================================================================
+    # Hand buffered data to the OS and, if sync, force it onto the disk
+    # =====================================================================
+    file.flush()
+    if sync:
+        os.fsync(file.fileno())
+
+
+def read_binary_header(file_name):
+    # =====================================================================
+    # Output:
+    #   header              Dictionnary with the session information
+    # =====================================================================
+    with open(file_name, 'rb') as file:
+        raw             = file.read(HEADER.size)
+
+    (magic, version, header_size, num_chans, bytes_per_value, sample_rate,
+     pga, board)        = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError('{} is not a Neuri binary recording'.format(file_name))
+
+    return {"version":          version,
+            "header_size":      header_size,
+            "num_chans":        num_chans,
+            "bytes_per_value":  bytes_per_value,
+            "sample_rate":      sample_rate,
+            "pga":              pga,
+            "board":            board.rstrip(b'\x00').decode('utf-8')}
+
+
+def read_binary_recording(file_name, mode='r'):
+    # =====================================================================
+    # Input:
+    #   file_name           Character string
+    #   mode                numpy.memmap mode ('r' or 'r+')
+    # Output:
+    #   header              Dictionnary (see read_binary_header())
+    #   records             numpy.memmap of records, with records['t_us']
+    #                       [samples], records['x'] [samples x channels]
+    #                       and records['q'] [samples] (version 2)
+    # =====================================================================
+    header              = read_binary_header(file_name)
+    rec_dtype           = record_dtype(header["num_chans"],
+        header["bytes_per_value"], header["version"])
+    num_samples         = (os.path.getsize(file_name) - header["header_size"]) // rec_dtype.itemsize
+
+    if num_samples == 0:
+        return header, empty(0, dtype=rec_dtype)
+
+    records             = memmap(file_name, dtype=rec_dtype, mode=mode,
+        offset=header["header_size"], shape=(num_samples,))
+    return header, records
+
+
+def text_to_binary(text_file, binary_file, sample_rate, pga, board,
+                   bytes_per_value=8, lines_per_block=100000):
+    # =====================================================================
+    # Converts a recording of the text format into the binary format. The
+    # text format does not store session information, so it needs to be
+    # passed. Float64 keeps the values identical to the text file.
+    # =====================================================================
+    recording           = None
+
+    with open(text_file, 'r', encoding= "utf_8") as file:
+        file.readline() # "Session Started"
+        while True:
+            lines       = [line for line in
+                (file.readline() for _ in range(lines_per_block)) if line.strip()]
+            if len(lines) == 0:
+                break
+            values      = array([line.split(',') for line in lines], dtype=float)
+
+            if recording is None:
+                recording = BinaryRecording(binary_file, values.shape[1] - 1,
+                    sample_rate, pga, board, bytes_per_value)
+                recording.create()
+                recording.open()
+            recording.write_block(values[:, 1:].T, values[:, 0])
+
+    if recording is not None:
+        recording.close()
+    return recording
+
+
+def binary_to_text(binary_file, text_file, samples_per_block=100000):
+    # =====================================================================
+    # Converts a recording of the binary format into the text format
+    # =====================================================================
+    _, records          = read_binary_recording(binary_file)
+    recording           = TextRecording(text_file)
+    recording.create()
+    recording.open()
+
+    for start in range(0, records.shape[0], samples_per_block):
+        block           = records[start:start + samples_per_block]
+        quality         = block['q'] if 'q' in records.dtype.names else None
+        recording.write_block(block['x'].T.astype(float),
+            block['t_us'] / 1000, quality)
+    recording.close()
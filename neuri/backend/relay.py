@@ -0,0 +1,160 @@
+from numpy import empty, frombuffer, arange, array
+from json import dumps
+from struct                             import Struct
+from time                               import perf_counter
+
+
+# Binary relay datagram, all values little endian:
+#   header              PACKET_HEADER (magic, sequence number, timestamp
+#                       of the first sample in microseconds, amount of
+#                       channels, amount of samples)
+#   data                float32 values (microvolts) [samples x channels],
+#                       i.e. all channels of the first sample, then all
+#                       channels of the second sample, ...
+# The sequence number increases by one per datagram, so that receivers can
+# count lost datagrams.
+PACKET_MAGIC        = b'NRLY'
+PACKET_HEADER       = Struct('<4sIqHH')
+MAX_DATAGRAM        = 65507 # Largest UDP payload over IPv4
+
+
+class JsonRelay():
+
+    def __init__(self, transmitter, address, num_chans):
+        # =================================================================
+        # One JSON message per sample: {"t": "", "c1": "...", ...}
+        # Input
+        #   transmitter     UDP socket (object)
+        #   address         Tuple (ip, port)
+        #   num_chans       Scalar
+        # =================================================================
+        self.transmitter    = transmitter
+        self.address        = address
+        self.keys           = ["".join(["c", str(iC+1)]) for iC in range(num_chans)]
+        self.relay_array    = {}
+        self.relay_array["t"] = ''
+        for key in self.keys:
+            self.relay_array[key] = ''
+        self.datagrams_sent = 0
+
+
+    def send(self, sample, time_stamp):
+
+        for key, value in zip(self.keys, sample.tolist()):
+            self.relay_array[key] = str(value)
+        self.transmitter.sendto(bytes(dumps(self.relay_array), "utf-8"), self.address)
+        self.datagrams_sent+= 1
+
+
+    def poll(self):
+        pass
+
+
+    def flush(self):
+        pass
+
+
+class BinaryRelay():
+
+    def __init__(self, transmitter, address, num_chans, batch_size=10,
+                 max_latency=20):
+        # =================================================================
+        # Packs several samples into one datagram (see PACKET_HEADER).
+        # A datagram is sent when batch_size samples are waiting, or when
+        # the oldest waiting sample is older than max_latency.
+        # Input
+        #   transmitter     UDP socket (object)
+        #   address         Tuple (ip, port)
+        #   num_chans       Scalar
+        #   batch_size      Scalar (samples per datagram)
+        #   max_latency     Scalar (ms a sample may wait before it is sent)
+        # =================================================================
+        max_batch           = (MAX_DATAGRAM - PACKET_HEADER.size) // (4 * num_chans)
+        self.transmitter    = transmitter
+        self.address        = address
+        self.num_chans      = int(num_chans)
+        self.batch_size     = max(1, min(int(batch_size), max_batch))
+        self.max_latency    = max_latency / 1000
+        self.buffer         = empty((self.batch_size, self.num_chans), dtype='<f4')
+        self.num_pending    = 0
+        self.first_time     = 0
+        self.first_arrival  = 0.0
+        self.sequence       = 0
+        self.datagrams_sent = 0
+
+
+    def send(self, sample, time_stamp):
+        # =================================================================
+        # Input:
+        #   sample              1D numpy array [channels] (microvolts)
+        #   time_stamp          Scalar (ms)
+        # Output:
+        #   No output
+        # =================================================================
+        if self.num_pending == 0:
+            self.first_time     = int(round(time_stamp * 1000))
+            self.first_arrival  = perf_counter()
+        self.buffer[self.num_pending] = sample
+        self.num_pending   += 1
+
+        if self.num_pending == self.batch_size:
+            self.flush()
+
+
+    def poll(self):
+        # Sends waiting samples once they exceed the latency bound, also
+        # when no further sample arrives
+        if self.num_pending > 0 and perf_counter() - self.first_arrival >= self.max_latency:
+            self.flush()
+
+
+    def flush(self):
+
+        if self.num_pending == 0:
+            return
+
+        self.transmitter.sendto(encode_relay_packet(self.sequence,
+            self.first_time, self.buffer[:self.num_pending]), self.address)
+        self.sequence      += 1
+        self.datagrams_sent+= 1
+        self.num_pending    = 0
+
+
+def encode_relay_packet(sequence, first_time, eeg_data):
+    # =====================================================================
+    # Input:
+    #   sequence            Scalar
+    #   first_time          Scalar (microseconds)
+    #   eeg_data            2D numpy array [samples x channels] (float32)
+    # Output:
+    #   packet              bytes (see PACKET_HEADER)
+    # =====================================================================
+    header              = PACKET_HEADER.pack(PACKET_MAGIC,
+        sequence & 0xFFFFFFFF, first_time, eeg_data.shape[1], eeg_data.shape[0])
+    return header + eeg_data.astype('<f4', copy=False).tobytes()
+
+
+def decode_relay_packet(datagram, sample_rate=None):
+    # =====================================================================
+    # For receivers of the binary relay
+    # Input:
+    #   datagram            bytes
+    #   sample_rate         Scalar (Hz), to compute the timestamps of the
+    #                       samples following the first one
+    # Output:
+    #   sequence            Scalar
+    #   eeg_data            2D numpy array [channels x samples] (float32)
+    #   time_stamps         1D numpy array (ms), only the first one when
+    #                       sample_rate is None
+    # =====================================================================
+    magic, sequence, first_time, num_chans, num_samples = PACKET_HEADER.unpack_from(datagram)
+    if magic != PACKET_MAGIC:
+        raise ValueError('Not a Neuri relay datagram')
+
+    eeg_data            = frombuffer(datagram, dtype='<f4', offset=PACKET_HEADER.size,
+        count=num_chans * num_samples).reshape(num_samples, num_chans).T
+    if sample_rate is None:
+        time_stamps     = array([first_time / 1000])
+    else:
+        time_stamps     = first_time / 1000 + arange(num_samples) * 1000 / sample_rate
+    return sequence, eeg_data, time_stamps
@@ -0,0 +1,119 @@
+from threading                          import Thread
+from json                               import load, dump
+from time                               import time
+
+
+REPOSITORY          = "davidmarcelbaum/NeuriGUI"
+RELEASES_URL        = "https://github.com/davidmarcelbaum/NeuriGUI/releases/tag/{}"
+
+
+def version_tuple(title):
+    # =====================================================================
+    # Input:
+    #   title               Version or release title, e.g. "V2.82.0"
+    # Output:
+    #   version             Tuple of integers, e.g. (2, 82, 0)
+    # =====================================================================
+    return tuple(int(part) for part in title.strip().lstrip('Vv').split('.'))
+
+
+class ReleaseCheck(Thread):
+
+    def __init__(self, version, cache_file, ttl=24, timeout=3, retry=1,
+                 max_wait=15):
+        # =================================================================
+        # Looks up the latest release on GitHub without holding up the
+        # settings window: the request runs in this thread with a short
+        # timeout, and its result is kept in cache_file so that further
+        # starts within ttl hours do not go online at all. Failures are
+        # kept as well, for retry hours, so that machines without network
+        # do not wait for the timeout at every start. The caller polls
+        # is_alive() until overdue() and reads the result once it is done.
+        # Input
+        #   version         Version of this GUI (str)
+        #   cache_file      Path of the JSON file the last result is kept in
+        #   ttl             Scalar (hours a result is reused)
+        #   timeout         Scalar (seconds a request may take)
+        #   retry           Scalar (hours until a failed check is retried)
+        #   max_wait        Scalar (seconds the caller waits for the result)
+        # =================================================================
+        super(ReleaseCheck, self).__init__(daemon=True)
+
+        self.version        = version
+        self.cache_file     = cache_file
+        self.ttl            = ttl * 3600
+        self.timeout        = timeout
+        self.retry          = retry * 3600
+        self.max_wait       = max_wait
+        self.started        = None
+
+        # Result
+        self.latest         = None  # Title of the latest release
+        self.error          = None  # Why the check failed, if it did
+
+
+    def run(self):
+
+        self.started        = time()
+        if self.read_cache():
+            return
+
+        try:
+            from github                 import Github # Slow to import
+            release         = Github(timeout=self.timeout).get_repo(
+                REPOSITORY).get_latest_release()
+            self.latest     = release.title
+        except Exception as e:
+            self.error      = e
+            print('Could not check for a new release: {}'.format(e))
+
+        self.write_cache() # Failures too (latest is None)
+
+
+    def overdue(self):
+        # The caller stops waiting for a check that takes too long
+        return self.started is not None and time() - self.started > self.max_wait
+
+
+    def read_cache(self):
+        # =================================================================
+        # Output:
+        #   cached              Boolean (recent result found, self.latest
+        #                       set from it; None for a failed check)
+        # =================================================================
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache       = load(f)
+            ttl             = self.retry if cache['latest'] is None else self.ttl
+            if time() - cache['checked'] < ttl:
+                self.latest = cache['latest']
+                return True
+        except (OSError, ValueError, KeyError, TypeError):
+            pass # No usable result yet
+        return False
+
+
+    def write_cache(self):
+
+        try:
+            with open(self.cache_file, 'w') as f:
+                dump({'checked': time(), 'latest': self.latest}, f)
+        except OSError as e:
+            print('Could not cache the release check: {}'.format(e))
+
+
+    def newer_release(self):
+        # =================================================================
+        # Output:
+        #   title               Title of the latest release if it is newer
+        #                       than this version, otherwise None
+        # =================================================================
+        if self.latest is None:
+            return None
+        try:
+            if version_tuple(self.latest) > version_tuple(self.version):
+                return self.latest
+        except ValueError:
+            print('Could not compare release "{}" to this version'.format(
+                self.latest))
+        return None
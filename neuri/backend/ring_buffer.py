@@ -0,0 +1,93 @@
+from numpy import zeros, concatenate, arange
+
+
+class RingBuffer():
+
+    def __init__(self, num_chans, capacity, data=None, time_stamps=None):
+        # =================================================================
+        # Fixed-capacity circular buffer for samples and their timestamps.
+        # Writing a sample only touches one column of the preallocated
+        # arrays instead of reallocating the whole buffer.
+        # Input
+        #   num_chans       Scalar (amount of channels)
+        #   capacity        Scalar (amount of samples that are retained)
+        #   data            Optional 2D numpy array [channels x capacity]
+        #                   to write into (e.g. a view on shared memory)
+        #   time_stamps     Optional 1D numpy array [capacity]
+        # =================================================================
+        self.num_chans      = int(num_chans)
+        self.capacity       = int(capacity)
+        if data is None:
+            data            = zeros((self.num_chans, self.capacity))
+        if time_stamps is None:
+            time_stamps     = zeros(self.capacity)
+        self.data           = data
+        self.time_stamps    = time_stamps
+        self.write_idx      = 0 # Column that receives the next sample
+        self.count          = 0 # Total amount of samples ever written
+
+
+    def write(self, sample, time_stamp):
+        # =================================================================
+        # Input:
+        #   sample              1D numpy array [channels] (float)
+        #   time_stamp          Scalar
+        # Output:
+        #   No output
+        # =================================================================
+        self.data[:, self.write_idx]    = sample
+        self.time_stamps[self.write_idx]= time_stamp
+        self.write_idx      = (self.write_idx + 1) % self.capacity
+        self.count          = self.count + 1
+
+
+    def extend(self, block, time_stamps):
+        # =================================================================
+        # Input:
+        #   block               2D numpy array [channels x samples]
+        #   time_stamps         1D numpy array [samples]
+        # Output:
+        #   No output
+        # =================================================================
+        num_samples         = block.shape[1]
+        if num_samples > self.capacity: # Only the newest ones are kept
+            block           = block[:, -self.capacity:]
+            time_stamps     = time_stamps[-self.capacity:]
+        idx                 = (self.write_idx + arange(block.shape[1])) % self.capacity
+        self.data[:, idx]   = block
+        self.time_stamps[idx] = time_stamps
+        self.write_idx      = (self.write_idx + block.shape[1]) % self.capacity
+        self.count          = self.count + num_samples
+
+
+    def latest(self, num_samples=None):
+        # =================================================================
+        # Input:
+        #   num_samples         Scalar (defaults to the full capacity)
+        # Output:
+        #   data                2D numpy array [channels x samples], oldest
+        #                       sample first
+        #   time_stamps         1D numpy array, oldest sample first
+        # =================================================================
+        if num_samples is None or num_samples > self.capacity:
+            num_samples     = self.capacity
+
+        return (ordered_window(self.data, self.write_idx, num_samples),
+                ordered_window(self.time_stamps, self.write_idx, num_samples))
+
+
+def ordered_window(ring, write_idx, num_samples):
+    # =====================================================================
+    # Returns a copy of the last num_samples columns of a circular array
+    # in chronological order.
+    # Input:
+    #   ring                Numpy array, samples along the last axis
+    #   write_idx           Scalar (column that receives the next sample)
+    #   num_samples         Scalar
+    # Output:
+    #   window              Numpy array [..., num_samples]
+    # =====================================================================
+    start               = write_idx - num_samples
+    if start >= 0:
+        return ring[..., start:write_idx].copy()
+    return concatenate((ring[..., start:], ring[..., :write_idx]), axis=-1)
@@ -0,0 +1,67 @@
+from time                               import perf_counter
+
+
+class ChunkedReader():
+
+    def __init__(self, receiver, delimiter=b'\n'):
+        # =================================================================
+        # Reads everything that is waiting at the port in one call and
+        # splits it into complete messages. Bytes of a message that has
+        # not fully arrived yet are carried over to the next read.
+        # Input
+        #   receiver        Opened serial connection (object)
+        #   delimiter       bytes ending each text message
+        # =================================================================
+        self.receiver       = receiver
+        self.delimiter      = delimiter
+        self.carry          = b''
+        self.bytes_read     = 0
+        self.messages_read  = 0
+        self.backlog        = 0 # Bytes that were waiting at the last read
+        self.rate_reset     = perf_counter()
+
+
+    def read_chunk(self):
+        # =================================================================
+        # Output:
+        #   chunk               bytes (blocks until at least one byte
+        #                       arrived, like readline() did)
+        # =================================================================
+        self.backlog        = self.receiver.in_waiting
+        chunk               = self.receiver.read(self.backlog or 1)
+        self.bytes_read    += len(chunk)
+        return chunk
+
+
+    def read_messages(self):
+        # =================================================================
+        # Output:
+        #   messages            List of bytes, all complete messages of
+        #                       the chunk without line endings
+        # =================================================================
+        messages            = (self.carry + self.read_chunk()).split(self.delimiter)
+        self.carry          = messages.pop() # Incomplete (or empty) tail
+        messages            = [m.rstrip(b'\r') for m in messages]
+        self.messages_read += len(messages)
+        return messages
+
+
+    def count_messages(self, num_messages):
+        # For binary frames, which are split by their decoder instead
+        self.messages_read += num_messages
+
+
+    def rates(self):
+        # =================================================================
+        # Output:
+        #   bytes_per_s         Float, since the previous call
+        #   messages_per_s      Float, since the previous call
+        # =================================================================
+        now                 = perf_counter()
+        elapsed             = max(now - self.rate_reset, 1e-9)
+        rates               = (self.bytes_read / elapsed,
+                               self.messages_read / elapsed)
+        self.bytes_read     = 0
+        self.messages_read  = 0
+        self.rate_reset     = now
+        return rates
@@ -0,0 +1,431 @@
+import serial.tools.list_ports
+import os
+import socket
+
+
+class Settings():
+
+    def __init__(self, conf_file=None):
+        # =================================================================
+        # All settings of a session without any GUI toolkit: defaults,
+        # overwritten by the configuration file, and the relay socket.
+        # The settings window (frontend/parameters.py) builds on this
+        # class, the headless daemon (headless.py) uses it directly.
+        # Input
+        #   conf_file       Path of the configuration file (defaults to
+        #                   "settings.cfg" in the working directory)
+        # =================================================================
+        self.conf_file      = os.path.join(".", "settings.cfg") if conf_file is None else conf_file
+        self.version        = '2.82.0' # TO-DO: Find a more elegant way to dynamically define the current version as this line here gets forgotten a lot
+
+        # List elements:
+        # First =   start code (int)
+        #           The start code is the message that will be sent to 
+        #           the boards in order to initiate signal transfer and
+        #           will also define the samples per message. Might have to
+        #           be separated in future
+        # Second    Default sampling rate (int, Hz)
+        # Third     Baud rate (int)
+        self.board_characteristics = {
+            "Neuri V1 by Helment":                  [2, 200, 115200],
+            "Neuri-Lolin S3-PRO by Helment":        [2, 200, 115200],
+            "BioAmp EXG Pill by Upside Down Labs":  [2, 125, 115200]
+        }
+
+        self.set_defaults() # Necessary to execute first in case user 
+                            # parameter not found in configuration file
+        # Loop up user settings
+        self.load_parameters()
+
+        # Build relay connection for other programs
+        self.build_relay(self.udp_ip)
+
+
+    def build_relay(self, ip):
+        # =================================================================
+        # This connection will be used in order to transfer the incoming 
+        # signal from the board to a dynamuically defined port via UDP
+        # =================================================================
+
+        self.udp_port   = self.search_free_com(ip)
+        self.udp_ip     = ip
+        self.send_sock  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP
+        print('Relay connection established at ' + self.udp_ip + ':' + str(self.udp_port))
+        print('Use this connection to import signals in your own program!\n')
+    
+
+    def search_free_com(self, ip):
+
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        for iPort in range(12344, 12350):
+            try:
+                s = s.connect((ip, iPort))
+            except:
+                return iPort
+
+        raise Exception('No available UDP port found for signal relay')
+
+
+    def parse_devices(self, text):
+        # =================================================================
+        # Input:
+        #   text                "port, board[, channels]; ..." as in the
+        #                       configuration file
+        # Output:
+        #   devices             List of [port, board, channels]. Channels
+        #                       default to 1 for the EXG Pill and to
+        #                       AmountChannels for the other boards
+        # =================================================================
+        devices             = []
+        for entry in text.split(';'):
+            fields          = [field.strip() for field in entry.split(',')]
+            if len(fields) < 2 or not fields[0]:
+                continue
+            if len(fields) > 2:
+                num_chans   = int(fields[2])
+            elif "EXG Pill" in fields[1]:
+                num_chans   = 1
+            else:
+                num_chans   = self.max_chans
+            devices.append([fields[0], fields[1], num_chans])
+        return devices
+
+
+    def format_devices(self):
+        return '; '.join(', '.join([port, board, str(num_chans)])
+                         for port, board, num_chans in self.additional_devices)
+
+
+    def load_parameters(self):
+
+        if not os.path.exists(self.conf_file):
+            return
+        
+        with open(self.conf_file, 'r') as f:
+            
+            settings                        = f.readlines()
+            
+            for i, setting in enumerate(settings):
+                # Keys are matched as a whole, values may contain anything
+                # (e.g. paths or board names)
+                key, _, value               = setting.partition('=')
+                key                         = key.strip()
+                if key == 'Darkmode' and 'True' in value:
+                    self.darkmode           = True
+                elif key == 'Darkmode' and 'False' in value:
+                    self.darkmode           = False
+                if key == 'Headless' and 'True' in value:
+                    self.run_headless       = True
+                elif key == 'Headless' and 'False' in value:
+                    self.run_headless       = False
+                elif key == 'AdditionalDevices':
+                    try:
+                        self.additional_devices = self.parse_devices(value)
+                    except:
+                        print("Could not load \"AdditionalDevices\" from configuration")
+                elif key == 'ReleaseCheck' and 'True' in value:
+                    self.release_check      = True
+                elif key == 'ReleaseCheck' and 'False' in value:
+                    self.release_check      = False
+                elif key == 'SamplingRate':
+                    try:
+                        self.sample_rate    = int(value)
+                    except:
+                        print("Could not load \"SamplingRate\" from configuration")
+                elif key == 'AmountChannels':
+                    try:
+                        self.max_chans      = int(value)
+                    except:
+                        print("Could not load \"AmountChannels\" from configuration")
+                elif key == 'TimeRange':
+                    try:
+                        self.buffer_length  = int(value)
+                    except:
+                        print("Could not load \"TimeRange\" from configuration")
+                elif key == 'PGA':
+                    try:
+                        self.PGA            = int(value)
+                    except:
+                        print("Could not load \"PGA\" from configuration")
+                elif key == 'Port':
+                    try:
+                        self.port           = str(value)
+                        if '\n' in self.port:
+                            self.port = self.port.replace('\n', '')
+                        ports = [port.device for port in list(serial.tools.list_ports.comports())]
+                        if len([p for p in ports if p == self.port]) == 0:
+                            self.port = ''
+                    except:
+                        print("Could not load \"Port\" from configuration")
+                elif key == 'Board':
+                    try:
+                        self.board          = str(value)
+                        if '\n' in self.board:
+                            self.board = self.board.replace('\n', '')
+                    except:
+                        print("Could not get board information from configuration")
+                elif key == 'DownsamplingFactor':
+                    try:
+                        self.s_down         = int(value)
+                    except:
+                        print("Could not load \"DownsamplingFactor\" from configuration")
+                elif key == 'RecordingFormat':
+                    self.recording_format   = value.strip()
+                elif key == 'StreamServerAddress':
+                    self.stream_address     = value.strip()
+                elif key == 'ControlAddress':
+                    self.control_address    = value.strip()
+                elif key == 'EnvelopeBand':
+                    self.envelope_band      = value.strip()
+                elif key == 'MetricsFile':
+                    self.metrics_file       = value.strip()
+                elif key == 'RelayFormat':
+                    self.relay_format       = value.strip()
+                elif key == 'RelayBatch':
+                    try:
+                        self.relay_batch    = int(value)
+                    except:
+                        print("Could not load \"RelayBatch\" from configuration")
+                elif key == 'RelayLatency':
+                    try:
+                        self.relay_latency  = float(value)
+                    except:
+                        print("Could not load \"RelayLatency\" from configuration")
+
+        print("Loaded user-defined settings")
+
+        # The channel selection is not stored, all channels are displayed
+        # (one per channel of AmountChannels)
+        if len(self.selected_chans) != self.max_chans:
+            self.selected_chans = [True] * self.max_chans
+
+
+    def save_parameters(self):
+
+        end_line = "\n"
+
+        if not os.path.exists(self.conf_file): # File generation
+
+            with open(self.conf_file, 'w') as f:
+
+                settings = [
+                    "".join(["Darkmode=", str(self.darkmode), end_line]),
+                    "".join(["SamplingRate=", str(self.sample_rate), end_line]),
+                    "".join(["AmountChannels=", str(self.max_chans), end_line]),
+                    "".join(["TimeRange=", str(self.buffer_length), end_line]),
+                    "".join(["PGA=", str(self.PGA), end_line]),
+                    "".join(["Port=", str(self.port), end_line]),
+                    "".join(["Board=", str(self.board), end_line]),
+                    "".join(["DownsamplingFactor=", str(self.s_down), end_line]),
+                    "".join(["Headless=", str(self.run_headless), end_line]),
+                    "".join(["RecordingFormat=", str(self.recording_format), end_line]),
+                    "".join(["RelayFormat=", str(self.relay_format), end_line]),
+                    "".join(["RelayBatch=", str(self.relay_batch), end_line]),
+                    "".join(["RelayLatency=", str(self.relay_latency), end_line]),
+                    "".join(["StreamServerAddress=", str(self.stream_address), end_line]),
+                    "".join(["ControlAddress=", str(self.control_address), end_line]),
+                    "".join(["EnvelopeBand=", str(self.envelope_band), end_line]),
+                    "".join(["MetricsFile=", str(self.metrics_file), end_line]),
+                    "".join(["AdditionalDevices=", self.format_devices(), end_line]),
+                    "".join(["ReleaseCheck=", str(self.release_check), end_line])
+                    ]
+
+                f.write("".join(settings))
+
+        else:
+
+            with open(self.conf_file, 'r') as f:
+            
+                settings                        = f.readlines()
+                
+                for i, setting in enumerate(settings): # Update values
+                    key                         = setting.partition('=')[0].strip()
+                    if key == 'Darkmode':
+                        settings[i]             = "".join(["Darkmode=", str(self.darkmode), end_line])
+                    elif key == 'SamplingRate':
+                        settings[i]             = "".join(["SamplingRate=", str(self.sample_rate), end_line])
+                    elif key == 'AmountChannels':
+                        settings[i]             = "".join(["AmountChannels=", str(self.max_chans), end_line])
+                    elif key == 'TimeRange':
+                        settings[i]             = "".join(["TimeRange=", str(self.buffer_length), end_line])
+                    elif key == 'PGA':
+                        settings[i]             = "".join(["PGA=", str(self.PGA), end_line])
+                    elif key == 'Port':
+                        settings[i]             = "".join(["Port=", str(self.port), end_line])
+                    elif key == 'Board':
+                        settings[i]             = "".join(["Board=", str(self.board), end_line])
+                    elif key == 'DownsamplingFactor':
+                        settings[i]             = "".join(["DownsamplingFactor=", str(self.s_down), end_line])
+                    elif key == 'Headless':
+                        settings[i]             = "".join(["Headless=", str(self.run_headless), end_line])
+                    elif key == 'RecordingFormat':
+                        settings[i]             = "".join(["RecordingFormat=", str(self.recording_format), end_line])
+                    elif key == 'RelayFormat':
+                        settings[i]             = "".join(["RelayFormat=", str(self.relay_format), end_line])
+                    elif key == 'RelayBatch':
+                        settings[i]             = "".join(["RelayBatch=", str(self.relay_batch), end_line])
+                    elif key == 'RelayLatency':
+                        settings[i]             = "".join(["RelayLatency=", str(self.relay_latency), end_line])
+                    elif key == 'StreamServerAddress':
+                        settings[i]             = "".join(["StreamServerAddress=", str(self.stream_address), end_line])
+                    elif key == 'ControlAddress':
+                        settings[i]             = "".join(["ControlAddress=", str(self.control_address), end_line])
+                    elif key == 'EnvelopeBand':
+                        settings[i]             = "".join(["EnvelopeBand=", str(self.envelope_band), end_line])
+                    elif key == 'MetricsFile':
+                        settings[i]             = "".join(["MetricsFile=", str(self.metrics_file), end_line])
+                    elif key == 'AdditionalDevices':
+                        settings[i]             = "".join(["AdditionalDevices=", self.format_devices(), end_line])
+                    elif key == 'ReleaseCheck':
+                        settings[i]             = "".join(["ReleaseCheck=", str(self.release_check), end_line])
+
+                new_settings = []
+                keys         = [setting.partition('=')[0].strip() for setting in settings]
+                if "Darkmode" not in keys:
+                    new_settings.append("".join(["Darkmode=", str(self.darkmode), end_line]))
+                if "SamplingRate" not in keys:
+                    new_settings.append("".join(["SamplingRate=", str(self.sample_rate), end_line]))
+                if "AmountChannels" not in keys:
+                    new_settings.append("".join(["AmountChannels=", str(self.max_chans), end_line]))
+                if "TimeRange" not in keys:
+                    new_settings.append("".join(["TimeRange=", str(self.buffer_length), end_line]))
+                if "PGA" not in keys:
+                    new_settings.append("".join(["PGA=", str(self.PGA), end_line]))
+                if "Port" not in keys:
+                    new_settings.append("".join(["Port=", str(self.port), end_line]))
+                if "Board" not in keys:
+                    new_settings.append("".join(["Board=", str(self.board), end_line]))
+                if "DownsamplingFactor" not in keys:
+                    new_settings.append("".join(["DownsamplingFactor=", str(self.s_down), end_line]))
+                if "Headless" not in keys:
+                    new_settings.append("".join(["Headless=", str(self.run_headless), end_line]))
+                if "RecordingFormat" not in keys:
+                    new_settings.append("".join(["RecordingFormat=", str(self.recording_format), end_line]))
+                if "RelayFormat" not in keys:
+                    new_settings.append("".join(["RelayFormat=", str(self.relay_format), end_line]))
+                if "RelayBatch" not in keys:
+                    new_settings.append("".join(["RelayBatch=", str(self.relay_batch), end_line]))
+                if "RelayLatency" not in keys:
+                    new_settings.append("".join(["RelayLatency=", str(self.relay_latency), end_line]))
+                if "StreamServerAddress" not in keys:
+                    new_settings.append("".join(["StreamServerAddress=", str(self.stream_address), end_line]))
+                if "ControlAddress" not in keys:
+                    new_settings.append("".join(["ControlAddress=", str(self.control_address), end_line]))
+                if "EnvelopeBand" not in keys:
+                    new_settings.append("".join(["EnvelopeBand=", str(self.envelope_band), end_line]))
+                if "MetricsFile" not in keys:
+                    new_settings.append("".join(["MetricsFile=", str(self.metrics_file), end_line]))
+                if "AdditionalDevices" not in keys:
+                    new_settings.append("".join(["AdditionalDevices=", self.format_devices(), end_line]))
+                if "ReleaseCheck" not in keys:
+                    new_settings.append("".join(["ReleaseCheck=", str(self.release_check), end_line]))
+
+            with open(self.conf_file, 'w') as f:
+                f.write("".join(settings + new_settings))
+
+
+    def set_defaults(self):
+
+        self.all_set        = False
+        self.darkmode       = False
+        self.run_headless   = False
+
+        #Release check (see backend/release_check.py)
+        self.release_check  = True # False: never contact GitHub (e.g. air-gapped machines)
+        self.release_cache  = os.path.join(".", "release_check.json") # Last result, next to settings.cfg
+        self.release_ttl    = 24 #scalar (hours the last result is reused before asking again)
+        self.release_timeout= 3 #scalar (seconds a request may take)
+
+        #Session-specific parameters
+        self.yrange         = [-0, 0] # List of scalars ([negative, positive]) in order to set figure y axis range
+        self.notch          = 50 # Integer 0 (Off), 50 (50 Hz) or 60 (60 Hz)
+        self.bpass          = 0 # Integer -1 (Raw), 0 (Detrend) to 6 according to Processing.preset_bands
+        self.dispenv        = False # Boolean 0 (Off), 1 (On)
+        self.set_customsession = False
+        self.sessionName    = 'Neuri_[timestamp]'
+
+        #Signal arrays
+        self.sample_rate    = self.board_characteristics["Neuri V1 by Helment"][1] #Hertz
+        self.max_chans      = 8 #scalar (Max. amount of input channels of board)
+        self.selected_chans = [True] * self.max_chans
+        self.buffer_length  = 10 #scalar (seconds)
+        self.buffer_add     = 4 #scalar (seconds), we add this to the buffer for filtering to avoid edge artifacts
+        self.saving_interval= 1 #scalar (seconds)
+        self.PGA            = 24 #scalar
+
+        #Signal storage
+        self.recording_formats = ['txt', 'binary', 'chunked', 'edf', 'bdf'] # Text (".txt"), binary (".nrec", see backend/recording_formats.py), compressed (".nchk", see backend/chunked_recording.py) or EDF+/BDF+ (".edf"/".bdf", see backend/edf_recording.py)
+        self.recording_format  = 'txt'
+        self.chunk_duration = 10 #scalar (seconds of data per compressed chunk)
+        self.compression    = 'zlib' # 'zlib' (fast) or 'lzma' (smaller files)
+        self.writer_queue   = 32 #scalar (blocks of saving_interval that may wait to be written)
+        self.flush_interval = 1 #scalar (blocks written between two flushes)
+        self.fsync_interval = 10 #scalar (seconds between two syncs to disk)
+        self.gap_fill       = 'linear' # Lost samples are filled in 'linear'ly or by 'hold'ing the last one (see backend/gap_filler.py)
+
+        #Signal reception
+        self.baud_rate      = self.board_characteristics["Neuri V1 by Helment"][2] #scalar default baudrate for connection
+        self.port           = '' #Leave blank
+        self.board          = '' #Leave blank
+        self.start_code     = self.board_characteristics["Neuri V1 by Helment"][0]
+        self.time_out       = None #Wait for message
+        self.additional_devices = [] # List of [port, board, channels] acquired together with the board above (see backend/stream_merger.py)
+        self.merge_delay    = 100 #scalar (ms samples may wait for the slowest additional device)
+
+        # Signal relay
+        self.udp_ip         = "127.0.0.1" # Loopback ip for on-device communication
+        self.relay_formats  = ['json', 'binary'] # One JSON message per sample, or several samples per binary datagram (see backend/relay.py)
+        self.relay_format   = 'json'
+        self.relay_batch    = 10 #scalar (samples per binary datagram)
+        self.relay_latency  = 20 #scalar (ms a sample may wait for its binary datagram to fill)
+        self.stream_address = '' # Stream server for several subscribers (see backend/stream_server.py): "host:port" (TCP), path of a Unix domain socket, or blank (off)
+        self.stream_queue   = 256 #scalar (packets that may wait per subscriber before the oldest ones are dropped)
+        self.envelope_band  = '' # Name of one of the "frequency_bands" below whose amplitude envelope stream server clients can subscribe to (see backend/stream_server.py), blank: off
+        self.control_address= '' # "host:port" (UDP) at which the display filter can be changed at runtime (see backend/control_channel.py), blank: off
+        self.metrics_file   = '' # JSON lines file the acquisition metrics are appended to (see backend/metrics.py), blank: off
+
+        #Plotting
+        # self.plot_intv       = 200 #scalar defining update rate of figure (ms) OBSOLETE PARAMETER
+        self.s_down         = 1 #Desired downsampling factor (buffer_length*sample_rate/s_down must be convertable to integer)
+
+
+        #Signal processing
+        self.filter_order   = 3 #scalar (default order, the GUI and the control channel can change it)
+        self.envelope_cutoff= 2 #scalar (Hz, lowpass smoothing the rectified signal of the envelope)
+        self.frequency_bands= {
+            'LineNoise':    (48, 52),
+            'LineNoise60':  (58, 62),
+            'Sleep':        (1, 30),
+            'Theta':        (4, 8),
+            'Alpha':        (8, 12),
+            'Sigma':        (12, 16),
+            'Gamma':        (30, 45),
+            'Whole':        (0.5, 45)}
+
+
+class StreamingParameter(object):
+    firmfeedback    = 0
+    max_chans       = 0
+    buffer_add      = 0
+    buffer_length   = 0
+    sample_rate     = 0
+    PGA             = 0
+    saving_interval = 0
+    udp_ip          = ""
+    udp_port        = 0
+    board           = ""
+
+    # The class "constructor" - It's actually an initializer 
+    def __init__(self, start_code, max_chans, buffer_add, buffer_length,
+                 sample_rate, PGA, saving_interval, udp_ip, udp_port,
+                 board):
+        self.start_code     = start_code
+        self.max_chans      = max_chans
+        self.buffer_add     = buffer_add
+        self.buffer_length  = buffer_length
+        self.sample_rate    = sample_rate
+        self.PGA            = PGA
+        self.saving_interval= saving_interval
+        self.udp_ip         = udp_ip
+        self.udp_port       = udp_port
+        self.board          = board
@@ -0,0 +1,160 @@
+from multiprocessing                    import shared_memory
+from numpy                              import ndarray, int64, float64
+import sys
+
+from .ring_buffer                       import RingBuffer, ordered_window
+
+
+# Layout of the shared memory block (native byte order)
+#   header          int64 [4]: sequence counter, write index, total amount
+#                   of samples written, last timestamp (microseconds)
+#   time_stamps     float64 [capacity] (ms)
+#   data            float64 [channels x capacity]
+HEADER_FIELDS       = 4
+SEQ, WRITE_IDX, COUNT, LAST_TIME = range(HEADER_FIELDS)
+
+
+class SharedTransport(RingBuffer):
+
+    def __init__(self, num_chans, capacity, name=None):
+        # =================================================================
+        # Ring buffer living in a multiprocessing.shared_memory block. The
+        # sampling process writes every new sample in place and the GUI
+        # process reads a consistent snapshot through NumPy views, without
+        # copying the whole buffer per sample and without a global lock.
+        # Consistency is guaranteed by a sequence counter (seqlock): the
+        # writer makes it odd while writing and even again afterwards, the
+        # reader retries when it changed during its copy.
+        # Input
+        #   num_chans       Scalar (amount of channels)
+        #   capacity        Scalar (amount of samples that are retained)
+        #   name            Name of an existing block to attach to. A new
+        #                   block is allocated when None
+        # =================================================================
+        num_chans           = int(num_chans)
+        capacity            = int(capacity)
+        size                = 8 * (HEADER_FIELDS + capacity + num_chans * capacity)
+
+        self.is_owner       = name is None
+        if self.is_owner:
+            self.shm        = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm        = attach_shared_memory(name)
+
+        self.header         = ndarray((HEADER_FIELDS,), dtype=int64,
+            buffer=self.shm.buf, offset=0)
+        time_stamps         = ndarray((capacity,), dtype=float64,
+            buffer=self.shm.buf, offset=8 * HEADER_FIELDS)
+        data                = ndarray((num_chans, capacity), dtype=float64,
+            buffer=self.shm.buf, offset=8 * (HEADER_FIELDS + capacity))
+
+        if self.is_owner:
+            self.header[:]  = 0
+            time_stamps[:]  = 0
+            data[:]         = 0
+
+        super(SharedTransport, self).__init__(num_chans, capacity,
+            data=data, time_stamps=time_stamps)
+        self.write_idx      = int(self.header[WRITE_IDX])
+        self.count          = int(self.header[COUNT])
+
+
+    def __reduce__(self):
+        # Processes receive the name of the block and attach to it instead
+        # of pickling its content
+        return (SharedTransport, (self.num_chans, self.capacity, self.shm.name))
+
+
+    def write(self, sample, time_stamp):
+        # =================================================================
+        # Input:
+        #   sample              1D numpy array [channels] (float)
+        #   time_stamp          Scalar
+        # Output:
+        #   No output
+        # =================================================================
+        self.header[SEQ]   += 1 # Odd: write in progress
+        super(SharedTransport, self).write(sample, time_stamp)
+        self.header[WRITE_IDX]  = self.write_idx
+        self.header[COUNT]      = self.count
+        self.header[LAST_TIME]  = round(time_stamp * 1000)
+        self.header[SEQ]   += 1 # Even: consistent again
+
+
+    def snapshot(self, num_samples=None, max_retries=100):
+        # =================================================================
+        # Input:
+        #   num_samples         Scalar (defaults to the full capacity)
+        #   max_retries         Scalar (after which the last, possibly
+        #                       torn, copy is returned)
+        # Output:
+        #   data                2D numpy array [channels x samples], oldest
+        #                       sample first
+        #   time_stamps         1D numpy array, oldest sample first
+        #   count               Total amount of samples written so far
+        # =================================================================
+        if num_samples is None or num_samples > self.capacity:
+            num_samples     = self.capacity
+
+        for _ in range(max_retries):
+            seq             = int(self.header[SEQ])
+            if seq % 2 == 1:
+                continue # Writer is busy with this sample
+            write_idx       = int(self.header[WRITE_IDX])
+            count           = int(self.header[COUNT])
+            data            = ordered_window(self.data, write_idx, num_samples)
+            time_stamps     = ordered_window(self.time_stamps, write_idx, num_samples)
+            if int(self.header[SEQ]) == seq:
+                return data, time_stamps, count
+
+        write_idx           = int(self.header[WRITE_IDX])
+        return (ordered_window(self.data, write_idx, num_samples),
+                ordered_window(self.time_stamps, write_idx, num_samples),
+                int(self.header[COUNT]))
+
+
+    def read_since(self, count):
+        # =================================================================
+        # Samples written after the first count ones, for readers that
+        # keep up with the stream instead of copying the whole window
+        # Input:
+        #   count               Scalar (samples the reader has seen)
+        # Output:
+        #   data                2D numpy array [channels x new samples],
+        #                       at most capacity (older ones are lost)
+        #   time_stamps         1D numpy array
+        #   count               Total amount of samples written so far
+        # =================================================================
+        num_new             = max(int(self.header[COUNT]) - count, 0)
+        while True:
+            data, time_stamps, total = self.snapshot(num_new)
+            # Samples may have arrived since COUNT was read: ask again for
+            # all of them unless the snapshot already holds them
+            num_total       = min(total - count, self.capacity)
+            if num_total <= data.shape[1]:
+                first       = data.shape[1] - num_total
+                return data[:, first:], time_stamps[first:], total
+            num_new         = num_total
+
+
+    def last_timestamp(self):
+        return self.header[LAST_TIME] / 1000
+
+
+    def close(self):
+        # Views need to be released before the block can be closed
+        del self.header, self.data, self.time_stamps
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+
+def attach_shared_memory(name):
+    # =====================================================================
+    # Attach to an existing block. Only the owner is allowed to unlink it,
+    # so it is kept away from the resource tracker where Python allows it
+    # (child processes share the tracker of the owner otherwise)
+    # =====================================================================
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
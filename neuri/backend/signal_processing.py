@@ -1,5 +1,14 @@
-from scipy.signal import butter, lfilter_zi, lfilter, hilbert
-from numpy import zeros, pad, abs
+from scipy.signal import butter, sosfilt_zi, sosfilt, hilbert
+from numpy import pad, abs, empty, take, copyto, concatenate, pi
+
+from concurrent.futures                 import ThreadPoolExecutor
+from functools                          import lru_cache
+
+from .ring_buffer                       import RingBuffer
+
+
+MAX_FILTER_ORDER    = 10 # Higher orders only add ringing to the display
+RECTIFIED_GAIN      = pi / 2 # Mean of a rectified sine is 2 / pi of its amplitude
 
 
 class Processing():
@@ -7,64 +16,221 @@ class Processing():
     def __init__(self, parameters):
 
         self.pm                 = parameters
+        self.buffers            = {} # Output arrays reused between frames
         self.prepare_filters()
 
 
     def prepare_filters(self):
 
-        # Bandpass filters
+        # Filters are designed as second-order sections, which stay
+        # stable at high orders and very low cutoffs (0.5 Hz) where the
+        # transfer function form (b, a) loses precision. Designs are
+        # cached (see design_filter()), new ones are built by a worker
+        # thread so that the GUI keeps drawing meanwhile
+        self.designer       = ThreadPoolExecutor(max_workers=1,
+                                                 thread_name_prefix='filter-design')
+
+        # Bands of the bandpass options of the GUI (GUIWidgets.bpass)
+        # -----------------------------------------------------------------
+        bands               = self.pm.frequency_bands
+        self.preset_bands   = {
+            -1: None,                           # Raw signal
+            0:  (bands["Whole"][0], None),      # Detrend (highpass)
+            1:  tuple(bands["Whole"]),
+            2:  tuple(bands["Sleep"]),
+            3:  tuple(bands["Theta"]),
+            4:  tuple(bands["Alpha"]),
+            5:  tuple(bands["Sigma"]),
+            6:  tuple(bands["Gamma"])}
+
+        # Design the presets right away, switching to them does not have
+        # to wait for the worker thread
         # -----------------------------------------------------------------
-        self.b_detrend, self.a_detrend          = butter(
-            self.pm.filter_order, self.pm.frequency_bands["Whole"][0],
-            btype='highpass', fs=self.pm.sample_rate)
-        self.b_wholerange, self.a_wholerange    = butter(
-            self.pm.filter_order, self.pm.frequency_bands["Whole"],
-            btype='bandpass', fs=self.pm.sample_rate)
-        self.b_sleep, self.a_sleep              = butter(
-            self.pm.filter_order, self.pm.frequency_bands["Sleep"],
-            btype='bandpass', fs=self.pm.sample_rate)
-        self.b_theta, self.a_theta              = butter(
-            self.pm.filter_order, self.pm.frequency_bands["Theta"],
-            btype='bandpass', fs=self.pm.sample_rate)
-        self.b_notch, self.a_notch              = butter(
-            self.pm.filter_order, self.pm.frequency_bands["LineNoise"],
-            btype='bandstop', fs=self.pm.sample_rate)
-        self.b_notch60, self.a_notch60          = butter(
-            self.pm.filter_order, self.pm.frequency_bands["LineNoise60"],
-            btype='bandstop', fs=self.pm.sample_rate)
+        for notch in [0, 50, 60]:
+            for band in self.preset_bands.values():
+                try:
+                    self.filter_chain(notch, band)
+                except ValueError as e: # Reported once the option is chosen
+                    print('Filter preset not available: {}'.format(e))
 
         # Determine padding length for signal filtering
         # -----------------------------------------------------------------
-        default_pad     = 3 * max(len(self.a_wholerange), 
-            len(self.b_wholerange))
+        # 3 times the length of (b, a) of the transfer function
+        sos_wholerange      = self.filter_chain(0, self.preset_bands[1])
+        default_pad         = 3 * (2 * sos_wholerange.shape[0] + 1)
         if default_pad > self.pm.buffer_length * self.pm.sample_rate/10-1:
             self.padlen = int(default_pad) # Scipy expects int
         else:
             self.padlen = int(self.pm.buffer_length*self.pm.sample_rate/10-1) # Scipy expects int
 
 
-    def filter_signal(self, signal, b, a):
+    def resolve_filter(self, notch, band, order=None):
+        # =================================================================
+        # Checks a filter setting, e.g. from the GUI or the control channel
+        # Input:
+        #   notch               Scalar (Hz of the stopband centre, 0: off)
+        #   band                Tuple (low, high) in Hz with low None for a
+        #                       lowpass and high None for a highpass, name
+        #                       of one of the frequency_bands, or None (off)
+        #   order               Scalar (defaults to filter_order)
+        # Output:
+        #   notch, band, order  Normalized setting (raises ValueError
+        #                       naming the problem if it can not be used)
+        # =================================================================
+        nyquist             = self.pm.sample_rate / 2
+        if order is None:
+            order           = self.pm.filter_order
+        if int(order) != order or not 1 <= order <= MAX_FILTER_ORDER:
+            raise ValueError('Filter order has to be an integer from 1 to {}'.format(
+                MAX_FILTER_ORDER))
+
+        notch               = float(notch)
+        if notch != 0 and not 0 < self.notch_band(notch)[0] < \
+                self.notch_band(notch)[1] < nyquist:
+            raise ValueError('The stopband around {} Hz has to lie between 0 '
+                             'and {} Hz'.format(notch, nyquist))
+
+        if isinstance(band, str):
+            if band not in self.pm.frequency_bands:
+                raise ValueError('Unknown band "{}". Chose one of: {}'.format(
+                    band, ', '.join(self.pm.frequency_bands.keys())))
+            band            = self.pm.frequency_bands[band]
+        if band is not None:
+            low, high       = [None if f is None else float(f) for f in band]
+            if low is None and high is None:
+                band        = None
+            elif (low is not None and not 0 < low < nyquist) or \
+                 (high is not None and not 0 < high < nyquist) or \
+                 (low is not None and high is not None and low >= high):
+                raise ValueError('Band edges have to increase and lie between 0 '
+                                 'and {} Hz'.format(nyquist))
+            else:
+                band        = (low, high)
+
+        return notch, band, int(order)
+
+
+    def notch_band(self, notch):
+        # =================================================================
+        # Input:
+        #   notch               Scalar (Hz)
+        # Output:
+        #   band                Tuple (low, high) of the stopband: LineNoise
+        #                       and LineNoise60 for 50 and 60 Hz, otherwise
+        #                       as wide as LineNoise around notch
+        # =================================================================
+        bands               = self.pm.frequency_bands
+        if notch == 50:
+            return tuple(float(f) for f in bands["LineNoise"])
+        if notch == 60:
+            return tuple(float(f) for f in bands["LineNoise60"])
+        half_width          = (bands["LineNoise"][1] - bands["LineNoise"][0]) / 2
+        return (notch - half_width, notch + half_width)
+
+
+    def filter_chain(self, notch, band, order=None):
         # =================================================================
         # Input:
-        #   signal              Numpy 1D array [samples]
+        #   notch, band, order  See resolve_filter()
         # Output:
-        #   signal_filtered[0]  1D numpy array of filtered signal where 
-        #                       first sample is 0
+        #   sos                 Notch and band cascaded into second-order
+        #                       sections, or None when both are off
         # =================================================================
-        padded_signal   = pad(signal, (self.padlen, 0), 'symmetric')
-        init_state      = lfilter_zi(b, a) # 1st sample --> 0
-        signal_filtered = lfilter(b, a, padded_signal, 
-            zi=init_state*padded_signal[0])
-        signal_filtered = signal_filtered[0][self.padlen:]
+        notch, band, order  = self.resolve_filter(notch, band, order)
+        sample_rate         = self.pm.sample_rate
+
+        sosSB               = None
+        if notch != 0:
+            sosSB           = design_filter('bandstop', self.notch_band(notch),
+                                            order, sample_rate)
+
+        sosPB               = None
+        if band is not None and band[0] is None:
+            sosPB           = design_filter('lowpass', band[1], order, sample_rate)
+        elif band is not None and band[1] is None:
+            sosPB           = design_filter('highpass', band[0], order, sample_rate)
+        elif band is not None:
+            sosPB           = design_filter('bandpass', band, order, sample_rate)
+
+        return cascade(sosSB, sosPB)
+
+
+    def request_filter_chain(self, notch, band, order=None):
+        # =================================================================
+        # Same as filter_chain(), but designed by the worker thread
+        # Output:
+        #   future              concurrent.futures.Future of the sos (its
+        #                       result() raises the ValueError of an
+        #                       unusable setting)
+        # =================================================================
+        return self.designer.submit(self.filter_chain, notch, band, order)
+
+
+    def streaming_envelope(self, num_chans, band=None):
+        # =================================================================
+        # Input:
+        #   num_chans           Scalar
+        #   band                Band the envelope is taken of (see
+        #                       resolve_filter()), None when the signal is
+        #                       already filtered (display)
+        # Output:
+        #   StreamingEnvelope smoothing the rectified signal below
+        #   envelope_cutoff
+        # =================================================================
+        sos_band            = None
+        if band is not None:
+            sos_band        = self.filter_chain(0, band)
+        sos_smooth          = design_filter('lowpass', float(self.pm.envelope_cutoff),
+            self.pm.filter_order, self.pm.sample_rate)
+        return StreamingEnvelope(num_chans, sos_smooth, sos_band, self.padlen)
+
+
+    def streaming_filter(self, transport):
+        # =================================================================
+        # Input:
+        #   transport           SharedTransport the sampling process
+        #                       writes to
+        # Output:
+        #   StreamingFilter with the padding of this instance
+        # =================================================================
+        return StreamingFilter(transport, self.padlen)
+
+
+    def preallocated(self, name, shape):
+        # Returns the output array kept under name, which is allocated
+        # again only when the shape changes. Its content is overwritten by
+        # the next call of the method that uses it
+        if name not in self.buffers or self.buffers[name].shape != shape:
+            self.buffers[name]  = empty(shape)
+        return self.buffers[name]
+
+
+    def filter_signal(self, signal, sos):
+        # =================================================================
+        # Input:
+        #   signal              Numpy array [samples] or [channels x
+        #                       samples], filtered along the last axis
+        #   sos                 Second-order sections (see filter_chain())
+        # Output:
+        #   signal_filtered     Numpy array of filtered signal where first
+        #                       sample is 0, same dimensions as input
+        # =================================================================
+        signal_filtered, _  = filter_padded(signal, sos, self.padlen)
         return signal_filtered
 
 
     def extract_envelope(self, signal):
-        v_hilbert       = signal
-        for iChan in range(signal.shape[0]):
-            # padded_signal   = np.pad(signal[iChan,], (self.padlen, self.padlen), 'symmetric')
-            # hilbert[iChan,] = np.abs(scipy.signal.hilbert(padded_signal))[self.padlen:-self.padlen]
-            v_hilbert[iChan,] = abs(hilbert(signal[iChan,]))
+        # =================================================================
+        # Input:
+        #   signal              Numpy array [channels x samples]
+        # Output:
+        #   v_hilbert           Numpy array of the amplitude envelope,
+        #                       same dimensions as input
+        # =================================================================
+        # padded_signal   = np.pad(signal, ((0, 0), (self.padlen, self.padlen)), 'symmetric')
+        # hilbert         = np.abs(scipy.signal.hilbert(padded_signal, axis=1))[:, self.padlen:-self.padlen]
+        v_hilbert       = self.preallocated('envelope', signal.shape)
+        abs(hilbert(signal, axis=1), out=v_hilbert)
         return v_hilbert
 
 
@@ -77,47 +243,272 @@ class Processing():
         #                       dimensions as input buffer
         # =================================================================
 
-        downsampled_signal  = zeros((buffer.shape[0], int(buffer.shape[1]/s_down)))
-        idx_retain = range(0, buffer.shape[1], s_down)
-        for iChan in range(self.pm.max_chans):
-            # downsampled_signal[iChan,] = scipy.signal.decimate(buffer[iChan,], s_down)
-            downsampled_signal[iChan,] = buffer[iChan,idx_retain]
+        idx_retain          = range(0, buffer.shape[1], s_down)
+        downsampled_signal  = self.preallocated('downsampled',
+                                                (buffer.shape[0], len(idx_retain)))
+        # downsampled_signal = scipy.signal.decimate(buffer, s_down, axis=1)
+        take(buffer, idx_retain, axis=1, out=downsampled_signal)
 
         return downsampled_signal
 
 
-    def prepare_buffer(self, buffer, bSB, aSB, bPB, aPB):
+    def prepare_buffer(self, buffer, sos):
         # =================================================================
         # Input:
         #   buffer              Numpy array [channels x samples]
-        #   bSB, aSB            Filter coefficients as put out by 
-        #                       scipy.signal.butter (Stopband)
-        #   bPB, aPB            Filter coefficients as put out by 
-        #                       scipy.signal.butter (Passband)
+        #   sos                 Notch and bandpass cascaded into second-
+        #                       order sections (see filter_chain()), or None
         # Output:
         #   filtered_buffer     Numpy array of filtered signal, same  
         #                       dimensions as input buffer
         # =================================================================
-        x_shape             = buffer.shape
+        # All channels are filtered at once along the samples axis, notch
+        # and bandpass in a single pass
+        filtered_buffer     = self.preallocated('filtered', buffer.shape)
+        if sos is not None:
+            copyto(filtered_buffer, self.filter_signal(buffer, sos))
+        else:
+            copyto(filtered_buffer, buffer)
 
-        noise_free_signal   = zeros(x_shape)
-        filtered_buffer     = zeros(x_shape)
-        for iChan in range(x_shape[0]):
+        return filtered_buffer
 
-            # Reject ambiant electrical noise (at 50 Hz)
-            # -------------------------------------------------------------
-            if all(bSB != None):
-                noise_free_signal[iChan,] = self.filter_signal(
-                    buffer[iChan,], bSB, aSB)
-            else:
-                noise_free_signal[iChan,] = buffer[iChan,]
 
-            # Extract useful frequency range
-            # -------------------------------------------------------------
-            if all(bPB != None):
-                filtered_buffer[iChan,] = self.filter_signal(
-                    noise_free_signal[iChan,], bPB, aPB)
-            else:
-                filtered_buffer[iChan,] = noise_free_signal[iChan,]
+@lru_cache(maxsize=128)
+def design_filter(btype, band, order, sample_rate):
+    # =====================================================================
+    # Memoized filter design: toggling between bands only designs every
+    # band once. The returned array is shared by all callers and must not
+    # be changed (it can not be flagged read-only, sosfilt() refuses
+    # read-only sections)
+    # Input:
+    #   btype               'bandpass', 'bandstop', 'highpass' or 'lowpass'
+    #   band                Tuple (low, high) or scalar (Hz), hashable
+    #   order               Scalar
+    #   sample_rate         Scalar (Hz)
+    # Output:
+    #   sos                 Numpy array [sections x 6]
+    # =====================================================================
+    return butter(order, band, btype=btype, fs=sample_rate, output='sos')
+
+
+def cascade(*chain):
+    # =====================================================================
+    # Input:
+    #   chain               Second-order sections of the filters to apply
+    #                       one after the other, None for filters that are
+    #                       off
+    # Output:
+    #   sos                 Numpy array [sections x 6] of the whole chain,
+    #                       or None when all filters are off
+    # =====================================================================
+    sections            = [sos for sos in chain if sos is not None]
+    if len(sections) == 0:
+        return None
+    return concatenate(sections, axis=0)
+
+
+def filter_padded(signal, sos, padlen):
+    # =====================================================================
+    # Input:
+    #   signal              Numpy array [... x samples], filtered along the
+    #                       last axis after padlen samples of symmetric
+    #                       padding, with a state that brings the first
+    #                       sample to 0
+    #   sos                 Second-order sections (scipy.signal.butter)
+    #   padlen              Scalar
+    # Output:
+    #   filtered            Numpy array, same dimensions as signal
+    #   state               Final state of the filter (zi of the next
+    #                       block of samples)
+    # =====================================================================
+    padding             = [(0, 0)] * (signal.ndim - 1) + [(padlen, 0)]
+    padded              = pad(signal, padding, 'symmetric')
+    # zi: [sections x ... x 2], 1st sample --> 0
+    init_state          = sosfilt_zi(sos).reshape(
+        (sos.shape[0],) + (1,) * (signal.ndim - 1) + (2,)) * padded[..., 0, None]
+    filtered, state     = sosfilt(sos, padded, axis=-1, zi=init_state)
+    return filtered[..., padlen:], state
+
+
+class StreamingFilter():
+
+    def __init__(self, transport, padlen):
+        # =================================================================
+        # Display filtering that only processes the samples added since
+        # the last call. The state of the stopband and passband filters is
+        # kept for every channel between calls, and the filtered samples
+        # go to a ring buffer of the same size as the transport. The whole
+        # window is only filtered again, like prepare_buffer() does it,
+        # after the filters were changed (set_filters()) or when more
+        # samples arrived than the buffer holds.
+        # Input
+        #   transport       SharedTransport the sampling process writes to
+        #   padlen          Scalar (samples of symmetric padding before the
+        #                   window when it is filtered from scratch)
+        # =================================================================
+        self.transport      = transport
+        self.padlen         = padlen
+        self.filtered       = RingBuffer(transport.num_chans, transport.capacity)
+        self.count          = 0     # Samples of the transport filtered so far
+        self.state          = None  # None: filter the whole window next time
+        self.sos            = None  # Filter chain in use (see filter_chain())
+        self.envelope       = None  # StreamingEnvelope of the filtered samples
+        self.enveloped      = None  # Ring buffer of their envelope
+
+
+    def set_filters(self, sos):
+        # =================================================================
+        # Input:
+        #   sos                 Notch and bandpass cascaded into second-
+        #                       order sections (see filter_chain()), or None
+        # Output:
+        #   No output
+        # =================================================================
+        self.sos            = sos
+        self.state          = None
+
+
+    def set_envelope(self, envelope):
+        # =================================================================
+        # Input:
+        #   envelope            StreamingEnvelope that follows the filtered
+        #                       samples from now on (see envelope_window()),
+        #                       or None
+        # Output:
+        #   No output
+        # =================================================================
+        self.envelope       = envelope
+        if envelope is None:
+            self.enveloped  = None
+            return
+        filtered, time_stamps = self.filtered.latest()
+        self.enveloped      = RingBuffer(self.filtered.num_chans, self.filtered.capacity)
+        self.enveloped.extend(envelope.start(filtered), time_stamps)
+
+
+    def envelope_window(self):
+        # =================================================================
+        # Output:
+        #   envelope            2D numpy array [channels x capacity] of the
+        #                       amplitude envelope, aligned with the window
+        #                       update() returned last
+        #   time_stamps         1D numpy array
+        # =================================================================
+        return self.enveloped.latest()
+
+
+    def update(self):
+        # =================================================================
+        # Output:
+        #   filtered_buffer     2D numpy array [channels x capacity],
+        #                       oldest sample first
+        #   time_stamps         1D numpy array
+        # =================================================================
+        data, time_stamps, count = self.transport.read_since(self.count)
+        if self.state is None or count - self.count > self.transport.capacity:
+            data, time_stamps, count = self.transport.snapshot()
+            filtered        = self.filter_window(data)
+            self.filtered.extend(filtered, time_stamps)
+            if self.envelope is not None:
+                self.enveloped.extend(self.envelope.start(filtered), time_stamps)
+        elif data.shape[1] > 0:
+            filtered        = self.filter_block(data)
+            self.filtered.extend(filtered, time_stamps)
+            if self.envelope is not None:
+                self.enveloped.extend(self.envelope.process(filtered), time_stamps)
+        self.count          = count
+        return self.filtered.latest()
+
+
+    def filter_window(self, window):
+        # =================================================================
+        # Filters a whole window from scratch (see filter_signal()) and
+        # keeps the final state of the filter chain
+        # Input:
+        #   window              2D numpy array [channels x samples]
+        # Output:
+        #   filtered            2D numpy array [channels x samples]
+        # =================================================================
+        if self.sos is None:
+            self.state      = ()    # Nothing to carry over
+            return window
+        window, self.state  = filter_padded(window, self.sos, self.padlen)
+        return window
+
+
+    def filter_block(self, block):
+        # =================================================================
+        # Input:
+        #   block               2D numpy array [channels x new samples]
+        # Output:
+        #   filtered            2D numpy array [channels x new samples]
+        # =================================================================
+        if self.sos is None:
+            return block
+        block, self.state   = sosfilt(self.sos, block, axis=1, zi=self.state)
+        return block
+
+
+class StreamingEnvelope():
+
+    def __init__(self, num_chans, sos_smooth, sos_band=None, padlen=0):
+        # =================================================================
+        # Amplitude envelope that only processes new samples: the signal
+        # is bandpass filtered (optional), rectified and smoothed by a
+        # lowpass, with the state of both filters kept between calls.
+        # Unlike the Hilbert transform of extract_envelope(), no FFT of
+        # the whole window is needed, at the cost of the delay of the
+        # lowpass. The input is never written to.
+        # Input
+        #   num_chans       Scalar
+        #   sos_smooth      Second-order sections of the lowpass
+        #   sos_band        Second-order sections of the band the envelope
+        #                   is taken of, None if the input is filtered
+        #                   already
+        #   padlen          Scalar (see filter_padded(), used by start())
+        # =================================================================
+        self.num_chans      = int(num_chans)
+        self.sos_smooth     = sos_smooth
+        self.sos_band       = sos_band
+        self.padlen         = padlen
+        self.band_state     = None  # None: starts at the first sample
+        self.smooth_state   = None
+
+
+    def start(self, window):
+        # =================================================================
+        # Envelope of a whole window computed from scratch (e.g. after the
+        # display filter changed), following blocks continue from it
+        # Input:
+        #   window              2D numpy array [channels x samples]
+        # Output:
+        #   envelope            2D numpy array [channels x samples]
+        # =================================================================
+        if self.sos_band is not None:
+            window, self.band_state = filter_padded(window, self.sos_band,
+                                                    self.padlen)
+        envelope, self.smooth_state = filter_padded(abs(window),
+            self.sos_smooth, self.padlen)
+        envelope           *= RECTIFIED_GAIN
+        return envelope
+
+
+    def process(self, block):
+        # =================================================================
+        # Input:
+        #   block               2D numpy array [channels x new samples]
+        # Output:
+        #   envelope            2D numpy array [channels x new samples]
+        # =================================================================
+        if block.shape[1] == 0:
+            return empty(block.shape)
+        if self.smooth_state is None:
+            return self.start(block)
 
-        return filtered_buffer
\ No newline at end of file
+        if self.sos_band is not None:
+            block, self.band_state = sosfilt(self.sos_band, block, axis=1,
+                                             zi=self.band_state)
+        envelope, self.smooth_state = sosfilt(self.sos_smooth, abs(block),
+            axis=1, zi=self.smooth_state)
+        envelope           *= RECTIFIED_GAIN
+        return envelope
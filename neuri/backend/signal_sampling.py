@@ -1,9 +1,20 @@
-from json import loads, dumps, decoder
+from json import loads, decoder
 from time import sleep, perf_counter
 #import random
-from numpy import expand_dims, concatenate, fromiter, append, array, zeros, reshape
-from threading                          import Thread
+from numpy import expand_dims, fromiter, array, asarray, trunc, where, int64, concatenate, empty, uint8
 from datetime                           import datetime
+from .wire_protocol                     import BinaryFrameDecoder, SYNC
+from .serial_reader                     import ChunkedReader
+from .recording_formats                 import TextRecording, BinaryRecording
+from .chunked_recording                 import ChunkedRecording
+from .edf_recording                     import EdfRecording
+from .data_writer                       import DataWriter
+from .relay                             import JsonRelay, BinaryRelay
+from .stream_server                     import StreamServer
+from .clock_sync                        import SampleClock, LossDetector, LOSS_WINDOW
+from .gap_filler                        import GapFiller
+from .ring_buffer                       import RingBuffer
+from .stream_merger                     import StreamMerger
 
 
 class Sampling():
@@ -11,19 +22,81 @@ class Sampling():
     def __init__(self, parameter):
 
         #Output
+        if parameter.recording_format == 'binary':
+            extension   = BinaryRecording.extension
+        elif parameter.recording_format == 'chunked':
+            extension   = ChunkedRecording.extension
+        elif parameter.recording_format == 'edf':
+            extension   = EdfRecording.extension
+        elif parameter.recording_format == 'bdf':
+            extension   = '.bdf'
+        else:
+            extension   = TextRecording.extension
         t0              = str(datetime.now())
         t0              = t0.replace(':', '_')
         if parameter.set_customsession:
-            file_name   = parameter.sessionName + '.txt'
+            file_name   = parameter.sessionName + extension
         else:
-            file_name   = 'Neuri ' + t0 + '.txt'
+            file_name   = 'Neuri ' + t0 + extension
 
         # Prepare data output
         self.output_file= file_name
 
-        with open(self.output_file, 'w', encoding= "utf_8") as file:
-            file.write("Session Started\n")
-            file.close() # Important for data to get written
+        # Channels of additional devices follow the ones of the board in
+        # the merged stream (see stream_merger.py)
+        self.num_chans  = parameter.max_chans + sum(
+            num_chans for _, _, num_chans in parameter.additional_devices)
+        self.merge_delay= parameter.merge_delay
+
+        # Samples are converted by the process of the device they come
+        # from, so every channel keeps the scaling of its own board
+        divisors        = self.channel_divisors(parameter)
+
+        if parameter.recording_format == 'binary':
+            self.recording  = BinaryRecording(self.output_file,
+                self.num_chans, parameter.sample_rate, parameter.PGA,
+                parameter.board)
+        elif parameter.recording_format == 'chunked':
+            self.recording  = ChunkedRecording(self.output_file,
+                self.num_chans, parameter.sample_rate, parameter.PGA,
+                parameter.board, divisors,
+                parameter.chunk_duration, parameter.compression)
+        elif parameter.recording_format in ['edf', 'bdf']:
+            self.recording  = EdfRecording(self.output_file,
+                self.num_chans, parameter.sample_rate, parameter.board,
+                divisors, parameter.saving_interval,
+                16 if parameter.recording_format == 'edf' else 24)
+        else:
+            self.recording  = TextRecording(self.output_file)
+        self.recording.create()
+
+        # Settings of the writer thread, that is started by the sampling
+        # process itself
+        self.writer_queue   = parameter.writer_queue
+        self.flush_interval = parameter.flush_interval
+        self.fsync_interval = parameter.fsync_interval
+
+        # Settings of the relay to downstream programs
+        self.relay_format   = parameter.relay_format
+        self.relay_batch    = parameter.relay_batch
+        self.relay_latency  = parameter.relay_latency
+        self.stream_address = parameter.stream_address
+        self.stream_queue   = parameter.stream_queue
+
+        # Amplitude envelope the subscribers of the stream server may ask
+        # for, computed block by block in the sampling process
+        self.envelope       = None
+        if parameter.envelope_band and self.stream_address:
+            from .signal_processing import Processing # Loads scipy
+            self.envelope   = Processing(parameter).streaming_envelope(
+                self.num_chans, parameter.envelope_band)
+
+        # JSON lines file the acquisition metrics are appended to once per
+        # saving interval (blank: off)
+        self.metrics_file   = parameter.metrics_file
+
+        # Filling of lost samples ('linear' or 'hold')
+        self.gap_fill       = parameter.gap_fill
 
 
     def bin_to_voltage(self, s_bin, pga, board_code):
@@ -56,6 +129,60 @@ class Sampling():
 
             #voltage = random.randrange(-200, 200)
             return voltage
+
+
+    def voltage_divisor(self, pga, board_code):
+        # =================================================================
+        # Per-board scale factor of bin_to_voltage_block(), to be computed
+        # once per session
+        # Input
+        #   pga         Scalar (gain of the amplifier)
+        #   board_code  Scalar
+        # Output
+        #   divisor     Float (None when the board sends voltages already)
+        # =================================================================
+        if board_code == 1:
+            return None
+        return pga*8388607.0
+
+
+    def channel_divisors(self, parameter):
+        # =================================================================
+        # Output
+        #   divisors    List [channels of the merged stream] of
+        #               voltage_divisor() of the board each channel comes
+        #               from (the board first, then the additional devices,
+        #               which share its PGA)
+        # =================================================================
+        board_code  = 1 if "EXG Pill" in parameter.board else 0
+        divisors    = [self.voltage_divisor(parameter.PGA, board_code)] * parameter.max_chans
+        for _, board, num_chans in parameter.additional_devices:
+            board_code = 1 if "EXG Pill" in board else 0
+            divisors += [self.voltage_divisor(parameter.PGA, board_code)] * num_chans
+        return divisors
+
+
+    def bin_to_voltage_block(self, s_bin, divisor):
+        # =================================================================
+        # Vectorized bin_to_voltage() over whole blocks of samples. Results
+        # are bit-exact with the scalar conversion, since the same floating
+        # point operations are applied in the same order
+        # Input
+        #   s_bin       Numpy array [channels x samples] of raw counts
+        #   divisor     Output of voltage_divisor()
+        # Output
+        #   voltage     Numpy array (float, microvolts), same dimensions
+        # =================================================================
+        if divisor is None:
+            return asarray(s_bin, dtype=float)
+
+        counts      = trunc(s_bin).astype(int64)
+        # 24-bit two's complement, out-of-range values are set to 0
+        sign_bit    = where(counts > 8388607, counts - 2*8388607 - 1, counts)
+        sign_bit[(counts <= 0) | (counts > 2*8388607)] = 0
+
+        voltage     = (4.5*sign_bit)/divisor
+        return voltage * 1000000 # Convert to microvolts
     
 
     def messge_to_samples(self, str_message, s_chans, board_code):
@@ -83,8 +210,8 @@ class Sampling():
             try:
                 chanDict        = loads(str_message)
             except decoder.JSONDecodeError:
-                # Corrupt message: not all channels present
-                print("Skipped message")
+                # Corrupt message: not all channels present. Counted as a
+                # lost sample by the GapFiller
                 return eeg_array, eeg_valid
 
             if len(chanDict) != s_chans:
@@ -110,7 +237,47 @@ class Sampling():
             return eeg_array, eeg_valid
     
 
+    def parse_messages(self, messages, s_chans, board_code):
+        # =================================================================
+        # Input
+        #   messages    List of bytes (complete messages of the port)
+        #   s_chans     (int) Channels per sample
+        #   board_code  (int) Defines code pipeline based on board type
+        # Output
+        #   samples         Numpy array [channels x samples] of the valid
+        #                   messages
+        #   missing_before  List (messages that could not be read directly
+        #                   before each sample, see GapFiller.fill())
+        #   missing_after   Scalar (unreadable messages after the last one)
+        # =================================================================
+        valid_samples       = []
+        missing_before      = []
+        missing_after       = 0
+        for raw_message in messages:
+            if not raw_message.strip():
+                continue
+            samples, valid_eeg = self.messge_to_samples(
+                raw_message.decode('utf-8', errors='ignore'),
+                s_chans, board_code)
+            if valid_eeg:
+                valid_samples.append(samples)
+                missing_before += [missing_after] + [0] * (samples.shape[1] - 1)
+                missing_after = 0
+            else:
+                missing_after += 1
+
+        if len(valid_samples) == 0:
+            return empty((s_chans, 0)), missing_before, missing_after
+        return concatenate(valid_samples, axis=1), missing_before, missing_after
+
+
     def setup_neuri_board(self, receiver, start_code):
+        # =================================================================
+        # Wake up the board and detect which wire format it streams in
+        # Output:
+        #   wire_format         'json' (text messages) or 'binary'
+        #                       (frames, see wire_protocol.py)
+        # =================================================================
         # TO-DO: These functions below do not empty the buffer at the 
         # port as they are supposed to do
         receiver.flush()
@@ -121,7 +288,11 @@ class Sampling():
         board_booting = True
         print('Board is booting up ...')
         while board_booting:
-            raw_message = str(receiver.readline())
+            raw_bytes   = receiver.readline()
+            if SYNC in raw_bytes:
+                print('Fully started (binary frames)')
+                return 'binary'
+            raw_message = str(raw_bytes)
             print(raw_message)
             if 'Listening ...' in raw_message:
                 receiver.write(bytes(str(start_code), 'utf-8')) # Try again
@@ -130,18 +301,17 @@ class Sampling():
                 print('Fully started')
                 board_booting = False
 
+        return 'json'
 
-    def fetch_sample(self, receiver, transmitter, parameter, shared_buffer,
-                     shared_timestamp, gui_running):
+
+    def fetch_sample(self, receiver, transmitter, parameter, shared_transport,
+                     gui_running, metrics, devices=()):
 
         if "Neuri" in parameter.board:
             board_code      = 0
-            s_per_buffer    = 1
             if parameter.start_code == 3:
-                s_per_buffer    = 10
                 print('Ordered board to send data via Bluetooth. Switching mode ...')
         elif "EXG Pill" in parameter.board:
-            s_per_buffer    = 1 # all boards
             board_code      = 1
             print('Ordered board to send data via USB. Switching mode ...')
 
@@ -150,101 +320,248 @@ class Sampling():
             # Open communication ----------------------------------------------
             sleep(1)
 
+            wire_format         = 'json' # Fallback for all boards
             if board_code == 0:
-                self.setup_neuri_board(r, parameter.start_code)
+                wire_format     = self.setup_neuri_board(r, parameter.start_code)
 
             # Prealloate values of loop ---------------------------------------
-            start_time          = int(perf_counter() * 1000)
+            start_time          = perf_counter() * 1000
             time_stamp_now      = int(perf_counter() * 1000) # Do NOT copy from start_time (will generate pointer)
-            time_reset          = int(perf_counter() * 1000) # Do NOT copy from start_time (will generate pointer)
+            time_reset          = 0.0 # Relative to start_time, like time_stamp_now
+            last_arrival        = perf_counter()
             sample_count        = int(0)
+            clock               = SampleClock(parameter.sample_rate)
             
-            buffer              = zeros((parameter.max_chans, 
-                (parameter.buffer_length + parameter.buffer_add) * parameter.sample_rate))
-            time_stamps         = zeros(parameter.buffer_length * parameter.sample_rate, dtype=int)
-            pga                 = parameter.PGA
+            # Samples are written in place into a circular buffer living in
+            # shared memory, so that every new sample costs O(channels) and
+            # the frontend reads it without any further copy
+            ring                = shared_transport
+            divisor             = self.voltage_divisor(parameter.PGA, board_code)
             s_chans             = parameter.max_chans
             sampling_rate       = parameter.sample_rate
             saving_interval     = parameter.saving_interval * parameter.sample_rate
-            update_buffer       = zeros((buffer.shape[0], buffer.shape[1]+1))
-            update_times        = zeros((buffer.shape[1]+1), dtype=int)
 
-            # Preallocate json relay message and relay connection
-            relay_array         = {}
-            relay_array["t"]    = ''
-            for iC in range(s_chans):
-                relay_array["".join(["c", str(iC+1)])] = ''
-            udp_ip              = parameter.udp_ip
-            udp_port            = parameter.udp_port
+            # Relay connection: one JSON message per sample, or several
+            # samples per binary datagram
+            if self.relay_format == 'binary':
+                relay           = BinaryRelay(transmitter,
+                    (parameter.udp_ip, parameter.udp_port), self.num_chans,
+                    self.relay_batch, self.relay_latency)
+            else:
+                relay           = JsonRelay(transmitter,
+                    (parameter.udp_ip, parameter.udp_port), self.num_chans)
+
+            # Additional devices are acquired by processes of their own
+            # (acquire_device()) and merged on the timestamps of this board
+            merger              = None
+            if len(devices) > 0:
+                # (devices on the text protocol hold their batches back
+                # for the LossDetector)
+                merger          = StreamMerger(devices, start_time,
+                    self.merge_delay + LOSS_WINDOW * 1000)
+
+            decoder             = BinaryFrameDecoder(s_chans)
+            reader              = ChunkedReader(r)
+            gap_filler          = GapFiller(s_chans, self.gap_fill)
+            loss_detector       = LossDetector(clock, s_chans)
+            quality_ring        = RingBuffer(1, saving_interval)
+
+            # A single writer appends all blocks to the output file
+            self.writer         = DataWriter(self.recording,
+                self.writer_queue, self.flush_interval, self.fsync_interval)
+            self.writer.start()
+
+            # Optional local server that streams to several subscribers
+            stream_server       = None
+            if self.stream_address:
+                stream_server   = StreamServer(self.stream_address, self.num_chans,
+                    self.stream_queue, self.envelope is not None)
+                stream_server.start()
 
             for _ in range(1,000):
                 r.read(r.inWaiting())
                 # Eliminate message queue at port, do this several times to get
                 # everything since buffer that we get with inWaiting is limited
                 
-            while gui_running.value == 1:
-                
-                raw_message             = str(r.readline())
-
-                buffer_in, valid_eeg    = self.messge_to_samples(
-                    raw_message, s_chans, board_code)
-
-                if not valid_eeg:
-                    # TO-DO: Implement an interpolation system
-                    continue
-
-                # Current timestamp -------------------------------------------
-                time_stamp_now          = int(perf_counter() * 1000) - start_time
-                # This will generate unchanged time_stamps for all samples of 
-                # the incoming bufer (= 10 in case of bluetooth), but that is
-                # not a problem
-
-                # Each channel carries self.s_per_buffer amounts of samples 
-                # (theoretically). Since parts of messages can be lost, we 
-                # soft-set the amount of samples after checking for data 
-                # integrity during data_checkpoint()
-                for iS in range(s_per_buffer):
+            try:
+                while gui_running.value == 1:
 
-                    sample_count        = sample_count + 1
+                    relay.poll() # Send samples that waited long enough
+                
+                    # Handle everything that arrived at the port in one batch.
+                    # Lost samples are detected from the frame counters, or
+                    # from the messages that could not be read and the
+                    # timing of the ones that arrived
+                    missing_after           = 0
+                    if wire_format == 'binary':
+                        chunk               = reader.read_chunk()
+                        t_parse             = perf_counter()
+                        buffer_in, counters = decoder.feed(chunk)
+                        reader.count_messages(buffer_in.shape[1])
+                        missing_before      = gap_filler.missing_from_counters(counters)
+                        t_arrival           = t_parse * 1000 - start_time
+                    else:
+                        messages            = reader.read_messages()
+                        t_parse             = perf_counter()
+                        buffer_in, missing_before, missing_after = \
+                            self.parse_messages(messages, s_chans, board_code)
+                        # Lines that never arrived leave no trace but the
+                        # timing of the next ones: batches are held back
+                        # until it is known where samples went missing
+                        buffer_in, missing_before, t_arrival = \
+                            loss_detector.push(buffer_in, missing_before,
+                                missing_after, t_parse * 1000 - start_time)
+                        missing_after       = 0
+
+                    if buffer_in.shape[1] == 0:
+                        # Lost samples still count for the next block
+                        gap_filler.fill(buffer_in, missing_before, missing_after)
+                        continue
+
+                    # Convert binary to voltage values for the whole batch,
+                    # then put the lost samples back in
+                    t_convert               = perf_counter()
+                    buffer_in               = self.bin_to_voltage_block(buffer_in, divisor)
+                    buffer_in, quality      = gap_filler.fill(buffer_in,
+                                                missing_before, missing_after)
+                    t_relay                 = perf_counter()
+                    metrics.stage('parse', t_convert - t_parse)
+                    metrics.stage('convert', t_relay - t_convert)
+                    metrics.arrival((t_parse - last_arrival) * 1000)
+                    last_arrival            = t_parse
+                    t_write                 = 0.0
+
+                    # Timestamps --------------------------------------------------
+                    # Samples of the batch (= 10 in case of bluetooth, or more
+                    # when several messages were waiting) arrive at the same
+                    # time. Their timestamps are derived from their index
+                    # instead, mapped to the host clock by SampleClock
+                    time_stamp_now          = t_arrival
+                    time_stamps_in          = clock.stamp(buffer_in.shape[1],
+                                                          time_stamp_now)
+                    if merger is not None:
+                        buffer_in, time_stamps_in, quality = merger.merge(
+                            buffer_in, time_stamps_in, quality)
+
+                    if stream_server is not None:
+                        envelope_in         = None
+                        if self.envelope is not None:
+                            envelope_in     = self.envelope.process(buffer_in)
+                        stream_server.publish(buffer_in, time_stamps_in, envelope_in)
+
+                    for iS in range(buffer_in.shape[1]):
+
+                        sample_count        = sample_count + 1
                     
-                    sample              = buffer_in[:, iS]
+                        sample              = buffer_in[:, iS]
+
+                        # Update shared memory allocations for frontend
+                        ring.write(sample, time_stamps_in[iS])
+                        quality_ring.write(quality[iS:iS+1], time_stamps_in[iS])
+
+                        # Make data available for downstream programs
+                        relay.send(sample, time_stamps_in[iS])
+
+                        # Write out samples to file -----------------------------------
+                        if sample_count == saving_interval:
+
+                            t_save              = perf_counter()
+                            buffer, time_stamps = ring.latest(saving_interval)
+                            flags, _            = quality_ring.latest(saving_interval)
+
+                            metrics.set('sample_rate', self.calc_sample_rate(
+                                time_stamp_now, time_reset, sampling_rate))
+                            self.collect_metrics(metrics, reader, decoder,
+                                clock, gap_filler, stream_server)
+                            if self.metrics_file:
+                                metrics.dump(self.metrics_file)
+                            metrics.reset_peaks()
+
+                            self.master_write_data(buffer, time_stamps, 
+                                saving_interval, flags[0].astype(uint8))
+                            sample_count        = 0
+                            time_reset          = time_stamp_now
+                            t_write             = perf_counter() - t_save
+                            metrics.stage('write', t_write)
+
+                    metrics.stage('relay', perf_counter() - t_relay - t_write)
+                    metrics.add('samples', buffer_in.shape[1])
+                    metrics.add('batches')
+                    metrics.set('serial_backlog', reader.backlog)
+                    metrics.publish()
+            finally:
+                relay.flush()
+                if stream_server is not None:
+                    stream_server.stop()
+                self.writer.stop() # Flushes everything that is still queued
+
+            r.write(bytes(str(0), 'utf-8')) # Set board into standby
+            sleep(1)
+            return
 
-                    # Convert binary to voltage values
-                    for iBin in range(s_chans):
-                        sample[iBin]    = self.bin_to_voltage(sample[iBin], pga, board_code)
-                        relay_array["".join(["c", str(iBin+1)])] = str(sample[iBin])
 
-                    update_buffer       = concatenate((buffer, expand_dims(sample, 1)), axis=1)
-                    update_times        = append(time_stamps, time_stamp_now)
+    def acquire_device(self, receiver, parameter, shared_transport,
+                       gui_running):
+        # =================================================================
+        # Acquisition worker of an additional device, run in a process of
+        # its own. Samples go to the device's SharedTransport with
+        # timestamps on the host clock (perf_counter, ms), from where
+        # fetch_sample() merges them into the stream of the main board.
+        # Input
+        #   receiver            Serial connection of the device (object)
+        #   parameter           StreamingParameter of the device
+        #   shared_transport    SharedTransport [channels of the device]
+        #   gui_running         multiprocessing.Value
+        # =================================================================
+        board_code          = 1 if "EXG Pill" in parameter.board else 0
 
-                    # Build new buffer and timestamp arrays
-                    buffer              = update_buffer[:, 1:]
-                    time_stamps         = update_times[1:]
+        with receiver as r:
 
-                    # Make data available for downstream programs
-                    transmitter.sendto(bytes(dumps(relay_array), "utf-8"), (udp_ip, udp_port))
+            sleep(1)
+            wire_format     = 'json'
+            if board_code == 0:
+                wire_format = self.setup_neuri_board(r, parameter.start_code)
 
-                    # Update shared memory allocations for frontend
-                    shared_buffer[:] = reshape(buffer, buffer.size) # Has left edge for filtering
-                    shared_timestamp.value = time_stamp_now
+            s_chans         = parameter.max_chans
+            divisor         = self.voltage_divisor(parameter.PGA, board_code)
+            clock           = SampleClock(parameter.sample_rate)
+            decoder         = BinaryFrameDecoder(s_chans)
+            reader          = ChunkedReader(r)
+            gap_filler      = GapFiller(s_chans, self.gap_fill)
+            loss_detector   = LossDetector(clock, s_chans)
 
-                    # Write out samples to file -----------------------------------
-                    if sample_count == saving_interval:
+            while gui_running.value == 1:
 
-                        self.calc_sample_rate(time_stamp_now, time_reset, 
-                                            sampling_rate, time_stamps)
+                missing_after       = 0
+                if wire_format == 'binary':
+                    buffer_in, counters = decoder.feed(reader.read_chunk())
+                    missing_before  = gap_filler.missing_from_counters(counters)
+                    t_arrival       = perf_counter() * 1000
+                else:
+                    buffer_in, missing_before, missing_after = \
+                        self.parse_messages(reader.read_messages(), s_chans,
+                                            board_code)
+                    buffer_in, missing_before, t_arrival = \
+                        loss_detector.push(buffer_in, missing_before,
+                            missing_after, perf_counter() * 1000)
+                    missing_after   = 0
+
+                if buffer_in.shape[1] == 0:
+                    gap_filler.fill(buffer_in, missing_before, missing_after)
+                    continue
 
-                        self.master_write_data(buffer, time_stamps, 
-                            saving_interval, self.output_file)
-                        sample_count        = 0
-                        time_reset          = time_stamp_now
+                buffer_in           = self.bin_to_voltage_block(buffer_in, divisor)
+                buffer_in, _        = gap_filler.fill(buffer_in,
+                                        missing_before, missing_after)
+                time_stamps_in      = clock.stamp(buffer_in.shape[1], t_arrival)
+                for iS in range(buffer_in.shape[1]):
+                    shared_transport.write(buffer_in[:, iS], time_stamps_in[iS])
 
             r.write(bytes(str(0), 'utf-8')) # Set board into standby
             sleep(1)
-            return
 
 
-    def headless_sampling(self, shared_buffer, shared_timestamp):
+    def headless_sampling(self, shared_transport):
         # Python's multiprocessing's Pipe() is sending and receiving data 
         # in blocking mode. That means if a sender is putting data in the 
         # memory buffer, but no consumer is receiving it, the sending of 
@@ -254,55 +571,55 @@ class Sampling():
 
 
     def master_write_data(self, eeg_data, time_stamps, saving_interval,
-        output_file):
+                          quality=None):
         # =================================================================
         # Input:
         #   eeg_data            2D numpy array [channels x samples] (float)
         #   time_stamps         1D numpy array (float)
         #   saving_interval     Scalar
-        #   output_file         Character string
+        #   quality             1D numpy array (uint8, 1 = filled sample)
         # Output:
         #   No output
         # =================================================================
         new_buffer          = eeg_data[:, -saving_interval:]
         new_time_stamps     = time_stamps[-saving_interval:]
-            
-        save_thread = Thread(target=self.write_data_thread,
-            args=(new_buffer, new_time_stamps, output_file))
-        save_thread.start()
+        if quality is not None:
+            quality         = quality[-saving_interval:]
+
+        # Blocks when the writer falls behind by more than writer_queue
+        # blocks
+        self.writer.put(new_buffer, new_time_stamps, quality)
 
 
-    def calc_sample_rate(self, curr_time, prev_iter_time, sample_rate, time_stamps):
+    def calc_sample_rate(self, curr_time, prev_iter_time, sample_rate):
 
         time_diff           = curr_time - prev_iter_time
         # It took (time_diff) ms to fetch (sample_rate) samples.
-        # Calculate actual sampling rate
+        # Calculate actual sampling rate, shown by the frontend and kept
+        # in the metrics file
         actual_sr           = int((sample_rate / (time_diff / 1000)))
-        print('%d ms: Writing data (sampling rate = %d Hz)' %
-            (time_stamps[-1], actual_sr))
+        return actual_sr
 
 
-    def write_data_thread(self, eeg_data, time_stamps, output_file):
+    def collect_metrics(self, metrics, reader, decoder, clock, gap_filler,
+                        stream_server):
         # =================================================================
-        # Input:
-        #   eeg_data            2D numpy array [channels x samples] (float)
-        #   time_stamps         1D numpy array (float)
-        #   output_file         Character string
-        # Output:
-        #   No output
+        # Statistics of the parts of the pipeline into the registry, once
+        # per saving interval (see metrics.py for the fields)
         # =================================================================
-        # Append the data points to the end of the file
-        with open(output_file, 'a', encoding= "utf_8") as file:
-            buffer_length = time_stamps.shape[0]
-
-            for sample_index in range(buffer_length):
-                # Format time stamp
-                time_stamp      = time_stamps[sample_index]
-                # format eeg data
-                eeg_data_points = eeg_data[:,sample_index].tolist()
-                eeg_data_points = [str(value) for value in eeg_data_points]
-                eeg_data_points = ",".join(eeg_data_points)
-                
-                # Write line to file
-                file.write(f"{time_stamp}, {eeg_data_points} \n")
-            file.close() # Important for data to get written
\ No newline at end of file
+        bytes_per_s, messages_per_s = reader.rates() # Resets both counters
+        metrics.set('serial_bytes_per_s', bytes_per_s)
+        metrics.set('serial_messages_per_s', messages_per_s)
+        metrics.set('lost_samples',     gap_filler.filled_total)
+        metrics.set('lost_per_minute',  gap_filler.drop_rate())
+        metrics.set('frames_rejected',  decoder.frames_rejected)
+        metrics.set('writer_queue',     self.writer.queue_depth())
+        metrics.set('writer_latency_ms',self.writer.last_latency * 1000)
+        metrics.set('writer_stalls',    self.writer.stalls)
+        metrics.set('clock_rate',       clock.rate())
+        metrics.set('clock_drift_ppm',  clock.drift())
+        metrics.set('clock_jitter_ms',  clock.jitter())
+        if stream_server is not None:
+            clients, dropped = stream_server.stats()
+            metrics.set('stream_clients', clients)
+            metrics.set('stream_dropped', dropped)
@@ -0,0 +1,151 @@
+from numpy import (concatenate, empty, zeros, ones, searchsorted, clip,
+                   maximum, uint8)
+
+
+class DeviceStream():
+
+    def __init__(self, transport):
+        # =================================================================
+        # Samples of one additional device read so far, kept until no
+        # later sample of the primary device can fall before them
+        # Input
+        #   transport       SharedTransport the acquisition worker of the
+        #                   device writes to (timestamps: perf_counter, ms)
+        # =================================================================
+        self.transport      = transport
+        self.num_chans      = transport.num_chans
+        self.count          = 0 # Samples of the device read so far
+        self.data           = empty((self.num_chans, 0))
+        self.time_stamps    = empty(0)
+
+
+    def pull(self, time_offset):
+        # Appends everything the worker has written since the last call
+        data, time_stamps, self.count = self.transport.read_since(self.count)
+        if data.shape[1] == 0:
+            return
+        self.data           = concatenate((self.data, data), axis=1)
+        self.time_stamps    = concatenate((self.time_stamps,
+                                           time_stamps - time_offset))
+
+
+    def latest(self):
+        return self.time_stamps[-1] if self.time_stamps.shape[0] else None
+
+
+    def resample(self, time_stamps):
+        # =================================================================
+        # Linear interpolation of the device at the given times
+        # Input:
+        #   time_stamps         1D numpy array (ms, session time)
+        # Output:
+        #   data                2D numpy array [channels x samples]
+        #   outside             1D boolean numpy array, True where no
+        #                       sample of the device surrounds the time
+        #                       (the nearest one is held)
+        # =================================================================
+        num_samples         = time_stamps.shape[0]
+        if self.time_stamps.shape[0] == 0:
+            return zeros((self.num_chans, num_samples)), ones(num_samples, dtype=bool)
+
+        last                = self.time_stamps.shape[0] - 1
+        right               = clip(searchsorted(self.time_stamps, time_stamps), 0, last)
+        left                = maximum(right - 1, 0)
+        span                = self.time_stamps[right] - self.time_stamps[left]
+        span[span == 0]     = 1
+        weight              = clip((time_stamps - self.time_stamps[left]) / span, 0, 1)
+        data                = self.data[:, left] + (self.data[:, right] - self.data[:, left]) * weight
+        outside             = (time_stamps < self.time_stamps[0]) | (time_stamps > self.time_stamps[-1])
+        return data, outside
+
+
+    def trim(self, time_stamp):
+        # Drops the samples that are no longer needed to interpolate at
+        # time_stamp or later (one sample before it is kept)
+        first               = max(searchsorted(self.time_stamps, time_stamp) - 1, 0)
+        self.data           = self.data[:, first:]
+        self.time_stamps    = self.time_stamps[first:]
+
+
+class StreamMerger():
+
+    def __init__(self, transports, time_offset, max_delay=100):
+        # =================================================================
+        # Merges additional devices into the stream of the primary device.
+        # Every additional device has its own acquisition process writing
+        # to a SharedTransport, with timestamps on the host clock. The
+        # primary device defines the common sample grid: its samples are
+        # held back until every device has delivered samples up to their
+        # time, and the devices are then linearly interpolated at the
+        # timestamps of the primary samples, which also resamples devices
+        # running at another rate. Samples are released after max_delay
+        # even when a device lags behind; the values of that device are
+        # then held and flagged like lost samples in the quality mask.
+        # Input
+        #   transports      List of SharedTransport (one per device)
+        #   time_offset     Scalar (perf_counter time in ms that the
+        #                   session timestamps of the primary device count
+        #                   from)
+        #   max_delay       Scalar (ms a sample of the primary device may
+        #                   wait for the others)
+        # =================================================================
+        self.devices        = [DeviceStream(t) for t in transports]
+        self.time_offset    = time_offset
+        self.max_delay      = max_delay
+        self.num_chans      = sum(d.num_chans for d in self.devices)
+
+        # Samples of the primary device waiting for the others
+        self.data           = None
+        self.time_stamps    = empty(0)
+        self.quality        = zeros(0, dtype=uint8)
+
+        # Counters
+        self.held           = 0 # Device values held for lack of samples
+
+
+    def merge(self, eeg_data, time_stamps, quality):
+        # =================================================================
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples] of the
+        #                       primary device
+        #   time_stamps         1D numpy array (ms)
+        #   quality             1D numpy array (uint8, see GapFiller)
+        # Output:
+        #   eeg_data            2D numpy array [channels of all devices x
+        #                       samples], primary device first, of all
+        #                       samples that are ready (may be none)
+        #   time_stamps         1D numpy array (ms)
+        #   quality             1D numpy array (uint8)
+        # =================================================================
+        if self.data is None:
+            self.data       = empty((eeg_data.shape[0], 0))
+        self.data           = concatenate((self.data, eeg_data), axis=1)
+        self.time_stamps    = concatenate((self.time_stamps, time_stamps))
+        self.quality        = concatenate((self.quality, quality))
+
+        for device in self.devices:
+            device.pull(self.time_offset)
+
+        # Everything up to the slowest device is ready, everything older
+        # than max_delay in any case
+        latest              = [device.latest() for device in self.devices]
+        ready_until         = min(l if l is not None else -float('inf') for l in latest)
+        deadline            = self.time_stamps[-1] - self.max_delay
+        num_ready           = int(searchsorted(self.time_stamps,
+                                               max(ready_until, deadline), 'right'))
+
+        ready_times         = self.time_stamps[:num_ready]
+        blocks              = [self.data[:, :num_ready]]
+        ready_quality       = self.quality[:num_ready].copy()
+        for device in self.devices:
+            data, outside   = device.resample(ready_times)
+            blocks.append(data)
+            ready_quality[outside] = 1
+            self.held      += int(outside.sum())
+            if num_ready > 0:
+                device.trim(ready_times[-1])
+
+        self.data           = self.data[:, num_ready:]
+        self.time_stamps    = self.time_stamps[num_ready:]
+        self.quality        = self.quality[num_ready:]
+        return concatenate(blocks, axis=0), ready_times, ready_quality
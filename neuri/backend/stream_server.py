@@ -0,0 +1,278 @@
+from numpy import arange, asarray
+from threading                          import Thread, Event
+from collections                        import deque
+from json                               import loads
+import asyncio
+import os
+from .relay                             import (encode_relay_packet,
+                                                decode_relay_packet,
+                                                PACKET_HEADER)
+
+
+# Clients connect over TCP ("host:port") or a Unix domain socket (path)
+# and may send one subscription line right after connecting, e.g.
+#   {"channels": [1, 2, 5], "downsample": 2, "envelope": true}\n
+# (channels counted from 1 like the "c1", "c2", ... keys of the JSON relay,
+# all channels and no downsampling when omitted; "envelope" asks for the
+# amplitude envelope in EnvelopeBand instead of the signal, when the
+# settings define one). The server then streams
+# packets of the binary relay layout (see relay.py) to the client. Every
+# client has its own queue of max_queue packets: when a client reads too
+# slowly, its oldest packets are dropped, which shows as a gap in the
+# sequence numbers it receives.
+SUBSCRIPTION_TIMEOUT= 1 # Seconds to wait for the subscription line
+STOP_TIMEOUT        = 5 # Seconds stop() waits for the server thread
+
+
+def parse_address(address):
+    # =====================================================================
+    # Output:
+    #   host, port          For TCP addresses ("127.0.0.1:12360")
+    #   path, None          For Unix domain sockets ("/tmp/neuri.sock")
+    # =====================================================================
+    host, _, port       = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address, None
+
+
+class StreamClient():
+
+    def __init__(self, writer, num_chans, subscription, max_queue):
+        # =================================================================
+        # Input
+        #   writer          asyncio.StreamWriter (object)
+        #   num_chans       Scalar
+        #   subscription    Dictionnary sent by the client
+        #   max_queue       Scalar (packets)
+        # =================================================================
+        channels            = subscription.get("channels", [])
+        channels            = [int(c) - 1 for c in channels if 1 <= int(c) <= num_chans]
+        if len(channels) == 0:
+            channels        = list(range(num_chans))
+
+        self.writer         = writer
+        self.channels       = channels
+        self.downsample     = max(int(subscription.get("downsample", 1)), 1)
+        self.envelope       = bool(subscription.get("envelope", False))
+        self.queue          = deque(maxlen=max_queue)
+        self.ready          = asyncio.Event()
+        self.sequence       = 0
+        self.dropped        = 0
+
+
+    def select(self, eeg_data, time_stamps, sample_index):
+        # =================================================================
+        # Subscribed channels of every downsample-th sample, counted over
+        # the whole session so that the spacing stays regular across
+        # blocks
+        # Output:
+        #   eeg_data            2D numpy array [samples x channels]
+        #   first_time          Scalar (ms), None when no sample is left
+        # =================================================================
+        first               = (-sample_index) % self.downsample
+        picked              = arange(first, eeg_data.shape[1], self.downsample)
+        if picked.shape[0] == 0:
+            return None, None
+        return eeg_data[self.channels][:, picked].T, time_stamps[first]
+
+
+    def push(self, packet):
+
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped   += 1 # Oldest packet is pushed out
+        self.queue.append(packet)
+        self.ready.set()
+
+
+class StreamServer(Thread):
+
+    def __init__(self, address, num_chans, max_queue=256, envelope=False):
+        # =================================================================
+        # Local streaming server hosted by the sampling process. It runs an
+        # asyncio event loop in its own thread, so that slow or many
+        # clients never hold up sampling: publish() only hands the block
+        # over to the loop.
+        # Input
+        #   address         "host:port" (TCP) or path (Unix domain socket)
+        #   num_chans       Scalar
+        #   max_queue       Scalar (packets that may wait per client)
+        #   envelope        Boolean (publish() also gets the envelope)
+        # =================================================================
+        super(StreamServer, self).__init__(daemon=True)
+
+        self.address        = address
+        self.num_chans      = int(num_chans)
+        self.max_queue      = max_queue
+        self.envelope       = envelope
+        self.clients        = set()
+        self.loop           = None
+        self.server         = None
+        self.started        = Event()
+        self.sample_index   = 0
+        self.dropped_closed = 0 # Drops of clients that disconnected
+
+
+    def run(self):
+
+        self.loop           = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.server     = self.loop.run_until_complete(self.start_server())
+            print('Stream server listening at {}'.format(self.address))
+        except (OSError, NotImplementedError) as e:
+            print('Stream server could not be started at {}: {}'.format(self.address, e))
+            self.server     = None
+
+        self.started.set()
+        if self.server is None:
+            self.loop.close()
+            return
+
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.shutdown())
+            self.loop.close()
+
+
+    async def start_server(self):
+
+        host, port          = parse_address(self.address)
+        if port is not None:
+            return await asyncio.start_server(self.handle_client, host, port)
+
+        if os.path.exists(host): # Left over by a previous session
+            os.remove(host)
+        return await asyncio.start_unix_server(self.handle_client, path=host)
+
+
+    async def shutdown(self):
+
+        self.server.close()
+        await self.server.wait_closed()
+        for client in list(self.clients):
+            client.writer.close()
+        tasks               = [t for t in asyncio.all_tasks(self.loop)
+                               if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        _, port             = parse_address(self.address)
+        if port is None and os.path.exists(self.address):
+            os.remove(self.address)
+
+
+    async def handle_client(self, reader, writer):
+
+        try:
+            line            = await asyncio.wait_for(reader.readline(),
+                SUBSCRIPTION_TIMEOUT)
+            subscription    = loads(line) if line.strip() else {}
+            client          = StreamClient(writer, self.num_chans,
+                subscription, self.max_queue)
+        except (asyncio.TimeoutError, ValueError, TypeError, AttributeError):
+            # No or unreadable subscription: stream everything
+            client          = StreamClient(writer, self.num_chans, {},
+                self.max_queue)
+        if client.envelope and not self.envelope:
+            print('Stream client asked for the envelope, but no EnvelopeBand is set')
+            writer.close()
+            return
+        self.clients.add(client)
+
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                while client.queue:
+                    writer.write(client.queue.popleft())
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass # Client disconnected
+        except asyncio.CancelledError:
+            pass # Server shut down
+        finally:
+            self.clients.discard(client)
+            self.dropped_closed += client.dropped
+            writer.close()
+
+
+    def publish(self, eeg_data, time_stamps, envelope=None):
+        # =================================================================
+        # Called by the sampling loop for every block of new samples
+        # Input:
+        #   eeg_data            2D numpy array [channels x samples]
+        #                       (microvolts), not modified afterwards
+        #   time_stamps         1D numpy array (ms)
+        #   envelope            2D numpy array [channels x samples] of the
+        #                       amplitude envelope (microvolts), None when
+        #                       the server was created without
+        # Output:
+        #   No output
+        # =================================================================
+        if self.server is None or not self.loop.is_running():
+            return
+        self.loop.call_soon_threadsafe(self.fan_out, eeg_data,
+            asarray(time_stamps), self.sample_index, envelope)
+        self.sample_index  += eeg_data.shape[1]
+
+
+    def fan_out(self, eeg_data, time_stamps, sample_index, envelope=None):
+
+        for client in self.clients:
+            source          = envelope if client.envelope else eeg_data
+            data, first_time = client.select(source, time_stamps, sample_index)
+            if data is None:
+                continue
+            client.push(encode_relay_packet(client.sequence,
+                int(round(first_time * 1000)), data))
+            client.sequence+= 1
+
+
+    def stats(self):
+        # =================================================================
+        # Output:
+        #   num_clients         Scalar
+        #   dropped             Scalar (packets dropped for slow clients)
+        # =================================================================
+        clients             = list(self.clients)
+        return len(clients), self.dropped_closed + sum(c.dropped for c in clients)
+
+
+    def stop(self):
+
+        if self.ident is None: # Never started
+            return
+        # The server may still be starting up (e.g. the sampling loop
+        # failed right away): wait for it, a stop scheduled before
+        # run_forever() ends it as soon as it runs
+        self.started.wait(STOP_TIMEOUT)
+        if self.server is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+            except RuntimeError:
+                pass # Closed in the meantime
+        self.join(STOP_TIMEOUT)
+        if self.is_alive():
+            print('Stream server did not stop within {} s'.format(STOP_TIMEOUT))
+
+
+def read_stream_packet(stream):
+    # =====================================================================
+    # For clients of the stream server
+    # Input:
+    #   stream              File-like object of the connection, e.g.
+    #                       socket.makefile('rb')
+    # Output:
+    #   Output of relay.decode_relay_packet(), None when the connection
+    #   was closed
+    # =====================================================================
+    header              = stream.read(PACKET_HEADER.size)
+    if len(header) < PACKET_HEADER.size:
+        return None
+    _, _, _, num_chans, num_samples = PACKET_HEADER.unpack(header)
+    data                = stream.read(4 * num_chans * num_samples)
+    return decode_relay_packet(header + data)
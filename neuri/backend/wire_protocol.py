@@ -0,0 +1,139 @@
+from numpy import (frombuffer, flatnonzero, arange, zeros, empty, diff,
+                   searchsorted, uint8, int32, uint16, array)
+
+
+# Framed binary mode of the Neuri boards. One frame carries one sample of
+# all channels:
+#   offset      size    content
+#   0           2       sync bytes 0xA5 0x5A
+#   2           2       sample counter (uint16, big endian, wraps around)
+#   4           1       amount of channels N
+#   5           3*N     raw counts per channel (24 bit, big endian), the
+#                       same unsigned representation as in the JSON mode
+#   5+3*N       1       checksum: sum of bytes 2 to 4+3*N modulo 256
+SYNC                = b'\xa5\x5a'
+HEADER_LENGTH       = 5
+
+
+def frame_length(num_chans):
+    return HEADER_LENGTH + 3 * num_chans + 1
+
+
+def encode_frames(counts, first_counter=0):
+    # =====================================================================
+    # Build frames as sent by the boards (used for simulations/benchmarks)
+    # Input:
+    #   counts              2D numpy array [channels x samples] of raw
+    #                       unsigned 24-bit counts
+    #   first_counter       Scalar (sample counter of the first frame)
+    # Output:
+    #   frames              bytes
+    # =====================================================================
+    counts              = array(counts, dtype=int32)
+    num_chans, num_samples = counts.shape
+    frame_len           = frame_length(num_chans)
+
+    frames              = zeros((num_samples, frame_len), dtype=uint8)
+    counters            = (first_counter + arange(num_samples)) % 65536
+    frames[:, 0]        = SYNC[0]
+    frames[:, 1]        = SYNC[1]
+    frames[:, 2]        = counters >> 8
+    frames[:, 3]        = counters & 0xFF
+    frames[:, 4]        = num_chans
+    payload             = frames[:, HEADER_LENGTH:-1].reshape(num_samples, num_chans, 3)
+    payload[:, :, 0]    = (counts.T >> 16) & 0xFF
+    payload[:, :, 1]    = (counts.T >> 8) & 0xFF
+    payload[:, :, 2]    = counts.T & 0xFF
+    frames[:, -1]       = frames[:, 2:-1].sum(axis=1, dtype=int32) % 256
+
+    return frames.tobytes()
+
+
+class BinaryFrameDecoder():
+
+    def __init__(self, num_chans):
+        # =================================================================
+        # Parses all complete frames of a chunk of bytes at once. Bytes of
+        # an incomplete frame at the end of a chunk are carried over to
+        # the next call.
+        # Input
+        #   num_chans       Scalar (amount of channels per frame)
+        # =================================================================
+        self.num_chans      = int(num_chans)
+        self.frame_len      = frame_length(self.num_chans)
+        self.offsets        = arange(self.frame_len)
+        self.carry          = b''
+        self.frames_decoded = 0
+        self.frames_rejected= 0 # Corrupt frames (sync word found outside
+                                # of the frames that were accepted)
+
+
+    def feed(self, chunk):
+        # =================================================================
+        # Input:
+        #   chunk               bytes, as read from the port
+        # Output:
+        #   counts              2D numpy array [channels x samples] (float)
+        #                       of raw counts, to be passed on to
+        #                       Sampling.bin_to_voltage_block()
+        #   counters            1D numpy array [samples] of sample counters
+        # =================================================================
+        data                = self.carry + bytes(chunk)
+        raw                 = frombuffer(data, dtype=uint8)
+        last_start          = len(raw) - self.frame_len
+
+        starts              = flatnonzero(
+            (raw[:-1] == SYNC[0]) & (raw[1:] == SYNC[1]))
+        starts              = starts[starts <= last_start]
+
+        frames              = raw[starts[:, None] + self.offsets]
+        checksums           = frames[:, 2:-1].sum(axis=1, dtype=int32) % 256
+        valid               = ((frames[:, 4] == self.num_chans) &
+                               (checksums == frames[:, -1]))
+        rejected            = starts[~valid]
+        starts              = starts[valid]
+        frames              = frames[valid]
+
+        # Sync bytes can also show up inside a payload. Frames must not
+        # overlap, which they only do in that (rare) case
+        if len(starts) > 1 and (diff(starts) < self.frame_len).any():
+            keep            = []
+            next_start      = 0
+            for i, start in enumerate(starts):
+                if start >= next_start:
+                    keep.append(i)
+                    next_start = start + self.frame_len
+            starts          = starts[keep]
+            frames          = frames[keep]
+
+        # Sync bytes inside the payload of a frame that was accepted are
+        # no corrupt frames, and the ones inside a corrupt frame belong to
+        # that same frame
+        if len(rejected) > 0 and len(starts) > 0:
+            previous        = searchsorted(starts, rejected, side='right') - 1
+            inside          = (previous >= 0) & (rejected < starts[previous] + self.frame_len)
+            rejected        = rejected[~inside]
+        next_start          = 0
+        for start in rejected:
+            if start >= next_start:
+                self.frames_rejected += 1
+                next_start  = start + self.frame_len
+
+        # Keep whatever could still be the beginning of a frame
+        if len(starts) > 0:
+            consumed        = max(int(starts[-1]) + self.frame_len, last_start + 1)
+        else:
+            consumed        = max(last_start + 1, 0)
+        self.carry          = data[consumed:]
+
+        num_frames          = len(starts)
+        self.frames_decoded+= num_frames
+        if num_frames == 0:
+            return empty((self.num_chans, 0)), empty(0, dtype=uint16)
+
+        payload             = frames[:, HEADER_LENGTH:-1].reshape(
+            num_frames, self.num_chans, 3).astype(int32)
+        counts              = (payload[:, :, 0] << 16) | (payload[:, :, 1] << 8) | payload[:, :, 2]
+        counters            = (frames[:, 2].astype(int32) << 8) | frames[:, 3]
+
+        return counts.T.astype(float), counters.astype(uint16)
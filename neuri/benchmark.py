@@ -0,0 +1,657 @@
+from numpy import concatenate, zeros, arange, array_split, uint8, int64
+from numpy.random                       import default_rng
+from scipy.signal                       import hilbert
+from tempfile                           import TemporaryDirectory
+from time                               import perf_counter
+from json                               import loads, dumps
+from types                              import SimpleNamespace
+import argparse
+import platform
+import socket
+import numpy
+import os
+
+from .backend.signal_sampling           import Sampling
+from .backend.serial_reader             import ChunkedReader
+from .backend.wire_protocol             import encode_frames, BinaryFrameDecoder
+from .backend.board_simulator           import (voltage_to_counts,
+                                                neuri_messages,
+                                                exg_pill_messages)
+from .backend.ring_buffer               import RingBuffer
+from .backend.shared_transport          import SharedTransport
+from .backend.relay                     import JsonRelay, BinaryRelay
+from .backend.gap_filler                import GapFiller
+from .backend.clock_sync                import SampleClock
+from .backend.data_writer               import DataWriter
+from .backend.recording_formats         import TextRecording, BinaryRecording
+from .backend.chunked_recording         import ChunkedRecording
+from .backend.edf_recording             import EdfRecording
+from .backend.signal_processing         import Processing
+
+
+# Stages of the sampling loop (Sampling.fetch_sample), each measured on its
+# own, and the whole loop from the bytes at the port to the recording
+STAGES              = ['parse', 'convert', 'buffer', 'shared', 'relay',
+                       'writer', 'end_to_end']
+CHANNELS            = [1, 8, 16, 32, 64]
+DISPLAY_STAGES      = ['filter', 'envelope', 'downsample']
+DISPLAY_CHANNELS    = [1, 8, 16, 32, 64, 128]
+BOARD_CODES         = [0, 1] # 0: Neuri (JSON or binary frames), 1: EXG Pill
+PGA                 = 24
+SAMPLE_RATE         = 200
+
+
+class PipelineBenchmark():
+
+    def __init__(self, num_samples=10000, repeats=3, batch_size=10,
+                 wire_format='json', relay_format='json',
+                 recording_format='binary', saving_interval=SAMPLE_RATE):
+        # =================================================================
+        # Maximum sustainable throughput (samples/s) of every stage of the
+        # acquisition pipeline. Each stage processes the same stream of
+        # num_samples samples repeats times, the fastest run counts. As
+        # long as the samples/s of the whole loop stay above the sampling
+        # rate of the board, data does not pile up at the serial port.
+        # Input
+        #   num_samples     Scalar (samples per run)
+        #   repeats         Scalar (runs per stage)
+        #   batch_size      Scalar (messages read from the port at once,
+        #                   10 for the Bluetooth bursts)
+        #   wire_format     'json' or 'binary' (Neuri boards)
+        #   relay_format    'json' or 'binary'
+        #   recording_format 'txt', 'binary', 'chunked', 'edf' or 'bdf'
+        #   saving_interval Scalar (samples per block handed to the writer)
+        # =================================================================
+        self.num_samples    = int(num_samples)
+        self.repeats        = int(repeats)
+        self.batch_size     = int(batch_size)
+        self.wire_format    = wire_format
+        self.relay_format   = relay_format
+        self.recording_format = recording_format
+        self.saving_interval= int(saving_interval)
+
+        # Only the methods of Sampling that do not depend on the settings
+        # are used, so no Parameters (and no GUI toolkit) are needed
+        self.sampling       = Sampling.__new__(Sampling)
+        self.rng            = default_rng(0)
+
+        # Relayed datagrams go to a local socket that is never read, which
+        # drops them once its buffer is full, like an absent receiver
+        self.receiver       = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(('127.0.0.1', 0))
+        self.transmitter    = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.address        = self.receiver.getsockname()
+
+
+    def settings(self):
+        return {"num_samples":      self.num_samples,
+                "repeats":          self.repeats,
+                "batch_size":       self.batch_size,
+                "wire_format":      self.wire_format,
+                "relay_format":     self.relay_format,
+                "recording_format": self.recording_format,
+                "saving_interval":  self.saving_interval}
+
+
+    def synthetic_stream(self, num_chans, board_code):
+        # =================================================================
+        # Output:
+        #   stream              bytes as they arrive at the port
+        #   counts              2D numpy array [channels x samples] of the
+        #                       values the board sends
+        # =================================================================
+        t                   = arange(self.num_samples) / SAMPLE_RATE
+        voltage             = 50 * numpy.sin(2 * numpy.pi * 10 * t) \
+            + self.rng.normal(0, 5, (num_chans, self.num_samples))
+        if board_code == 1:
+            messages        = exg_pill_messages(voltage[0])
+            return b''.join(m + b'\r\n' for m in messages), \
+                array_of_messages(messages, 1, board_code, self.sampling)
+
+        counts              = voltage_to_counts(voltage, PGA)
+        if self.wire_format == 'binary':
+            return encode_frames(counts), counts
+        return b''.join(m + b'\r\n' for m in neuri_messages(counts)), counts
+
+
+    def batches(self, stream, num_chans):
+        # Splits the stream into reads of batch_size messages (or frames)
+        if self.wire_format == 'binary' and num_chans is not None:
+            frame_len       = len(encode_frames(zeros((num_chans, 1), dtype=int64)))
+            size            = frame_len * self.batch_size
+            return [stream[i:i+size] for i in range(0, len(stream), size)]
+        lines               = stream.split(b'\n')
+        return [b'\n'.join(lines[i:i+self.batch_size]) + b'\n'
+                for i in range(0, len(lines) - 1, self.batch_size)]
+
+
+    def best_of(self, run):
+        # =================================================================
+        # Input:
+        #   run                 Function executing one run, returning the
+        #                       amount of samples it processed
+        # Output:
+        #   samples_per_s       Float (fastest run)
+        # =================================================================
+        best                = 0.0
+        for _ in range(self.repeats):
+            t0              = perf_counter()
+            num_samples     = run()
+            elapsed         = max(perf_counter() - t0, 1e-9)
+            best            = max(best, num_samples / elapsed)
+        return best
+
+
+    def stage_parse(self, chunks, num_chans, board_code):
+
+        def run():
+            reader          = ChunkedReader(ReplayPort(chunks))
+            decoder         = BinaryFrameDecoder(num_chans)
+            num_samples     = 0
+            for _ in chunks:
+                if board_code == 0 and self.wire_format == 'binary':
+                    samples, _  = decoder.feed(reader.read_chunk())
+                    num_samples += samples.shape[1]
+                    continue
+                valid       = []
+                for message in reader.read_messages():
+                    samples, valid_eeg = self.sampling.messge_to_samples(
+                        message.decode('utf-8', errors='ignore'),
+                        num_chans, board_code)
+                    if valid_eeg:
+                        valid.append(samples)
+                if valid:
+                    num_samples += concatenate(valid, axis=1).shape[1]
+            return num_samples
+
+        return self.best_of(run)
+
+
+    def stage_convert(self, blocks, num_chans, board_code):
+
+        divisor             = self.sampling.voltage_divisor(PGA, board_code)
+
+        def run():
+            gap_filler      = GapFiller(num_chans)
+            for block in blocks:
+                voltage     = self.sampling.bin_to_voltage_block(block, divisor)
+                gap_filler.fill(voltage, zeros(block.shape[1], dtype=int64))
+            return self.num_samples
+
+        return self.best_of(run)
+
+
+    def stage_buffer(self, voltage, time_stamps):
+
+        def run():
+            ring            = RingBuffer(voltage.shape[0], 2 * self.saving_interval)
+            quality_ring    = RingBuffer(1, self.saving_interval)
+            quality         = zeros(voltage.shape[1], dtype=uint8)
+            for iS in range(voltage.shape[1]):
+                ring.write(voltage[:, iS], time_stamps[iS])
+                quality_ring.write(quality[iS:iS+1], time_stamps[iS])
+                if (iS + 1) % self.saving_interval == 0:
+                    ring.latest(self.saving_interval)
+            return voltage.shape[1]
+
+        return self.best_of(run)
+
+
+    def stage_shared(self, voltage, time_stamps):
+
+        shared              = SharedTransport(voltage.shape[0], 5 * SAMPLE_RATE)
+
+        def run():
+            for iS in range(voltage.shape[1]):
+                shared.write(voltage[:, iS], time_stamps[iS])
+            return voltage.shape[1]
+
+        try:
+            return self.best_of(run)
+        finally:
+            shared.close()
+
+
+    def new_relay(self, num_chans):
+
+        if self.relay_format == 'binary':
+            return BinaryRelay(self.transmitter, self.address, num_chans)
+        return JsonRelay(self.transmitter, self.address, num_chans)
+
+
+    def stage_relay(self, voltage, time_stamps):
+
+        def run():
+            relay           = self.new_relay(voltage.shape[0])
+            for iS in range(voltage.shape[1]):
+                relay.send(voltage[:, iS], time_stamps[iS])
+            relay.flush()
+            return voltage.shape[1]
+
+        return self.best_of(run)
+
+
+    def new_writer(self, directory, num_chans, board_code):
+
+        file_name           = os.path.join(directory, 'benchmark')
+        board               = "BioAmp EXG Pill" if board_code == 1 else "Neuri V1"
+        divisor             = self.sampling.voltage_divisor(PGA, board_code)
+        if self.recording_format == 'binary':
+            recording       = BinaryRecording(file_name + BinaryRecording.extension,
+                num_chans, SAMPLE_RATE, PGA, board)
+        elif self.recording_format == 'chunked':
+            recording       = ChunkedRecording(file_name + ChunkedRecording.extension,
+                num_chans, SAMPLE_RATE, PGA, board, [divisor] * num_chans)
+        elif self.recording_format in ['edf', 'bdf']:
+            recording       = EdfRecording(file_name + '.' + self.recording_format,
+                num_chans, SAMPLE_RATE, board, [divisor] * num_chans,
+                self.saving_interval / SAMPLE_RATE,
+                16 if self.recording_format == 'edf' else 24)
+        else:
+            recording       = TextRecording(file_name + TextRecording.extension)
+        recording.create()
+        return DataWriter(recording)
+
+
+    def stage_writer(self, voltage, time_stamps, board_code):
+
+        quality             = zeros(voltage.shape[1], dtype=uint8)
+
+        def run():
+            with TemporaryDirectory() as directory:
+                writer      = self.new_writer(directory, voltage.shape[0], board_code)
+                writer.start()
+                for i in range(0, voltage.shape[1], self.saving_interval):
+                    j       = i + self.saving_interval
+                    writer.put(voltage[:, i:j], time_stamps[i:j], quality[i:j])
+                writer.stop() # Includes writing out the queue
+            return voltage.shape[1]
+
+        return self.best_of(run)
+
+
+    def stage_end_to_end(self, chunks, num_chans, board_code):
+        # =================================================================
+        # Mirrors one pass of the loop of Sampling.fetch_sample() per chunk
+        # read from the port
+        # =================================================================
+        divisor             = self.sampling.voltage_divisor(PGA, board_code)
+
+        def run():
+            with TemporaryDirectory() as directory:
+                reader      = ChunkedReader(ReplayPort(chunks))
+                decoder     = BinaryFrameDecoder(num_chans)
+                gap_filler  = GapFiller(num_chans)
+                clock       = SampleClock(SAMPLE_RATE)
+                ring        = RingBuffer(num_chans, 2 * self.saving_interval)
+                quality_ring= RingBuffer(1, self.saving_interval)
+                relay       = self.new_relay(num_chans)
+                writer      = self.new_writer(directory, num_chans, board_code)
+                writer.start()
+                sample_count= 0
+                num_samples = 0
+                t0          = perf_counter()
+                for _ in chunks:
+                    if board_code == 0 and self.wire_format == 'binary':
+                        counts, counters = decoder.feed(reader.read_chunk())
+                        missing = gap_filler.missing_from_counters(counters)
+                    else:
+                        valid   = []
+                        for message in reader.read_messages():
+                            samples, valid_eeg = self.sampling.messge_to_samples(
+                                message.decode('utf-8', errors='ignore'),
+                                num_chans, board_code)
+                            if valid_eeg:
+                                valid.append(samples)
+                        if not valid:
+                            continue
+                        counts  = concatenate(valid, axis=1)
+                        missing = zeros(counts.shape[1], dtype=int64)
+
+                    voltage     = self.sampling.bin_to_voltage_block(counts, divisor)
+                    voltage, quality = gap_filler.fill(voltage, missing)
+                    time_stamps = clock.stamp(voltage.shape[1],
+                                              (perf_counter() - t0) * 1000)
+                    for iS in range(voltage.shape[1]):
+                        sample_count += 1
+                        ring.write(voltage[:, iS], time_stamps[iS])
+                        quality_ring.write(quality[iS:iS+1], time_stamps[iS])
+                        relay.send(voltage[:, iS], time_stamps[iS])
+                        if sample_count == self.saving_interval:
+                            buffer, ts = ring.latest(self.saving_interval)
+                            flags, _   = quality_ring.latest(self.saving_interval)
+                            writer.put(buffer, ts, flags[0].astype(uint8))
+                            sample_count = 0
+                    num_samples += voltage.shape[1]
+                relay.flush()
+                writer.stop()
+            return num_samples
+
+        return self.best_of(run)
+
+
+    def run_configuration(self, num_chans, board_code, stream=None):
+        # =================================================================
+        # Input:
+        #   num_chans           Scalar
+        #   board_code          0 (Neuri) or 1 (EXG Pill)
+        #   stream              bytes recorded at the port, or None for a
+        #                       synthetic stream
+        # Output:
+        #   samples_per_s       Dictionnary {stage: samples/s}
+        # =================================================================
+        if stream is None:
+            stream, counts  = self.synthetic_stream(num_chans, board_code)
+        else:
+            counts          = array_of_messages(
+                [m.rstrip(b'\r') for m in stream.split(b'\n') if m.strip()],
+                num_chans, board_code, self.sampling)
+            self.num_samples= counts.shape[1]
+
+        frames              = num_chans if board_code == 0 else None
+        chunks              = self.batches(stream, frames)
+        blocks              = array_split(counts, max(counts.shape[1] // self.batch_size, 1), axis=1)
+        divisor             = self.sampling.voltage_divisor(PGA, board_code)
+        voltage             = self.sampling.bin_to_voltage_block(counts, divisor)
+        time_stamps         = arange(voltage.shape[1]) * 1000 / SAMPLE_RATE
+
+        results             = {}
+        results['parse']    = self.stage_parse(chunks, num_chans, board_code)
+        results['convert']  = self.stage_convert(blocks, num_chans, board_code)
+        results['buffer']   = self.stage_buffer(voltage, time_stamps)
+        results['shared']   = self.stage_shared(voltage, time_stamps)
+        results['relay']    = self.stage_relay(voltage, time_stamps)
+        results['writer']   = self.stage_writer(voltage, time_stamps, board_code)
+        results['end_to_end'] = self.stage_end_to_end(chunks, num_chans, board_code)
+        return results
+
+
+    def run(self, channels=CHANNELS, board_codes=BOARD_CODES, stream=None):
+        # =================================================================
+        # Output:
+        #   results             Dictionnary (machine, settings and one
+        #                       entry per board code and amount of
+        #                       channels), saved by save_results()
+        # =================================================================
+        runs                = []
+        for board_code in board_codes:
+            # The EXG Pill has a single channel
+            for num_chans in ([1] if board_code == 1 else channels):
+                print('Board code {}, {} channels ...'.format(board_code, num_chans))
+                samples_per_s = self.run_configuration(num_chans, board_code, stream)
+                runs.append({"board_code":   board_code,
+                             "channels":     num_chans,
+                             "samples_per_s":samples_per_s})
+
+        return {"machine":  {"platform":     platform.platform(),
+                             "processor":    platform.processor(),
+                             "python":       platform.python_version(),
+                             "numpy":        numpy.__version__},
+                "settings": self.settings(),
+                "runs":     runs}
+
+
+class DisplayBenchmark():
+
+    def __init__(self, window=14, frames=50, repeats=3, s_down=2):
+        # =================================================================
+        # Frames per second of the processing the GUI applies to the whole
+        # window at every plot update (Processing.prepare_buffer(),
+        # extract_envelope() and downsample()), once channel by channel
+        # like these methods used to work, and once for all channels at
+        # once. Both have to give identical results, which is checked.
+        # Input
+        #   window          Scalar (seconds of signal, time range plus the
+        #                   margin against edge artifacts)
+        #   frames          Scalar (frames per run)
+        #   repeats         Scalar (runs per stage, the fastest counts)
+        #   s_down          Scalar (downsampling factor)
+        # =================================================================
+        self.num_samples    = int(window * SAMPLE_RATE)
+        self.frames         = int(frames)
+        self.repeats        = int(repeats)
+        self.s_down         = int(s_down)
+        self.rng            = default_rng(0)
+
+
+    def processing(self, num_chans):
+        # Filters of the default settings (Settings.set_defaults())
+        pm                  = SimpleNamespace(filter_order=3,
+            sample_rate=SAMPLE_RATE, buffer_length=10, max_chans=num_chans,
+            frequency_bands={'LineNoise':   (48, 52),
+                             'LineNoise60': (58, 62),
+                             'Sleep':       (1, 30),
+                             'Theta':       (4, 8),
+                             'Alpha':       (8, 12),
+                             'Sigma':       (12, 16),
+                             'Gamma':       (30, 45),
+                             'Whole':       (0.5, 45)})
+        return Processing(pm)
+
+
+    def frames_per_s(self, run):
+
+        best                = 0.0
+        for _ in range(self.repeats):
+            t0              = perf_counter()
+            for _ in range(self.frames):
+                run()
+            best            = max(best, self.frames / max(perf_counter() - t0, 1e-9))
+        return best
+
+
+    def run_configuration(self, num_chans):
+        # =================================================================
+        # Output:
+        #   results             Dictionnary {stage: {'per_channel': frames/s,
+        #                       'vectorized': frames/s}}
+        # =================================================================
+        proc                = self.processing(num_chans)
+        buffer              = self.rng.normal(0, 30, (num_chans, self.num_samples))
+        sos                 = proc.filter_chain(50, proc.preset_bands[1]) # Notch, 0.5-45 Hz
+
+        stages              = {
+            'filter':       (lambda: per_channel_prepare_buffer(proc, buffer, sos),
+                             lambda: proc.prepare_buffer(buffer, sos)),
+            'envelope':     (lambda: per_channel_envelope(buffer),
+                             lambda: proc.extract_envelope(buffer)),
+            'downsample':   (lambda: per_channel_downsample(buffer, self.s_down),
+                             lambda: proc.downsample(buffer, self.s_down))}
+
+        results             = {}
+        for stage, (per_channel, vectorized) in stages.items():
+            if not numpy.array_equal(per_channel(), vectorized()):
+                raise AssertionError('Results of "{}" differ'.format(stage))
+            results[stage]  = {'per_channel': self.frames_per_s(per_channel),
+                               'vectorized':  self.frames_per_s(vectorized)}
+        return results
+
+
+    def run(self, channels=DISPLAY_CHANNELS):
+
+        runs                = []
+        for num_chans in channels:
+            print('Display processing, {} channels ...'.format(num_chans))
+            runs.append({"channels":         num_chans,
+                         "frames_per_s":     self.run_configuration(num_chans)})
+        return {"runs": runs}
+
+
+def per_channel_prepare_buffer(proc, buffer, sos):
+    # Reference: the loop over channels Processing.prepare_buffer() ran
+    filtered_buffer     = zeros(buffer.shape)
+    for iChan in range(buffer.shape[0]):
+        filtered_buffer[iChan,] = proc.filter_signal(buffer[iChan,], sos)
+    return filtered_buffer
+
+
+def per_channel_envelope(buffer):
+    envelope            = zeros(buffer.shape)
+    for iChan in range(buffer.shape[0]):
+        envelope[iChan,]= numpy.abs(hilbert(buffer[iChan,]))
+    return envelope
+
+
+def per_channel_downsample(buffer, s_down):
+    idx_retain          = range(0, buffer.shape[1], s_down)
+    downsampled         = zeros((buffer.shape[0], len(idx_retain)))
+    for iChan in range(buffer.shape[0]):
+        downsampled[iChan,] = buffer[iChan, idx_retain]
+    return downsampled
+
+
+def print_display_results(results):
+
+    print('{:>6} '.format('chans') +
+          ' '.join('{:>24}'.format(stage) for stage in DISPLAY_STAGES) +
+          '   (frames/s per channel / all at once, speed-up)')
+    for entry in results["runs"]:
+        rates               = entry["frames_per_s"]
+        print('{:>6} '.format(entry["channels"]) + ' '.join(
+            '{:>8.0f} /{:>7.0f} {:>5.1f}x'.format(
+                rates[stage]['per_channel'], rates[stage]['vectorized'],
+                rates[stage]['vectorized'] / rates[stage]['per_channel'])
+            for stage in DISPLAY_STAGES))
+
+
+class ReplayPort():
+
+    def __init__(self, chunks):
+        # Stands in for the serial port: every read returns the next chunk
+        self.chunks         = iter(chunks)
+        self.in_waiting     = 1
+
+
+    def read(self, size=1):
+        return next(self.chunks, b'')
+
+
+def array_of_messages(messages, num_chans, board_code, sampling):
+    # =====================================================================
+    # Output:
+    #   counts              2D numpy array [channels x samples] of all
+    #                       valid messages (values as sent by the board)
+    # =====================================================================
+    valid               = []
+    for message in messages:
+        samples, valid_eeg = sampling.messge_to_samples(
+            message.decode('utf-8', errors='ignore'), num_chans, board_code)
+        if valid_eeg:
+            valid.append(samples)
+    return concatenate(valid, axis=1)
+
+
+def print_results(results):
+
+    print('{:>6} {:>6} '.format('board', 'chans') +
+          ' '.join('{:>11}'.format(stage) for stage in STAGES) +
+          '   (samples/s)')
+    for entry in results["runs"]:
+        rates               = entry["samples_per_s"]
+        print('{:>6} {:>6} '.format(entry["board_code"], entry["channels"]) +
+              ' '.join('{:>11.0f}'.format(rates[stage]) for stage in STAGES))
+
+
+def compare_results(baseline, candidate):
+    # =====================================================================
+    # Prints the ratio candidate/baseline of every stage and configuration
+    # both runs have in common (> 1: candidate is faster)
+    # Output:
+    #   ratios              Dictionnary {(board_code, channels): {stage:
+    #                       ratio}}
+    # =====================================================================
+    before              = {(e["board_code"], e["channels"]): e["samples_per_s"]
+                           for e in baseline["runs"]}
+    ratios              = {}
+    print('{:>6} {:>6} '.format('board', 'chans') +
+          ' '.join('{:>11}'.format(stage) for stage in STAGES) +
+          '   (candidate / baseline)')
+    for entry in candidate["runs"]:
+        key                 = (entry["board_code"], entry["channels"])
+        if key not in before:
+            continue
+        ratios[key]         = {stage: entry["samples_per_s"][stage] / before[key][stage]
+                               for stage in STAGES if before[key].get(stage)}
+        print('{:>6} {:>6} '.format(*key) +
+              ' '.join('{:>11.2f}'.format(ratios[key][stage])
+                       if stage in ratios[key] else '{:>11}'.format('-')
+                       for stage in STAGES))
+    return ratios
+
+
+def save_results(results, file_name):
+    with open(file_name, 'w', encoding= "utf_8") as file:
+        file.write(dumps(results, indent=2))
+
+
+def load_results(file_name):
+    with open(file_name, 'r', encoding= "utf_8") as file:
+        return loads(file.read())
+
+
+def main(args=None):
+
+    parser              = argparse.ArgumentParser(prog="python -m neuri.benchmark",
+        description="Throughput of the stages of the acquisition pipeline")
+    parser.add_argument("--channels", type=int, nargs='+', default=CHANNELS)
+    parser.add_argument("--board-codes", type=int, nargs='+', default=BOARD_CODES,
+                        choices=BOARD_CODES)
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--wire-format", choices=['json', 'binary'], default='json')
+    parser.add_argument("--relay-format", choices=['json', 'binary'], default='json')
+    parser.add_argument("--recording-format", default='binary',
+                        choices=['txt', 'binary', 'chunked', 'edf', 'bdf'])
+    parser.add_argument("--recorded", metavar="FILE",
+                        help="Bytes recorded at the port instead of synthetic "
+                             "messages (JSON or EXG Pill lines)")
+    parser.add_argument("--output", metavar="FILE", help="Save the results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="Compare two saved results instead of running")
+    parser.add_argument("--display", action="store_true",
+                        help="Measure the display processing of the GUI "
+                             "(filters, envelope, downsampling) instead")
+    args                = parser.parse_args(args)
+
+    if args.compare:
+        compare_results(load_results(args.compare[0]), load_results(args.compare[1]))
+        return
+
+    if args.display:
+        results         = DisplayBenchmark(repeats=args.repeats).run(
+            args.channels if args.channels != CHANNELS else DISPLAY_CHANNELS)
+        print_display_results(results)
+        if args.output:
+            save_results(results, args.output)
+            print('Results saved to {}'.format(args.output))
+        return
+
+    benchmark           = PipelineBenchmark(args.samples, args.repeats,
+        args.batch_size, args.wire_format, args.relay_format,
+        args.recording_format)
+    channels, board_codes, stream = args.channels, args.board_codes, None
+    if args.recorded:
+        with open(args.recorded, 'rb') as file:
+            stream          = file.read()
+        # The amount of channels follows from the first complete message
+        board_codes         = board_codes[:1]
+        benchmark.wire_format = 'json'
+        channels            = [1]
+        if board_codes[0] == 0:
+            for line in stream.split(b'\n'):
+                try:
+                    channels= [len(loads(line[line.find(b'{'):line.find(b'}')+1]))]
+                    break
+                except ValueError:
+                    continue
+
+    results             = benchmark.run(channels, board_codes, stream)
+    print_results(results)
+    if args.output:
+        save_results(results, args.output)
+        print('Results saved to {}'.format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,262 +1,41 @@
 import tkinter                              as tk
 from PIL                                    import Image, ImageTk
 from sys                                    import platform
-from github                                 import Github
 import serial.tools.list_ports
 import customtkinter
 import os
-import socket
 import webbrowser
 
-class Parameters:
+# Necessary step for relative imports when the GUI is run directly in an 
+# IDE instead of as module
+if ( __package__ == "frontend" ):
+    from backend.settings                   import Settings
+    from backend.release_check              import ReleaseCheck, RELEASES_URL
+    from frontend.user_experience           import screen_size
+    from startup_profile                    import profile
+else:
+    from ..backend.settings                 import Settings
+    from ..backend.release_check            import ReleaseCheck, RELEASES_URL
+    from .user_experience                   import screen_size
+    from ..startup_profile                  import profile
+
+
+class Parameters(Settings):
 
     def __init__(self):
 
-        super(Parameters, self).__init__()
+        with profile.phase('settings file'):
+            super(Parameters, self).__init__()
 
         self.frontend_path  = os.path.dirname(__file__)
-
-        self.conf_file      = os.path.join(".", "settings.cfg")
-        self.version        = '2.82.0' # TO-DO: Find a more elegant way to dynamically define the current version as this line here gets forgotten a lot
         self.ico_neuri      = os.path.join(self.frontend_path, "Neuri_logo.ico")
 
-        # List elements:
-        # First =   start code (int)
-        #           The start code is the message that will be sent to 
-        #           the boards in order to initiate signal transfer and
-        #           will also define the samples per message. Might have to
-        #           be separated in future
-        # Second    Default sampling rate (int, Hz)
-        # Third     Baud rate (int)
-        self.board_characteristics = {
-            "Neuri V1 by Helment":                  [2, 200, 115200],
-            "Neuri-Lolin S3-PRO by Helment":        [2, 200, 115200],
-            "BioAmp EXG Pill by Upside Down Labs":  [2, 125, 115200]
-        }
-
-        self.set_defaults() # Necessary to execute first in case user 
-                            # parameter not found in configuration file
-        # Loop up user settings
-        self.load_parameters()
-
-        # Build relay connection for other programs
-        self.build_relay(self.udp_ip)
-
-        self.get_screen_info()
-        self.build_frontend()
+        with profile.phase('settings window'):
+            self.build_frontend()
 
         # This stops code execution until paramWin closed
-        self.paramWin.mainloop()
-
-
-    def build_relay(self, ip):
-        # =================================================================
-        # This connection will be used in order to transfer the incoming 
-        # signal from the board to a dynamuically defined port via UDP
-        # =================================================================
-
-        self.udp_port   = self.search_free_com(ip)
-        self.udp_ip     = ip
-        self.send_sock  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP
-        print('Relay connection established at ' + self.udp_ip + ':' + str(self.udp_port))
-        print('Use this connection to import signals in your own program!\n')
-    
-
-    def search_free_com(self, ip):
-
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        for iPort in range(12344, 12350):
-            try:
-                s = s.connect((ip, iPort))
-            except:
-                return iPort
-
-        raise Exception('No available UDP port found for signal relay')
-
-
-    def load_parameters(self):
-
-        if not os.path.exists(self.conf_file):
-            return
-        
-        with open(self.conf_file, 'r') as f:
-            
-            settings                        = f.readlines()
-            
-            for i, setting in enumerate(settings):
-                if 'Darkmode' in setting and 'True' in setting:
-                    self.darkmode           = True
-                elif 'Darkmode' in setting and 'False' in setting:
-                    self.darkmode           = False
-                if 'Headless' in setting and 'True' in setting:
-                    self.run_headless       = True
-                elif 'Headless' in setting and 'False' in setting:
-                    self.run_headless       = False
-                elif 'SamplingRate' in setting:
-                    try:
-                        self.sample_rate    = int(setting[setting.find('=')+1:])
-                    except:
-                        print("Could not load \"SamplingRate\" from configuration")
-                elif 'AmountChannels' in setting:
-                    try:
-                        self.max_chans      = int(setting[setting.find('=')+1:])
-                    except:
-                        print("Could not load \"AmountChannels\" from configuration")
-                elif 'TimeRange' in setting:
-                    try:
-                        self.buffer_length  = int(setting[setting.find('=')+1:])
-                    except:
-                        print("Could not load \"TimeRange\" from configuration")
-                elif 'PGA' in setting:
-                    try:
-                        self.PGA            = int(setting[setting.find('=')+1:])
-                    except:
-                        print("Could not load \"PGA\" from configuration")
-                elif 'Port' in setting:
-                    try:
-                        self.port           = str(setting[setting.find('=')+1:])
-                        if '\n' in self.port:
-                            self.port = self.port.replace('\n', '')
-                        ports = [port.device for port in list(serial.tools.list_ports.comports())]
-                        if len([p for p in ports if p == self.port]) == 0:
-                            self.port = ''
-                    except:
-                        print("Could not load \"Port\" from configuration")
-                elif 'Board' in setting:
-                    try:
-                        self.board          = str(setting[setting.find('=')+1:])
-                        if '\n' in self.board:
-                            self.board = self.board.replace('\n', '')
-                    except:
-                        print("Could not get board information from configuration")
-                elif 'DownsamplingFactor' in setting:
-                    try:
-                        self.s_down         = int(setting[setting.find('=')+1:])
-                    except:
-                        print("Could not load \"DownsamplingFactor\" from configuration")
-
-        print("Loaded user-defined settings")
-
-        # Missing: self.selected_chans
-
-
-    def save_parameters(self):
-
-        end_line = "\n"
-
-        if not os.path.exists(self.conf_file): # File generation
-
-            with open(self.conf_file, 'w') as f:
-
-                settings = [
-                    "".join(["Darkmode=", str(self.darkmode), end_line]),
-                    "".join(["SamplingRate=", str(self.sample_rate), end_line]),
-                    "".join(["AmountChannels=", str(self.max_chans), end_line]),
-                    "".join(["TimeRange=", str(self.buffer_length), end_line]),
-                    "".join(["PGA=", str(self.PGA), end_line]),
-                    "".join(["Port=", str(self.port), end_line]),
-                    "".join(["Board=", str(self.board), end_line]),
-                    "".join(["DownsamplingFactor=", str(self.s_down), end_line]),
-                    "".join(["Headless=", str(self.run_headless), end_line])
-                    ]
-
-                f.write("".join(settings))
-
-        else:
-
-            with open(self.conf_file, 'r') as f:
-            
-                settings                        = f.readlines()
-                
-                for i, setting in enumerate(settings): # Update values
-                    if 'Darkmode' in setting:
-                        settings[i]             = "".join(["Darkmode=", str(self.darkmode), end_line])
-                    elif 'SamplingRate' in setting:
-                        settings[i]             = "".join(["SamplingRate=", str(self.sample_rate), end_line])
-                    elif 'AmountChannels' in setting:
-                        settings[i]             = "".join(["AmountChannels=", str(self.max_chans), end_line])
-                    elif 'TimeRange' in setting:
-                        settings[i]             = "".join(["TimeRange=", str(self.buffer_length), end_line])
-                    elif 'PGA' in setting:
-                        settings[i]             = "".join(["PGA=", str(self.PGA), end_line])
-                    elif 'Port' in setting:
-                        settings[i]             = "".join(["Port=", str(self.port), end_line])
-                    elif 'Board' in setting:
-                        settings[i]             = "".join(["Board=", str(self.board), end_line])
-                    elif 'DownsamplingFactor' in setting:
-                        settings[i]             = "".join(["DownsamplingFactor=", str(self.s_down), end_line])
-                    elif 'Headless' in setting:
-                        settings[i]             = "".join(["Headless=", str(self.run_headless), end_line])
-
-                new_settings = []
-                if len([s for s in settings if "Darkmode" in s]) == 0:
-                    new_settings.append("".join(["Darkmode=", str(self.darkmode), end_line]))
-                if len([s for s in settings if "SamplingRate" in s]) == 0:
-                    new_settings.append("".join(["SamplingRate=", str(self.sample_rate), end_line]))
-                if len([s for s in settings if "AmountChannels" in s]) == 0:
-                    new_settings.append("".join(["AmountChannels=", str(self.max_chans), end_line]))
-                if len([s for s in settings if "TimeRange" in s]) == 0:
-                    new_settings.append("".join(["TimeRange=", str(self.buffer_length), end_line]))
-                if len([s for s in settings if "PGA" in s]) == 0:
-                    new_settings.append("".join(["PGA=", str(self.PGA), end_line]))
-                if len([s for s in settings if "Port" in s]) == 0:
-                    new_settings.append("".join(["Port=", str(self.port), end_line]))
-                if len([s for s in settings if "Board" in s]) == 0:
-                    new_settings.append("".join(["Board=", str(self.board), end_line]))
-                if len([s for s in settings if "DownsamplingFactor" in s]) == 0:
-                    new_settings.append("".join(["DownsamplingFactor=", str(self.s_down), end_line]))
-                if len([s for s in settings if "Headless" in s]) == 0:
-                    new_settings.append("".join(["Headless=", str(self.run_headless), end_line]))
-
-            with open(self.conf_file, 'w') as f:
-                f.write("".join(settings + new_settings))
-
-
-    def set_defaults(self):
-
-        self.all_set        = False
-        self.darkmode       = False
-        self.run_headless   = False
-
-        #Session-specific parameters
-        self.yrange         = [-0, 0] # List of scalars ([negative, positive]) in order to set figure y axis range
-        self.notch          = 50 # Integer 0 (Off), 50 (50 Hz) or 60 (60 Hz)
-        self.bpass          = 0 # Integer -1 to 3 according to number of options in "frequency_bands" below
-        self.dispenv        = False # Boolean 0 (Off), 1 (On)
-        self.set_customsession = False
-
-        #Signal arrays
-        self.sample_rate    = self.board_characteristics["Neuri V1 by Helment"][1] #Hertz
-        self.max_chans      = 8 #scalar (Max. amount of input channels of board)
-        self.selected_chans = [True] * self.max_chans
-        self.buffer_length  = 10 #scalar (seconds)
-        self.buffer_add     = 4 #scalar (seconds), we add this to the buffer for filtering to avoid edge artifacts
-        self.saving_interval= 1 #scalar (seconds)
-        self.PGA            = 24 #scalar
-
-        #Signal reception
-        self.baud_rate      = self.board_characteristics["Neuri V1 by Helment"][2] #scalar default baudrate for connection
-        self.port           = '' #Leave blank
-        self.board          = '' #Leave blank
-        self.start_code     = self.board_characteristics["Neuri V1 by Helment"][0]
-        self.time_out       = None #Wait for message
-
-        # Signal relay
-        self.udp_ip         = "127.0.0.1" # Loopback ip for on-device communication
-
-        #Plotting
-        # self.plot_intv       = 200 #scalar defining update rate of figure (ms) OBSOLETE PARAMETER
-        self.s_down         = 1 #Desired downsampling factor (buffer_length*sample_rate/s_down must be convertable to integer)
-
-
-        #Signal processing
-        self.filter_order   = 3 #scalar
-        self.frequency_bands= {
-            'LineNoise':    (48, 52),
-            'LineNoise60':  (58, 62),
-            'Sleep':        (1, 30),
-            'Theta':        (4, 8),
-            'Whole':        (0.5, 45)}
+        with profile.phase('settings window (user)', 'user'):
+            self.paramWin.mainloop()
 
 
     def build_frontend(self):
@@ -269,6 +48,7 @@ class Parameters:
         # Build GUI
         # -----------------------------------------------------------------
         self.paramWin           = customtkinter.CTk()
+        self.get_screen_info(self.paramWin)
         pixels_x, pixels_y      = int(
             round(0.8*self.screen_width)), int(round(0.9*self.screen_height))
         x_cordinate, y_cordinate= int((self.screen_width/2) - (pixels_x/2)), int(0)
@@ -304,6 +84,8 @@ class Parameters:
         self.display_timerange(self.add_frame_ext_x(frameScroll))
         self.display_channels(self.add_frame_ext_x(frameScroll))
         self.display_output_name(self.add_frame_ext_x(frameScroll))
+        self.display_recording_format(self.add_frame_ext_x(frameScroll))
+        self.display_relay_format(self.add_frame_ext_x(frameScroll))
         # self.display_speed_up(self.add_frame_ext_x(frameScroll))
         self.display_headless(self.add_frame_ext_x(frameScroll))
         self.display_validate(self.paramWin)
@@ -337,64 +119,68 @@ class Parameters:
 
     def display_version(self, master):
 
-        frameVersion             = customtkinter.CTkFrame(
+        self.frameVersion        = customtkinter.CTkFrame(
             master=master, bg_color="transparent", fg_color="transparent")
-        frameVersion.pack(pady=0, padx=self.framePadX, fill=tk.X,
-                          expand=False, side=tk.TOP)
+        self.frameVersion.pack(pady=0, padx=self.framePadX, fill=tk.X,
+                               expand=False, side=tk.TOP)
 
-        repository = "davidmarcelbaum/NeuriGUI"
+        self.labelVersion        = customtkinter.CTkLabel(
+            master=self.frameVersion, justify=customtkinter.RIGHT,
+            text="".join(["GUI version: ", self.version]))
+        self.labelVersion.pack(
+                pady=self.widgetPadY, padx=self.widgetPadX,
+                fill=tk.BOTH, expand=False, side=tk.RIGHT)
 
-        g = Github()
-        
-        try:
-            latest_release = g.get_repo(repository).get_latest_release()
-            v = latest_release.title.replace("V","")
-            v = v.replace("v","")
-            v = v.replace(".", "")
-            ver_latest = int(v)
-
-            thisv = int(self.version.replace(".", ""))
-
-            if thisv < ver_latest:
-
-                target_webpage = "https://github.com/davidmarcelbaum/NeuriGUI/releases/tag/{}".format(latest_release.title)
-
-                button = customtkinter.CTkButton(
-                    frameVersion, text="Download latest version",
-                    command=lambda: self.open_webpage(target_webpage))
-                button.pack(
-                        pady=self.widgetPadY, padx=self.widgetPadX,
-                        fill=tk.BOTH, expand=False, side=tk.RIGHT)
-                
-                customtkinter.CTkLabel(master=frameVersion, 
-                justify=customtkinter.RIGHT,
-                text="".join(["Realease version ",
-                              str(latest_release.title.replace("V","")),
-                              " available"]),
-                text_color='red').pack(
-                    pady=self.widgetPadY, padx=self.widgetPadX,
-                    fill=tk.BOTH, expand=False, side=tk.RIGHT)
-        except:
-            pass
+        if not self.release_check:
+            return
+
+        # The lookup runs in the background, the banner is added once its
+        # result arrives (Tk widgets may only be touched from this thread)
+        self.releaseCheck        = ReleaseCheck(self.version,
+            self.release_cache, self.release_ttl, self.release_timeout)
+        self.releaseCheck.start()
+        self.paramWin.after(200, self.display_release)
 
-        customtkinter.CTkLabel(master=frameVersion, 
-            justify=customtkinter.RIGHT,
-            text="".join(["GUI version: ", self.version])).pack(
+
+    def display_release(self):
+
+        if self.releaseCheck.is_alive():
+            if not self.releaseCheck.overdue():
+                self.paramWin.after(200, self.display_release)
+            return # Otherwise, its result is kept for the next start
+
+        latest = self.releaseCheck.newer_release()
+        if latest is None:
+            return
+
+        target_webpage = RELEASES_URL.format(latest)
+
+        button = customtkinter.CTkButton(
+            self.frameVersion, text="Download latest version",
+            command=lambda: self.open_webpage(target_webpage))
+        button.pack(
                 pady=self.widgetPadY, padx=self.widgetPadX,
-                fill=tk.BOTH, expand=False, side=tk.RIGHT)
+                fill=tk.BOTH, expand=False, side=tk.RIGHT,
+                before=self.labelVersion)
+
+        customtkinter.CTkLabel(master=self.frameVersion, 
+        justify=customtkinter.RIGHT,
+        text="".join(["Realease version ",
+                      str(latest.replace("V","")),
+                      " available"]),
+        text_color='red').pack(
+            pady=self.widgetPadY, padx=self.widgetPadX,
+            fill=tk.BOTH, expand=False, side=tk.RIGHT,
+            before=self.labelVersion)
         
 
     def open_webpage(self, target):
         webbrowser.open(target)
         
     
-    def get_screen_info(self):
-
-        root = tk.Tk()
+    def get_screen_info(self, root=None):
         # Get information about screen to center the windows
-        self.screen_width = root.winfo_screenwidth()
-        self.screen_height = root.winfo_screenheight()
-        root.destroy()
+        self.screen_width, self.screen_height = screen_size(root)
 
     
     def display_board_version(self, master):
@@ -741,6 +527,42 @@ class Parameters:
             print('Session name can not be empty')
 
 
+    def display_recording_format(self, master):
+
+        labelFormat = customtkinter.CTkLabel(master=master, 
+                                            justify=customtkinter.LEFT,
+                                            text='Select recording format')
+        labelFormat.pack(pady=self.widgetPadY, padx=self.widgetPadX, side=tk.LEFT)
+        formatMenu  = customtkinter.CTkOptionMenu(master, values=self.recording_formats,
+                                                    command=self.select_recording_format)
+        formatMenu.pack(pady=self.widgetPadY, padx=self.widgetPadX, side=tk.LEFT, expand=True)
+        formatMenu.set(self.recording_format)
+
+
+    def select_recording_format(self, event):
+
+        self.recording_format = str(event)
+        print('Recording format set to {}'.format(self.recording_format))
+
+
+    def display_relay_format(self, master):
+
+        labelRelay  = customtkinter.CTkLabel(master=master, 
+                                            justify=customtkinter.LEFT,
+                                            text='Select relay format')
+        labelRelay.pack(pady=self.widgetPadY, padx=self.widgetPadX, side=tk.LEFT)
+        relayMenu   = customtkinter.CTkOptionMenu(master, values=self.relay_formats,
+                                                    command=self.select_relay_format)
+        relayMenu.pack(pady=self.widgetPadY, padx=self.widgetPadX, side=tk.LEFT, expand=True)
+        relayMenu.set(self.relay_format)
+
+
+    def select_relay_format(self, event):
+
+        self.relay_format = str(event)
+        print('Relay format set to {}'.format(self.relay_format))
+
+
     def display_speed_up(self, master):
 
         down_facotr = ['1', '2', '5', '10'] # TO-DO: Fix GUI freezing when chosing '1' (no downsampling)
@@ -1,10 +1,30 @@
-from PyQt5                                  import QtCore, QtWidgets, QtGui
-from pyqtgraph                              import PlotWidget
 from PIL                                    import Image, ImageTk
 from tkinter                                import ttk
 from sys                                    import platform
 import tkinter                              as tk
 
+
+# Size of the screen, queried once per process (see screen_size())
+_screen_size        = None
+
+
+def screen_size(root=None):
+    # =====================================================================
+    # Input:
+    #   root                Tk window to query, or None to open a
+    #                       temporary one (only on the first call)
+    # Output:
+    #   width, height       Scalars (pixels)
+    # =====================================================================
+    global _screen_size
+    if _screen_size is None:
+        window          = tk.Tk() if root is None else root
+        _screen_size    = (window.winfo_screenwidth(), window.winfo_screenheight())
+        if root is None:
+            window.destroy()
+    return _screen_size
+
+
 class Aux:
 
     def __init__(self):
@@ -13,14 +33,12 @@ class Aux:
 
 
     def get_screen_info(self):
-        root = tk.Tk()
         # Get information about screen to center the windows
-        self.screen_width = root.winfo_screenwidth()
-        self.screen_height = root.winfo_screenheight()
-        root.destroy()
+        self.screen_width, self.screen_height = screen_size()
 
 
     def disp_pyqt_splash(self):
+        from PyQt5                          import QtCore, QtWidgets, QtGui
         splash_pix = QtGui.QPixmap(self.img_neuri)
         splash_pix = splash_pix.scaled(500, 500, QtCore.Qt.KeepAspectRatio)
         splash = QtWidgets.QSplashScreen(splash_pix, QtCore.Qt.WindowStaysOnTopHint)
@@ -5,6 +5,13 @@ import pyqtgraph                            as pg
 from numpy import max, abs, array, zeros, reshape
 import os
 
+# Necessary step for relative imports when the GUI is run directly in an 
+# IDE instead of as module
+if ( __package__ == "frontend" ):
+    from backend.signal_processing          import MAX_FILTER_ORDER
+else:
+    from ..backend.signal_processing        import MAX_FILTER_ORDER
+
 
 class GUIWidgets():
 
@@ -20,15 +27,13 @@ class GUIWidgets():
         self.yrange         = parameter.yrange
         self.notch          = parameter.notch
         self.bpass          = parameter.bpass
+        self.band           = processing.preset_bands.get(self.bpass)
+        self.order          = parameter.filter_order
         self.denv           = parameter.dispenv
 
         # Defaults
         self.streaming      = True
         self.envelope       = False
-        self.bSB            = processing.b_notch
-        self.aSB            = processing.a_notch
-        self.bPB            = processing.b_wholerange
-        self.aPB            = processing.a_wholerange
         self.lighttheme     = QtGui.QGuiApplication.palette()
         self.darktheme      = self.define_darktheme()
         self.darkmode       = parameter.darkmode
@@ -38,6 +43,10 @@ class GUIWidgets():
 
         self.fps_update_timestamp= 1000 # Setting this to 0 will throw ZeroDivisionError
         self.plot_updates   = 0 # Used as frames per second
+        self.metrics        = None # MetricsRegistry of the sampling process
+        self.display_filter = None # StreamingFilter of the shared transport
+        self.control        = None # ControlChannel of the display filter
+        self.pending_filter = None # [future, senders] of a filter being designed
 
 
     def initiate_theme(self):
@@ -106,32 +115,35 @@ class GUIWidgets():
     def fg_notch_filter(self):
         # -----------------------------------------------------------------
         # Notch filter
-        # rbt1 (50 Hz) rdbt2 (60 Hz) rdbt3 (Off)
+        # rbt1 (50 Hz) rdbt2 (60 Hz) rdbt3 (Off) rdbt4 (Custom)
         # -----------------------------------------------------------------
         self.notch_filter   = QtWidgets.QWidget()
         vertlayout          = QtWidgets.QVBoxLayout()
         horilayout          = QtWidgets.QHBoxLayout()
-        title               = QtWidgets.QLabel('Notch filter (Hz)')
+        self.notch_title    = QtWidgets.QLabel('Notch filter (Hz)')
         rbtn1               = QtWidgets.QRadioButton('50')
         rbtn2               = QtWidgets.QRadioButton('60')
         rbtn3               = QtWidgets.QRadioButton('Off')
-
-        if self.notch == 50:
-            rbtn1.setChecked(True)
-        elif self.notch == 60:
-            rbtn2.setChecked(True)
-        elif self.notch == 0:
-            rbtn3.setChecked(True)
+        rbtn4               = QtWidgets.QRadioButton('Custom')
+        self.notch_input    = QtWidgets.QLineEdit(str(self.notch))
+        self.notch_input.setFixedWidth(50)
+        self.notch_buttons  = {50: rbtn1, 60: rbtn2, 0: rbtn3, 'custom': rbtn4}
+        self.show_notch()
 
         rbtn1.clicked.connect(lambda: self.filt_noise(50))
         rbtn2.clicked.connect(lambda: self.filt_noise(60))
         rbtn3.clicked.connect(lambda: self.filt_noise(0))
+        rbtn4.clicked.connect(lambda: self.enable_custom_input(self.notch_input))
+        self.notch_input.returnPressed.connect(lambda: self.custom_notch(
+            self.notch_input.text()))
 
-        vertlayout.addWidget(title)
+        vertlayout.addWidget(self.notch_title)
         vertlayout.addLayout(horilayout)
         horilayout.addWidget(rbtn1)
         horilayout.addWidget(rbtn2)
         horilayout.addWidget(rbtn3)
+        horilayout.addWidget(rbtn4)
+        horilayout.addWidget(self.notch_input)
         self.notch_filter.setLayout(vertlayout)
 
         return self.notch_filter
@@ -140,42 +152,43 @@ class GUIWidgets():
     def fg_bandpass_filter(self):
         # -----------------------------------------------------------------
         # Bandpass (Hz)
-        # rbt1 (0.5 - 45) rdbt2 (1 - 30) rdbt3 (4 - 8)
+        # rbt1 (Raw) rdbt2 (Detrend) rdbt3 (0.5 - 45) rdbt4 (1 - 30)
+        # rdbt5 (4 - 8) rdbt6 (8 - 12) rdbt7 (12 - 16) rdbt8 (30 - 45)
+        # rdbt9 (Custom), order
         # -----------------------------------------------------------------
         self.bandpass_filter= QtWidgets.QWidget()
         vertlayout          = QtWidgets.QVBoxLayout()
         horilayout          = QtWidgets.QHBoxLayout()
-        title               = QtWidgets.QLabel('Bandpass (Hz)')
-        rbtn1               = QtWidgets.QRadioButton('Raw')
-        rbtn2               = QtWidgets.QRadioButton('Detrend')
-        rbtn3               = QtWidgets.QRadioButton('0.5 - 45')
-        rbtn4               = QtWidgets.QRadioButton('1 - 30')
-        rbtn5               = QtWidgets.QRadioButton('4 - 8')
-
-        if self.bpass == -1:
-            rbtn1.setChecked(True)
-        elif self.bpass == 0:
-            rbtn2.setChecked(True)
-        elif self.bpass == 1:
-            rbtn3.setChecked(True)
-        elif self.bpass == 2:
-            rbtn4.setChecked(True)
-        elif self.bpass == 3:
-            rbtn5.setChecked(True)
-
-        rbtn1.clicked.connect(lambda: self.filt_bandpass(-1))
-        rbtn2.clicked.connect(lambda: self.filt_bandpass(0))
-        rbtn3.clicked.connect(lambda: self.filt_bandpass(1))
-        rbtn4.clicked.connect(lambda: self.filt_bandpass(2))
-        rbtn5.clicked.connect(lambda: self.filt_bandpass(3))
-
-        vertlayout.addWidget(title)
+        self.bandpass_title = QtWidgets.QLabel('Bandpass (Hz)')
+        self.band_buttons   = {-1: QtWidgets.QRadioButton('Raw'),
+                               0:  QtWidgets.QRadioButton('Detrend')}
+        for bpass in range(1, len(self.proc.preset_bands) - 1):
+            self.band_buttons[bpass] = QtWidgets.QRadioButton('{:g} - {:g}'.format(
+                *self.proc.preset_bands[bpass]))
+        self.band_buttons['custom'] = QtWidgets.QRadioButton('Custom')
+        self.band_input     = QtWidgets.QLineEdit(format_band(self.band))
+        self.band_input.setFixedWidth(75)
+        self.order_input    = QtWidgets.QSpinBox()
+        self.order_input.setRange(1, MAX_FILTER_ORDER)
+        self.order_input.setValue(self.order)
+        self.order_input.setPrefix('Order ')
+        self.show_band()
+
+        for bpass, rbtn in self.band_buttons.items():
+            if bpass == 'custom':
+                rbtn.clicked.connect(lambda: self.enable_custom_input(self.band_input))
+            else: # Default argument: every button keeps its own bpass
+                rbtn.clicked.connect(lambda checked, bpass=bpass: self.filt_bandpass(bpass))
+        self.band_input.returnPressed.connect(lambda: self.custom_band(
+            self.band_input.text()))
+        self.order_input.valueChanged.connect(self.filt_order)
+
+        vertlayout.addWidget(self.bandpass_title)
         vertlayout.addLayout(horilayout)
-        horilayout.addWidget(rbtn1)
-        horilayout.addWidget(rbtn2)
-        horilayout.addWidget(rbtn3)
-        horilayout.addWidget(rbtn4)
-        horilayout.addWidget(rbtn5)
+        for rbtn in self.band_buttons.values():
+            horilayout.addWidget(rbtn)
+        horilayout.addWidget(self.band_input)
+        horilayout.addWidget(self.order_input)
         self.bandpass_filter.setLayout(vertlayout)
 
         return self.bandpass_filter
@@ -334,36 +347,40 @@ The raw data is available at {}:{}""".format(udp_ip, udp_port))
 
 
     def update_fps(self):
-        self.fps_info.setText(" FPS \n{}".format(self.plot_updates))
-        # White spaces to avoid widget resizing when number of digits change
+        if self.metrics is None:
+            self.fps_info.setText(" FPS \n{}".format(self.plot_updates))
+            # White spaces to avoid widget resizing when number of digits change
+            return
+
+        metrics             = self.metrics.snapshot()
+        self.fps_info.setText(" FPS \n{}\n Hz \n{}\n Lost \n{}".format(
+            self.plot_updates, int(metrics['sample_rate']),
+            int(metrics['lost_samples'])))
 
 
     def update_signal_plot(self, s_down, left_edge, sampling_rate,
-                           idx_retain, max_chans, displ_chans,
-                           shared_buffer, shared_timestamp):
+                           idx_retain, max_chans, displ_chans):
         
         self.plot_updates += 1
+
+        self.apply_display_filter()
                 
         self.count = self.count + 1
         if self.count < s_down:
             return
 
-        # Reconstruct buffer
-        # -----------------------------------------------------------------
-        # sharedbuffer is a 1D array where channels are concatenated. We
-        # split them up into 2D arrays again
-        buffer              = self.rebuild_buffer(shared_buffer[:], max_chans)
-                
-        # Filter buffer signal and send filtered data to plotting funcs
+        # Filter the samples that arrived since the last update and get
+        # the filtered window
         # -------------------------------------------------------------
-        processed_buffer    = self.prepare_buffer(buffer, 
-            self.bSB, self.aSB, self.bPB, self.aPB)
-        processed_buffer    = processed_buffer[:, left_edge:]
+        processed_buffer, time_stamps = self.display_filter.update()
+        time_stamp_now      = time_stamps[-1]
 
+        # The envelope follows the filtered samples block by block as well
         if self.envelope == True:
-            processed_buffer = self.extract_envelope(processed_buffer)
+            processed_buffer, _ = self.display_filter.envelope_window()
+        processed_buffer    = processed_buffer[:, left_edge:]
 
-        x_current           = shared_timestamp.value / 1000
+        x_current           = time_stamp_now / 1000
         x_first             = x_current - len(self.x) * s_down / sampling_rate
         self.x              = list(
             range(
@@ -422,54 +439,147 @@ The raw data is available at {}:{}""".format(udp_ip, udp_port))
 
         self.count          = 0
 
-        if self.fps_update_timestamp + 1000 < shared_timestamp.value:
+        if self.fps_update_timestamp + 1000 < time_stamp_now:
             self.update_fps()
             self.plot_updates = 0
-            self.fps_update_timestamp = shared_timestamp.value
-
-
-    def rebuild_buffer(self, buffer_in, num_channels):
-        return reshape(buffer_in, (num_channels, int(len(buffer_in)/num_channels)))
+            self.fps_update_timestamp = time_stamp_now
 
     
     def filt_noise(self, choice):
-        choice = int(choice)
-        if choice == 50:
-            print('Enabled 50 Hz stopband filter')
-            self.bSB    = self.proc.b_notch
-            self.aSB    = self.proc.a_notch
-        elif choice == 60:
-            print('Enabled 60 Hz stopband filter')
-            self.bSB    = self.proc.b_notch60
-            self.aSB    = self.proc.a_notch60
-        elif choice == 0:
-            print('Notch filter disabled')
-            self.bSB    = array([None, None]) # Avoiding bool not iterable
-            self.aSB    = array([None, None])
+        self.set_display_filter(int(choice), self.band, self.order)
 
 
     def filt_bandpass(self, choice):
-        choice = int(choice)
-        if choice == -1:
-            print('Displaying raw signal')
-            self.bPB        = array([None, None])
-            self.aPB        = array([None, None])
-        elif choice == 0:
-            print('Highpass filter from 0.1 Hz')
-            self.bPB        = self.proc.b_detrend
-            self.aPB        = self.proc.a_detrend
-        elif choice == 1:
-            print('Bandpass filter between 0.1 and 45 Hz')
-            self.bPB        = self.proc.b_wholerange
-            self.aPB        = self.proc.a_wholerange
-        elif choice == 2:
-            print('Bandpass filter between 1 and 30 Hz')
-            self.bPB        = self.proc.b_sleep
-            self.aPB        = self.proc.a_sleep
-        elif choice == 3:
-            print('Bandpass filter between 4 and 8 Hz')
-            self.bPB        = self.proc.b_theta
-            self.aPB        = self.proc.a_theta
+        self.bpass          = int(choice)
+        self.set_display_filter(self.notch, self.proc.preset_bands[self.bpass],
+                                self.order)
+
+
+    def filt_order(self, order):
+        if order != self.order:
+            self.set_display_filter(self.notch, self.band, order)
+
+
+    def custom_notch(self, choice):
+
+        try:
+            notch           = float(choice)
+        except ValueError:
+            self.notch_title.setText("Set a number")
+            print("You have to chose a frequency in Hz")
+            return
+        self.set_display_filter(notch, self.band, self.order)
+
+
+    def custom_band(self, choice):
+        # Bands are entered as "low - high", "low -" (highpass) or "- high"
+        # (lowpass)
+        try:
+            low, high       = [float(f) if f.strip() else None
+                               for f in choice.split('-')]
+        except ValueError:
+            self.bandpass_title.setText("Set a band: low - high")
+            print("You have to chose a band as low - high (Hz)")
+            return
+        self.set_display_filter(self.notch, (low, high), self.order)
+
+
+    def set_display_filter(self, notch, band, order, sender=None):
+        # =================================================================
+        # Designs the filter in the background (see
+        # Processing.request_filter_chain()), the display keeps the one in
+        # use until apply_display_filter() finds the new one done
+        # Input:
+        #   notch, band, order  See Processing.resolve_filter()
+        #   sender              Address of the control channel client that
+        #                       asked for it, None for the GUI
+        # =================================================================
+        try:
+            notch, band, order = self.proc.resolve_filter(notch, band, order)
+        except (ValueError, TypeError) as e:
+            print('Filter not changed: {}'.format(e))
+            if sender is None:
+                self.bandpass_title.setText("Filter not possible")
+            else:
+                self.control.reply(sender, {"error": str(e)})
+            return
+
+        self.notch          = notch
+        self.band           = band
+        self.order          = order
+        self.bandpass_title.setText('Bandpass (Hz)')
+        self.notch_title.setText('Notch filter (Hz)')
+        print('Display filter: {}'.format(describe_filter(notch, band, order)))
+
+        # A newer request replaces the pending one, whose senders are
+        # answered with the setting they ended up with
+        senders             = [] if self.pending_filter is None else self.pending_filter[1]
+        if sender is not None:
+            senders         = senders + [sender]
+        self.pending_filter = [self.proc.request_filter_chain(notch, band, order),
+                               senders]
+
+
+    def apply_display_filter(self):
+        # Called at every plot update: takes commands of the control
+        # channel and switches to a filter once it is designed
+        if self.control is not None:
+            for command, sender in self.control.poll():
+                self.set_display_filter(command.get("notch", self.notch),
+                    command.get("band", self.band),
+                    command.get("order", self.order), sender)
+
+        if self.pending_filter is None or not self.pending_filter[0].done():
+            return
+        future, senders     = self.pending_filter
+        self.pending_filter = None
+        if self.display_filter is not None:
+            self.display_filter.set_filters(future.result())
+
+        self.show_notch()
+        self.show_band()
+        for sender in senders:
+            self.control.reply(sender, {"notch": self.notch,
+                "band": None if self.band is None else list(self.band),
+                "order": self.order})
+
+
+    def update_filters(self):
+        # The display filter starts over with notch and bandpass cascaded
+        # into one chain of second-order sections, designed right away
+        if self.display_filter is not None:
+            self.display_filter.set_filters(
+                self.proc.filter_chain(self.notch, self.band, self.order))
+
+
+    def show_notch(self):
+        # Checks the radio button of the notch in use
+        if self.notch in self.notch_buttons:
+            self.notch_buttons[self.notch].setChecked(True)
+            self.notch_input.setDisabled(True)
+        else:
+            self.notch_buttons['custom'].setChecked(True)
+            self.notch_input.setEnabled(True)
+        self.notch_input.setText('{:g}'.format(self.notch))
+
+
+    def show_band(self):
+        # Checks the radio button of the band in use
+        presets             = [bpass for bpass, band in self.proc.preset_bands.items()
+                               if band == self.band]
+        if len(presets) > 0:
+            self.bpass      = presets[0]
+            self.band_buttons[self.bpass].setChecked(True)
+            self.band_input.setDisabled(True)
+        else:
+            self.bpass      = None # No preset
+            self.band_buttons['custom'].setChecked(True)
+            self.band_input.setEnabled(True)
+        self.band_input.setText(format_band(self.band))
+        if self.order_input.value() != self.order:
+            self.order_input.blockSignals(True) # Not a change of the user
+            self.order_input.setValue(self.order)
+            self.order_input.blockSignals(False)
 
 
     def yrange_selection(self, choice, title, custom_input):
@@ -514,9 +624,12 @@ The raw data is available at {}:{}""".format(udp_ip, udp_port))
         if choice == True:
             print('Enabled envelope displaying')
             self.envelope = True
+            self.display_filter.set_envelope(
+                self.proc.streaming_envelope(self.display_filter.filtered.num_chans))
         elif choice == False:
             print('Disabled envelope displaying')
             self.envelope = False
+            self.display_filter.set_envelope(None)
 
 
     def streamstate(self):
@@ -647,4 +760,28 @@ The raw data is available at {}:{}""".format(udp_ip, udp_port))
 
         for iChan in range(self.numchans):
             self.signalgraph[iChan].setBackground((53, 53, 53,0))
-            self.penstyle[iChan] = pg.mkPen(color=(222,235,247), width=2)
\ No newline at end of file
+            self.penstyle[iChan] = pg.mkPen(color=(222,235,247), width=2)
+
+
+def format_band(band):
+    # Band as entered in the custom input of the bandpass ("8 - 12")
+    if band is None:
+        return ''
+    return ' - '.join(['' if f is None else '{:g}'.format(f) for f in band]).strip()
+
+
+def describe_filter(notch, band, order):
+
+    if notch == 0:
+        stopband            = 'no notch'
+    else:
+        stopband            = '{:g} Hz notch'.format(notch)
+    if band is None:
+        passband            = 'raw signal'
+    elif band[0] is None:
+        passband            = 'lowpass below {:g} Hz'.format(band[1])
+    elif band[1] is None:
+        passband            = 'highpass from {:g} Hz'.format(band[0])
+    else:
+        passband            = 'bandpass between {:g} and {:g} Hz'.format(*band)
+    return '{}, {} (order {})'.format(stopband, passband, order)
@@ -3,26 +3,44 @@
 # Necessary step for relative imports when the GUI is run directly in an 
 # IDE instead of as module
 if ( __package__ == "" or __package__ == None ):
-    from backend.signal_processing              import Processing
-    from backend.configure_board                import ConfigureBoard
-    from backend.signal_sampling                import Sampling
-    from backend.parameter_validation           import ParamVal
-    from frontend.widgets                       import GUIWidgets
-    from frontend.user_experience               import Aux
-    from frontend.parameters                    import Parameters
+    from startup_profile                        import profile
 else:
-    from .backend.signal_processing             import Processing
-    from .backend.configure_board               import ConfigureBoard
-    from .backend.signal_sampling               import Sampling
-    from .backend.parameter_validation          import ParamVal
-    from .frontend.widgets                      import GUIWidgets
-    from .frontend.user_experience              import Aux
-    from .frontend.parameters                   import Parameters
-
-from multiprocessing                            import Process, Array, Value
-from PyQt5                                      import QtCore, QtWidgets
-from numpy                                      import zeros
-from time                                       import sleep
+    from .startup_profile                       import profile
+
+# Only what the settings window and the acquisition need is imported here.
+# The filters (scipy) load in the background while the user is busy with
+# the settings window, the plots (pyqtgraph) once it is closed
+with profile.phase('import backend'):
+    if ( __package__ == "" or __package__ == None ):
+        from backend.configure_board            import ConfigureBoard
+        from backend.signal_sampling            import Sampling
+        from backend.shared_transport           import SharedTransport
+        from backend.metrics                    import MetricsRegistry
+        from backend.parameter_validation       import ParamVal
+        from backend.settings                   import StreamingParameter
+        from backend.control_channel            import ControlChannel
+    else:
+        from .backend.configure_board           import ConfigureBoard
+        from .backend.signal_sampling           import Sampling
+        from .backend.shared_transport          import SharedTransport
+        from .backend.metrics                   import MetricsRegistry
+        from .backend.parameter_validation      import ParamVal
+        from .backend.settings                  import StreamingParameter
+        from .backend.control_channel           import ControlChannel
+
+profile.preload('scipy.signal')
+
+with profile.phase('import settings window'):
+    if ( __package__ == "" or __package__ == None ):
+        from frontend.parameters                import Parameters
+    else:
+        from .frontend.parameters               import Parameters
+
+with profile.phase('import PyQt5'):
+    from PyQt5                                  import QtCore, QtWidgets
+
+from multiprocessing                            import Process, Value
+from time                                       import perf_counter
 import sys  # We need sys so that we can pass argv to QApplication
 
 
@@ -37,12 +55,22 @@ class MainWindow(QtWidgets.QMainWindow):
         pm                  = Parameters()
         ParamVal(pm)        # Sanity checks
 
+        with profile.phase('import filters and plots'):
+            if ( __package__ == "" or __package__ == None ):
+                from backend.signal_processing  import Processing
+                from frontend.widgets           import GUIWidgets
+            else:
+                from .backend.signal_processing import Processing
+                from .frontend.widgets          import GUIWidgets
+
         # Initialize filter coefficient arrays
         # -----------------------------------------------------------------
-        proc                = Processing(pm)
+        with profile.phase('filter design'):
+            proc            = Processing(pm)
 
         # Splash screen
         # -----------------------------------------------------------------
+        # from .frontend.user_experience import Aux
         # auxgui              = Aux()
         # splash, pb          = auxgui.disp_splash()
         # auxgui.report_progress(splash, pb, 5)
@@ -50,6 +78,7 @@ class MainWindow(QtWidgets.QMainWindow):
         # Load methods and build communication with EEG board
         # -----------------------------------------------------------------
         # auxgui.report_progress(splash, pb, 5)
+        t_phase             = perf_counter()
         confboard           = ConfigureBoard(pm)  # Board communication
         # auxgui.report_progress(splash, pb, 20)
         sampl               = Sampling(pm)        # Signal handling
@@ -57,12 +86,12 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # Generate variable exchange variables (shared memory allocations)
         # -----------------------------------------------------------------
-        shared_buffer                   = Array(
-            'd', zeros(( 
-                (pm.buffer_length + pm.buffer_add) * pm.sample_rate * pm.max_chans
-                )), lock = True)
-        shared_timestamp                = Value('i', 0)
+        # The sampling process writes new samples straight into a shared
+        # ring buffer, the frontend takes lock-free snapshots of it
+        self.shared_transport           = SharedTransport(sampl.num_chans,
+            (pm.buffer_length + pm.buffer_add) * pm.sample_rate)
         self.gui_running                = Value('i', 1)
+        self.metrics                    = MetricsRegistry()
 
         # Generate separate processes to not slow down sampling by any
         # other executions
@@ -75,12 +104,32 @@ class MainWindow(QtWidgets.QMainWindow):
             pm.start_code, pm.max_chans, pm.buffer_add, pm.buffer_length,
             pm.sample_rate, pm.PGA, pm.saving_interval, pm.udp_ip,
             pm.udp_port, pm.board)
+
+        # Every additional device gets an acquisition process of its own,
+        # its samples are merged into the stream of the board above
+        self.devices     = []
+        for port, board, num_chans in pm.additional_devices:
+            start_code, sample_rate, baud_rate = pm.board_characteristics[board]
+            confdevice      = ConfigureBoard(pm, port, baud_rate)
+            transport       = SharedTransport(num_chans, 5 * sample_rate)
+            devpm           = StreamingParameter(
+                start_code, num_chans, pm.buffer_add, pm.buffer_length,
+                sample_rate, pm.PGA, pm.saving_interval, pm.udp_ip,
+                pm.udp_port, board)
+            process         = Process(target=sampl.acquire_device,
+                args=(confdevice.ser, devpm, transport, self.gui_running))
+            self.devices.append((process, transport))
+
         self.sampling    = Process(target=sampl.fetch_sample,
             args=(confboard.ser, pm.send_sock, strpm,
-                  shared_buffer, shared_timestamp, self.gui_running))
+                  self.shared_transport, self.gui_running, self.metrics,
+                  [transport for _, transport in self.devices]))
+
+        profile.record('acquisition setup', perf_counter() - t_phase)
 
         # Build GUI
         # -----------------------------------------------------------------
+        t_phase             = perf_counter()
         super(MainWindow, self).__init__(*args, **kwargs)
         
         # This following line causes and X11 error on GNU/Linux (tried with
@@ -88,9 +137,14 @@ class MainWindow(QtWidgets.QMainWindow):
         # self.setWindowIcon(QtGui.QIcon(pm.img_helment))
         
         guiwidgets          = GUIWidgets(self, proc, pm)
-        # Inherit processing functions that will be used during plot update
-        guiwidgets.prepare_buffer   = proc.prepare_buffer
-        guiwidgets.extract_envelope = proc.extract_envelope
+        guiwidgets.metrics          = self.metrics
+        guiwidgets.display_filter   = proc.streaming_filter(self.shared_transport)
+        guiwidgets.update_filters()
+        # Clients may change the display filter at runtime
+        self.control        = None
+        if pm.control_address:
+            self.control    = ControlChannel(pm.control_address)
+        guiwidgets.control  = self.control
         
         self.central_widget = QtWidgets.QWidget() # A QWidget to work as Central Widget
 
@@ -142,7 +196,7 @@ class MainWindow(QtWidgets.QMainWindow):
             self.central_widget.setLayout(vertlayout) # Draw elements in main widget
 
             # Prepare buffer-emptying function
-            self.timer.timeout.connect(lambda: sampl.headless_sampling(shared_buffer, shared_timestamp))
+            self.timer.timeout.connect(lambda: sampl.headless_sampling(self.shared_transport))
 
         else:
             
@@ -164,7 +218,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 pm.s_down, int(pm.sample_rate * pm.buffer_add),
                 pm.sample_rate,
                 range(0, int(pm.sample_rate * pm.buffer_length), pm.s_down), pm.max_chans,
-                [i for i in range(pm.max_chans) if pm.selected_chans[i]], shared_buffer, shared_timestamp))
+                [i for i in range(pm.max_chans) if pm.selected_chans[i]]))
 
         # Splash screen needs to be closed before timer start
         # auxgui.report_progress(splash, pb, 19)
@@ -173,52 +227,49 @@ class MainWindow(QtWidgets.QMainWindow):
         # Start sampling processes
         # -----------------------------------------------------------------
         if pm.start_code == 2 or pm.start_code == 3:
+            for process, _ in self.devices:
+                process.start()
             self.sampling.start()
         self.timer.start()
+        profile.record('main window', perf_counter() - t_phase)
         
 
     def on_closing(self):
         self.gui_running.value = 0
-        sleep(2) # A second longer than the sampling thread
+        # Leave time to the sampling process to flush the recording
+        self.sampling.join(5)
         self.timer.stop()
-        self.sampling.terminate()
-
-
-class StreamingParameter(object):
-    firmfeedback    = 0
-    max_chans       = 0
-    buffer_add      = 0
-    buffer_length   = 0
-    sample_rate     = 0
-    PGA             = 0
-    saving_interval = 0
-    udp_ip          = ""
-    udp_port        = 0
-    board           = ""
-
-    # The class "constructor" - It's actually an initializer 
-    def __init__(self, start_code, max_chans, buffer_add, buffer_length,
-                 sample_rate, PGA, saving_interval, udp_ip, udp_port,
-                 board):
-        self.start_code     = start_code
-        self.max_chans      = max_chans
-        self.buffer_add     = buffer_add
-        self.buffer_length  = buffer_length
-        self.sample_rate    = sample_rate
-        self.PGA            = PGA
-        self.saving_interval= saving_interval
-        self.udp_ip         = udp_ip
-        self.udp_port       = udp_port
-        self.board          = board
+        if self.sampling.is_alive():
+            self.sampling.terminate()
+        self.shared_transport.close()
+        self.metrics.close()
+        if self.control is not None:
+            self.control.close()
+        for process, transport in self.devices:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+            transport.close()
 
 
 class Run():
 
-    def __init__(self):
-
-        app                     = QtWidgets.QApplication(sys.argv)
+    def __init__(self, profile_startup=False):
+        # =================================================================
+        # Input
+        #   profile_startup Boolean. Prints how long the imports and the
+        #                   setup took once the window is shown (also
+        #                   enabled by --profile-startup)
+        # =================================================================
+        profile.enabled         = profile.enabled or profile_startup
+
+        with profile.phase('QApplication'):
+            app                 = QtWidgets.QApplication(sys.argv)
         maingui                 = MainWindow()  # Contains all necessary bits
-        maingui.show()
+        with profile.phase('show'):
+            maingui.show()
+            app.processEvents()
+        profile.report()
         app.exec_()
         maingui.on_closing()
         if ( __package__ == "" or __package__ == None ):
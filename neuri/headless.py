@@ -0,0 +1,215 @@
+# Headless acquisition daemon: samples, records and relays without loading
+# any GUI toolkit (Qt, Tk, customtkinter), e.g. on a server or a single-board
+# computer. Settings come from the configuration file written by the
+# settings window (see README.md), the process stops cleanly on SIGINT or
+# SIGTERM.
+#
+#   python -m neuri --headless --config settings.cfg
+
+# Necessary step for relative imports when the daemon is run directly in an
+# IDE instead of as module
+if ( __package__ == "" or __package__ == None ):
+    from startup_profile                        import profile
+else:
+    from .startup_profile                       import profile
+
+with profile.phase('import backend'):
+    if ( __package__ == "" or __package__ == None ):
+        from backend.settings                   import Settings, StreamingParameter
+        from backend.parameter_validation       import ParamVal
+        from backend.configure_board            import ConfigureBoard
+        from backend.signal_sampling            import Sampling
+        from backend.shared_transport           import SharedTransport
+        from backend.metrics                    import MetricsRegistry
+    else:
+        from .backend.settings                  import Settings, StreamingParameter
+        from .backend.parameter_validation      import ParamVal
+        from .backend.configure_board           import ConfigureBoard
+        from .backend.signal_sampling           import Sampling
+        from .backend.shared_transport          import SharedTransport
+        from .backend.metrics                   import MetricsRegistry
+
+from multiprocessing                            import Process, Value
+from time                                       import perf_counter
+import traceback
+import argparse
+import os
+import signal
+import sys
+
+
+# Exit status of the daemon
+EXIT_OK             = 0 # Stopped by a signal after flushing the recording
+EXIT_RUNTIME_ERROR  = 1 # Acquisition failed (board, port, recording, ...)
+EXIT_CONFIG_ERROR   = 2 # Configuration file missing or invalid
+
+
+class HeadlessDaemon():
+
+    def __init__(self, conf_file):
+        # =================================================================
+        # Input
+        #   conf_file       Path of the configuration file
+        # =================================================================
+        self.conf_file      = conf_file
+        self.gui_running    = Value('i', 1) # Same flag as the GUI uses
+        self.devices        = []
+        self.shared_transport = None
+        self.metrics        = None
+
+
+    def configure(self):
+        # =================================================================
+        # Output:
+        #   errors              List of strings, empty when the settings
+        #                       can be used
+        # =================================================================
+        if not os.path.exists(self.conf_file):
+            return ['Configuration file "{}" not found. Save one from the '
+                    'settings window first.'.format(self.conf_file)]
+
+        self.pm             = Settings(self.conf_file)
+        self.pm.run_headless= True # Nothing to display
+
+        errors              = ParamVal(self.pm, alert=False).error_messages
+        if self.pm.board not in self.pm.board_characteristics:
+            errors.append('Unknown board "{}". Chose one of: {}.'.format(
+                self.pm.board, ', '.join(self.pm.board_characteristics.keys())))
+        if self.pm.start_code not in [2, 3]:
+            errors.append('Start code {} does not start any transmission.'.format(
+                self.pm.start_code))
+        return errors
+
+
+    def run(self):
+        # =================================================================
+        # Output:
+        #   status              Exit status (EXIT_OK or EXIT_RUNTIME_ERROR)
+        # =================================================================
+        pm                  = self.pm
+
+        try:
+            t_setup             = perf_counter()
+            confboard           = ConfigureBoard(pm)  # Board communication
+            sampl               = Sampling(pm)        # Signal handling
+
+            # Nobody reads the shared buffer, it only has to hold what the
+            # sampling loop writes out at every saving interval
+            self.shared_transport = SharedTransport(sampl.num_chans,
+                (pm.buffer_length + pm.buffer_add) * pm.sample_rate)
+            self.metrics        = MetricsRegistry()
+
+            strpm               = StreamingParameter(
+                pm.start_code, pm.max_chans, pm.buffer_add, pm.buffer_length,
+                pm.sample_rate, pm.PGA, pm.saving_interval, pm.udp_ip,
+                pm.udp_port, pm.board)
+
+            for port, board, num_chans in pm.additional_devices:
+                start_code, sample_rate, baud_rate = pm.board_characteristics[board]
+                confdevice      = ConfigureBoard(pm, port, baud_rate)
+                transport       = SharedTransport(num_chans, 5 * sample_rate)
+                devpm           = StreamingParameter(
+                    start_code, num_chans, pm.buffer_add, pm.buffer_length,
+                    sample_rate, pm.PGA, pm.saving_interval, pm.udp_ip,
+                    pm.udp_port, board)
+                process         = Process(target=sampl.acquire_device,
+                    args=(confdevice.ser, devpm, transport, self.gui_running))
+                self.devices.append((process, transport))
+
+            # The device processes leave the signals to this process, which
+            # stops all of them through gui_running
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            for process, _ in self.devices:
+                process.start()
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+            profile.record('acquisition setup', perf_counter() - t_setup)
+            profile.report()
+
+            print('Headless sampling of {} channels at {} Hz, recording to "{}", '
+                  'relay at {}:{}'.format(sampl.num_chans, pm.sample_rate,
+                                          sampl.output_file, pm.udp_ip, pm.udp_port))
+
+            # No frontend to keep responsive: the sampling loop runs in this
+            # process and returns once a signal cleared gui_running
+            sampl.fetch_sample(confboard.ser, pm.send_sock, strpm,
+                self.shared_transport, self.gui_running, self.metrics,
+                [transport for _, transport in self.devices])
+
+        except Exception:
+            traceback.print_exc()
+            return EXIT_RUNTIME_ERROR
+        finally:
+            self.cleanup()
+
+        for process, _ in self.devices:
+            if process.exitcode != 0:
+                print('Acquisition of an additional device failed (exit code {})'.format(
+                    process.exitcode))
+                return EXIT_RUNTIME_ERROR
+        return EXIT_OK
+
+
+    def stop(self, signum, frame):
+
+        print('Received {}, stopping ...'.format(signal.Signals(signum).name))
+        self.gui_running.value = 0
+        # A second signal ends the daemon without waiting for the flush
+        signal.signal(signum, signal.SIG_DFL)
+
+
+    def cleanup(self):
+
+        self.gui_running.value = 0
+        for process, transport in self.devices:
+            if process.pid is not None: # Started
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
+            transport.close()
+        if self.shared_transport is not None:
+            self.shared_transport.close()
+        if self.metrics is not None:
+            self.metrics.close()
+
+
+def main(argv=None):
+    # =====================================================================
+    # Input:
+    #   argv                List of strings (defaults to sys.argv[1:])
+    # Output:
+    #   status              Exit status (EXIT_OK, EXIT_RUNTIME_ERROR or
+    #                       EXIT_CONFIG_ERROR)
+    # =====================================================================
+    parser              = argparse.ArgumentParser(prog='python -m neuri',
+        description="Headless acquisition: sample, record and relay "
+                    "without any graphical interface")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without any GUI toolkit")
+    parser.add_argument("--config", default="settings.cfg",
+                        help="configuration file (default: settings.cfg)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long the imports and the setup took")
+    args                = parser.parse_args(argv)
+
+    profile.enabled     = profile.enabled or args.profile_startup
+
+    daemon              = HeadlessDaemon(args.config)
+    try:
+        with profile.phase('settings file'):
+            errors      = daemon.configure()
+    except Exception:
+        traceback.print_exc()
+        return EXIT_CONFIG_ERROR
+    if len(errors) > 0:
+        for i, error in enumerate(errors):
+            print('{}: {}'.format(i + 1, error), file=sys.stderr)
+        return EXIT_CONFIG_ERROR
+
+    return daemon.run()
+
+
+if __name__ == '__main__': # If run from IDEs instead of as module
+    sys.exit(main())
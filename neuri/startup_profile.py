@@ -0,0 +1,87 @@
+from contextlib                         import contextmanager
+from importlib                          import import_module
+from threading                          import Thread, Lock
+from time                               import perf_counter
+import sys
+
+
+class StartupProfile():
+
+    def __init__(self, enabled=False):
+        # =================================================================
+        # Durations of the phases of a start (imports, windows, setup of
+        # the acquisition), reported with --profile-startup. Phases are
+        # always timed, which costs next to nothing; report() only prints
+        # when profiling was asked for.
+        # Input
+        #   enabled         Boolean (print the report)
+        # =================================================================
+        self.enabled        = enabled
+        self.start          = perf_counter()
+        self.phases         = [] # [name, seconds, kind]
+        self.lock           = Lock()
+
+
+    @contextmanager
+    def phase(self, name, kind=''):
+        # =================================================================
+        # Input:
+        #   name                Name of the phase (str)
+        #   kind                '' for the start itself, 'background' for
+        #                       preloads running in parallel and 'user' for
+        #                       time spent waiting for the user (left out
+        #                       of the total)
+        # =================================================================
+        t_start             = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - t_start, kind)
+
+
+    def record(self, name, duration, kind=''):
+
+        with self.lock:
+            self.phases.append([name, duration, kind])
+
+
+    def preload(self, module, package=None):
+        # =================================================================
+        # Imports a module in a background thread, e.g. while the user is
+        # busy with the settings window. A later import of the module
+        # waits for this one to finish instead of importing it twice.
+        # Input
+        #   module          Name of the module (str)
+        #   package         Package relative names are resolved against
+        # =================================================================
+        def load():
+            t_start         = perf_counter()
+            try:
+                import_module(module, package)
+            except ImportError:
+                return # Reported by the import that actually needs it
+            self.record(module, perf_counter() - t_start, 'background')
+
+        Thread(target=load, daemon=True).start()
+
+
+    def report(self):
+
+        if not self.enabled:
+            return
+
+        with self.lock:
+            phases          = list(self.phases)
+        width               = max([len(name) for name, _, _ in phases] + [5])
+        waiting             = sum(d for _, d, kind in phases if kind == 'user')
+        print('Startup profile (ms)')
+        for name, duration, kind in phases:
+            print('  {}  {:8.1f}{}'.format(name.ljust(width), duration * 1000,
+                  '  ({})'.format(kind) if kind else ''))
+        # Wall time since the first import, without waiting for the user
+        print('  {}  {:8.1f}'.format('Total'.ljust(width),
+              (perf_counter() - self.start - waiting) * 1000))
+
+
+# One profile per process, timed from the first import of this module
+profile             = StartupProfile('--profile-startup' in sys.argv[1:])
@@ -0,0 +1,46 @@
+from numpy import arange, concatenate, array_equal
+from numpy.random                       import default_rng
+import pytest
+
+from neuri.backend.chunked_recording    import ChunkedRecording, ChunkedRecordingReader
+
+
+SAMPLE_RATE         = 250
+PGA                 = 24
+
+
+@pytest.mark.parametrize('boards', [[(0, 8)], [(1, 1)], [(0, 4), (1, 1)], [(1, 1), (0, 2)]])
+def test_round_trip(tmp_path, boards):
+    # Every channel is restored exactly like the process of its board
+    # converted it, also when boards are merged
+    rng                 = default_rng(0)
+    num_samples         = 3 * SAMPLE_RATE
+    data, divisors      = [], []
+    for board_code, num_chans in boards:
+        divisor         = None if board_code == 1 else PGA*8388607.0 # Sampling.voltage_divisor()
+        if board_code == 0:
+            counts      = rng.integers(-2**23 + 1, 2**23, (num_chans, num_samples))
+            data.append((4.5*counts)/divisor * 1000000)
+        else: # Readings of the EXG Pill
+            data.append(rng.integers(-512, 512, (num_chans, num_samples)).astype(float))
+        divisors       += [divisor] * num_chans
+    eeg_data            = concatenate(data)
+    time_stamps         = arange(num_samples) * 1000 / SAMPLE_RATE
+
+    file_name           = str(tmp_path / 'session.nchk')
+    recording           = ChunkedRecording(file_name, len(divisors), SAMPLE_RATE,
+                                           PGA, 'Test board', divisors, 1)
+    recording.create()
+    recording.open()
+    for start in range(0, num_samples, 40):
+        recording.write_block(eeg_data[:, start:start + 40], time_stamps[start:start + 40])
+    recording.close()
+
+    restored, restored_times = ChunkedRecordingReader(file_name).read()
+    assert array_equal(restored_times, time_stamps)
+    assert array_equal(restored, eeg_data)
+
+
+def test_divisors_per_channel():
+    with pytest.raises(ValueError):
+        ChunkedRecording('unused.nchk', 3, SAMPLE_RATE, PGA, 'Test board', [None] * 2)
@@ -0,0 +1,99 @@
+from numpy import arange, zeros, frombuffer, uint8, int32, concatenate, abs as np_abs
+from numpy.random                       import default_rng
+import pytest
+
+from neuri.backend.edf_recording        import EdfRecording
+
+
+SAMPLE_RATE         = 250
+PGA                 = 24
+
+
+def read_edf(file_name):
+    # Physical values of the channels (the annotations signal left out)
+    with open(file_name, 'rb') as file:
+        content         = file.read()
+    ns                  = int(content[252:256])
+    header_bytes        = int(content[184:192])
+    num_records         = int(content[236:244])
+    bits                = 24 if content[:1] == b'\xff' else 16
+
+    def fields(offset, length):
+        start           = 256 + offset * ns
+        return [content[start + i*length:start + (i+1)*length].strip()
+                for i in range(ns)]
+
+    physical_min        = [float(v) for v in fields(16 + 80 + 8, 8)]
+    physical_max        = [float(v) for v in fields(16 + 80 + 16, 8)]
+    digital_min         = [int(v) for v in fields(16 + 80 + 24, 8)]
+    digital_max         = [int(v) for v in fields(16 + 80 + 32, 8)]
+    record_samples      = [int(v) for v in fields(16 + 80 + 40 + 80, 8)]
+
+    values              = frombuffer(content[header_bytes:], dtype=uint8)
+    if bits == 16:
+        digital         = values.view('<i2').astype(int32)
+    else:
+        triples         = values.reshape(-1, 3).astype(int32)
+        digital         = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+        digital         = (digital ^ 0x800000) - 0x800000
+    digital             = digital.reshape(num_records, sum(record_samples))
+
+    channels            = []
+    start               = 0
+    for iC in range(ns - 1):
+        d               = digital[:, start:start + record_samples[iC]].reshape(-1)
+        gain            = ((physical_max[iC] - physical_min[iC]) /
+                           (digital_max[iC] - digital_min[iC]))
+        channels.append(physical_min[iC] + (d - digital_min[iC]) * gain)
+        start          += record_samples[iC]
+    return channels, [(physical_max[iC] - physical_min[iC]) /
+                      (digital_max[iC] - digital_min[iC]) for iC in range(ns - 1)]
+
+
+def board_signals(boards, num_samples):
+    # Values as the sampling loop hands them to the writer
+    rng                 = default_rng(0)
+    data, divisors      = [], []
+    for board_code, num_chans in boards:
+        divisor         = None if board_code == 1 else PGA*8388607.0 # Sampling.voltage_divisor()
+        if board_code == 0:
+            counts      = rng.integers(-2**20, 2**20, (num_chans, num_samples))
+            data.append((4.5*counts)/divisor * 1000000)
+        else: # Filtered readings of the EXG Pill, as sent with 4 decimals
+            data.append((rng.normal(0, 50, (num_chans, num_samples)) * 10000).round() / 10000)
+        divisors       += [divisor] * num_chans
+    return concatenate(data), divisors
+
+
+@pytest.mark.parametrize('bits', [16, 24])
+@pytest.mark.parametrize('boards', [[(0, 8)], [(1, 1)], [(0, 4), (1, 1)], [(1, 1), (0, 2)]])
+def test_round_trip(tmp_path, bits, boards):
+    num_samples         = int(2.5 * SAMPLE_RATE) # Last record is padded
+    eeg_data, divisors  = board_signals(boards, num_samples)
+    file_name           = str(tmp_path / 'session.edf')
+
+    recording           = EdfRecording(file_name, len(divisors), SAMPLE_RATE,
+                                       'Test board', divisors, 1, bits)
+    recording.create()
+    recording.open()
+    for start in range(0, num_samples, 40):
+        block           = eeg_data[:, start:start + 40]
+        recording.write_block(block, arange(block.shape[1]), zeros(block.shape[1], dtype=uint8))
+    recording.close()
+
+    channels, gains     = read_edf(file_name)
+    assert len(channels) == len(divisors)
+    for iC, divisor in enumerate(divisors):
+        error           = np_abs(channels[iC][:num_samples] - eeg_data[iC]).max()
+        assert error <= gains[iC] / 2 * 1.0001
+        if divisor is None:
+            # Steps of the EXG Pill channels stay below one unit
+            assert gains[iC] < 1
+        elif bits == 24:
+            # BDF keeps every count of the Neuri boards
+            assert gains[iC] <= 4.5 * 1000000 / divisor * 1.0001
+
+
+def test_divisors_per_channel():
+    with pytest.raises(ValueError):
+        EdfRecording('unused.edf', 3, SAMPLE_RATE, 'Test board', [None] * 2)
@@ -0,0 +1,89 @@
+from numpy import arange, empty
+from numpy.random                       import default_rng
+import pytest
+
+from neuri.backend.clock_sync           import SampleClock, LossDetector
+
+
+SAMPLE_RATE         = 200
+PERIOD              = 1000 / SAMPLE_RATE
+
+
+def acquire(lost, batch_size, jitter, seed, spikes=0.0, duration=20):
+    # =====================================================================
+    # Sampling loop of the text protocol with samples whose messages never
+    # arrived. The value of every sample is its true index
+    # Output:
+    #   filled              List of (position in the stream, amount of
+    #                       samples put in before it)
+    #   misplaced           List of the samples that are not at their
+    #                       true index
+    # =====================================================================
+    rng                 = default_rng(seed)
+    clock               = SampleClock(SAMPLE_RATE)
+    detector            = LossDetector(clock, 1)
+    filled, misplaced   = [], []
+    position            = 0
+    for start in range(0, duration * SAMPLE_RATE, batch_size):
+        indices         = arange(start, start + batch_size)
+        arrived         = indices[[index not in lost for index in indices]]
+        arrival_time    = ((indices[-1] + 1) * PERIOD * 1.00005 + 3 +
+                           abs(rng.normal(0, jitter)))
+        if rng.random() < spikes:
+            arrival_time += rng.uniform(20, 80) # Late, but nothing lost
+
+        samples, missing_before, arrival_time = detector.push(
+            arrived[None, :].astype(float), [0] * len(arrived), 0, arrival_time)
+        if samples.shape[1] == 0:
+            continue
+        for iS, num_missing in enumerate(missing_before):
+            if num_missing > 0:
+                filled.append((position, num_missing))
+            position   += num_missing + 1
+            if samples[0, iS] != position - 1:
+                misplaced.append(samples[0, iS])
+        clock.stamp(samples.shape[1] + sum(missing_before), arrival_time)
+    return filled, misplaced
+
+
+@pytest.mark.parametrize('num_lost', [1, 2, 100])
+@pytest.mark.parametrize('batch_size, jitter', [(1, 1.0), (10, 2.0)])
+def test_lost_samples(num_lost, batch_size, jitter):
+    for seed in range(5):
+        first_lost      = 2000 + 7 * seed
+        filled, misplaced = acquire(set(range(first_lost, first_lost + num_lost)),
+                                    batch_size, jitter, seed)
+        assert len(filled) == 1
+        position, num_missing = filled[0]
+        assert num_missing == num_lost
+        # Put in at the latest before the batch the first lost sample
+        # belonged to, so only the samples of that batch before the loss
+        # may be shifted
+        batch_start     = first_lost - first_lost % batch_size
+        assert batch_start <= position <= first_lost
+        assert all(batch_start <= value < first_lost for value in misplaced)
+
+
+@pytest.mark.parametrize('batch_size, jitter', [(1, 1.0), (10, 2.0)])
+def test_late_batches(batch_size, jitter):
+    # Delayed batches are no lost samples
+    for seed in range(5):
+        assert acquire(set(), batch_size, jitter, seed, spikes=0.02) == ([], [])
+
+
+def test_hold_back():
+    clock               = SampleClock(SAMPLE_RATE)
+    detector            = LossDetector(clock, 2, window=0.5)
+    samples, missing_before, arrival_time = detector.push(
+        empty((2, 10)), [0] * 10, 0, 0.0)
+    assert samples.shape == (2, 0) and missing_before == [] and arrival_time is None
+
+    # Unreadable messages are kept with the batch after them
+    detector.push(empty((2, 0)), [], 3, 50.0)
+    for iB in range(1, 11):
+        samples, missing_before, arrival_time = detector.push(
+            empty((2, 10)), [0] * 10, 0, iB * 50.0)
+    assert samples.shape == (2, 10) and arrival_time == 0.0
+    samples, missing_before, arrival_time = detector.push(
+        empty((2, 10)), [0] * 10, 0, 11 * 50.0)
+    assert missing_before[0] == 3 and arrival_time == 50.0
@@ -0,0 +1,26 @@
+from numpy.random                       import default_rng
+import pytest
+
+from neuri.backend.wire_protocol        import BinaryFrameDecoder, encode_frames, frame_length
+
+
+NUM_CHANS           = 8
+
+
+@pytest.mark.parametrize('num_corrupt', [0, 10])
+@pytest.mark.parametrize('sync_every', [None, 7, 2])
+def test_frames_rejected(num_corrupt, sync_every):
+    # Sync words inside the payloads are neither frames nor corrupt frames
+    counts              = default_rng(0).integers(0, 2**24, (NUM_CHANS, 5000))
+    if sync_every is not None:
+        counts[0, ::sync_every] = 0xA55A00
+        counts[3, ::sync_every] = 0x00A55A
+    data                = bytearray(encode_frames(counts))
+    for iF in range(num_corrupt):
+        data[(100 + 300 * iF) * frame_length(NUM_CHANS) + 10] ^= 0xFF
+
+    decoder             = BinaryFrameDecoder(NUM_CHANS)
+    for start in range(0, len(data), 517):
+        decoder.feed(bytes(data[start:start + 517]))
+    assert decoder.frames_decoded == 5000 - num_corrupt
+    assert decoder.frames_rejected == num_corrupt